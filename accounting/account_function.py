@@ -3,9 +3,15 @@ from dotenv import load_dotenv
 from flask import request, jsonify
 from datetime import datetime
 from mongoDB import get_accounting, get_AccountHistory
+from db_indexes import register_index, register_query
 
 load_dotenv()
 
+register_index("AccountHistory", [("account_code", 1), ("timestamp", 1)])   # 記帳歷史查詢
+register_index("Accounting", "second_grade.third_grade.fourth_grade.account_code")   # 依科目代碼找科目
+register_query("account history", "AccountHistory", {"account_code": "1111", "timestamp": {"$gte": datetime(2025, 1, 1)}})
+register_query("account by code", "Accounting", {"second_grade.third_grade.fourth_grade.account_code": "1111"})
+
 #查看寫入的紀錄
 def get_history():
     try:
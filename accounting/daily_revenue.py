@@ -0,0 +1,145 @@
+import sys
+from datetime import datetime, time, timedelta
+from mongoDB import get_daily_revenue_collection, get_order_collection
+
+"""
+每日營收彙總（DailyRevenue）
+- 訂單狀態改為 completed / canceled 時以 $inc 累加到當天的彙總文件
+- 報表讀取 O(天數) 筆彙總文件，不必掃描所有訂單
+- 可執行 python -m accounting.daily_revenue backfill 由歷史訂單重建（寫到暫存集合後原子替換，見 rebuild_daily_revenue）
+
+文件格式：
+{
+    "_id": "2025-01-31",
+    "date": datetime(2025, 1, 31),
+    "gross": 原價合計,
+    "discount": 折扣合計,
+    "final_price": 實收合計,
+    "count": 完成訂單數,
+    "canceled_count": 取消訂單數,
+    "payment_methods": {"cash": {"count": 0, "final_price": 0}, "online": {...}}
+}
+"""
+
+daily_revenue_collection = get_daily_revenue_collection()
+
+REBUILD_ATTEMPTS = 3
+REBUILD_SLACK = timedelta(seconds=5)   # 訂單更新 updated_at 到 $inc 彙總之間的時間差
+
+
+def _day(when):
+    return datetime.combine(when.date(), time.min)
+
+
+def _completed_inc(order):
+    payment_method = order.get("payment_method") or "unknown"
+    final_price = int(order.get("final_price", 0) or 0)
+    return {
+        "gross": int(order.get("total_price", 0) or 0),
+        "discount": int(order.get("discount_amount", 0) or 0),
+        "final_price": final_price,
+        "count": 1,
+        f"payment_methods.{payment_method}.count": 1,
+        f"payment_methods.{payment_method}.final_price": final_price,
+    }
+
+
+def _inc(day, fields):
+    daily_revenue_collection.update_one(
+        {"_id": day.strftime("%Y-%m-%d")},
+        {"$inc": fields, "$setOnInsert": {"date": day}},
+        upsert=True
+    )
+
+
+def record_order_status(order, new_status, when):
+    """訂單狀態異動時更新每日彙總（order 為異動前的訂單資料）"""
+    old_status = order.get("status")
+    if old_status == new_status:
+        return
+
+    # 已取消的訂單改為完成時，扣回當初取消那天的取消數
+    if old_status == "canceled" and order.get("updated_at"):
+        _inc(_day(order["updated_at"]), {"canceled_count": -1})
+
+    if new_status == "completed":
+        _inc(_day(when), _completed_inc(order))
+    elif new_status == "canceled":
+        _inc(_day(when), {"canceled_count": 1})
+
+
+def get_daily_revenue(start_date, end_date):
+    """查詢區間內每天的彙總（依日期排序，_id 為 YYYY-MM-DD 可直接用 _id 索引）"""
+    return list(daily_revenue_collection.find(
+        {"_id": {"$gte": start_date.strftime("%Y-%m-%d"), "$lte": end_date.strftime("%Y-%m-%d")}}
+    ).sort("_id", 1))
+
+
+def _aggregate_rollups(order_collection):
+    """由 Orders 計算每一天的彙總文件"""
+    pipeline = [
+        {"$match": {"status": {"$in": ["completed", "canceled"]}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$updated_at"}},
+                "status": "$status",
+                "payment_method": {"$ifNull": ["$payment_method", "unknown"]},
+            },
+            "gross": {"$sum": "$total_price"},
+            "discount": {"$sum": "$discount_amount"},
+            "final_price": {"$sum": "$final_price"},
+            "count": {"$sum": 1},
+        }},
+    ]
+    rollups = {}
+    for row in order_collection.aggregate(pipeline, allowDiskUse=True):
+        day = row["_id"]["day"]
+        doc = rollups.setdefault(day, {
+            "_id": day,
+            "date": datetime.strptime(day, "%Y-%m-%d"),
+            "gross": 0, "discount": 0, "final_price": 0, "count": 0, "canceled_count": 0,
+            "payment_methods": {},
+        })
+        if row["_id"]["status"] == "canceled":
+            doc["canceled_count"] += row["count"]
+            continue
+        doc["gross"] += row["gross"]
+        doc["discount"] += row["discount"]
+        doc["final_price"] += row["final_price"]
+        doc["count"] += row["count"]
+        doc["payment_methods"][row["_id"]["payment_method"]] = {
+            "count": row["count"], "final_price": row["final_price"]
+        }
+    return list(rollups.values())
+
+
+def rebuild_daily_revenue():
+    """
+    由 Orders 重建全部每日彙總，回傳重建的天數
+    - 先寫到暫存集合，完成後以 rename(dropTarget=True) 原子替換，讀取端不會看到清空或只寫一半的彙總
+    - 重建期間若有訂單異動，$inc 會寫到即將被替換的舊集合（遺失）或在替換後重複累加，
+      因此替換前確認重建開始後沒有訂單更新，否則放棄這次結果重試；
+      訂單持續異動時會重試 REBUILD_ATTEMPTS 次後失敗，需暫停訂單狀態更新（例如營業時間外）再執行
+    """
+    order_collection = get_order_collection()
+    database = daily_revenue_collection.database
+    temp_name = f"{daily_revenue_collection.name}_rebuild"
+    for _ in range(REBUILD_ATTEMPTS):
+        started = datetime.now() - REBUILD_SLACK
+        rollups = _aggregate_rollups(order_collection)
+        database.drop_collection(temp_name)
+        temp_collection = database.create_collection(temp_name)
+        if rollups:
+            temp_collection.insert_many(rollups)
+        if order_collection.find_one({"updated_at": {"$gte": started}}, {"_id": 1}) is None:
+            temp_collection.rename(daily_revenue_collection.name, dropTarget=True)
+            return len(rollups)
+        database.drop_collection(temp_name)
+    raise RuntimeError("Orders were updated during every DailyRevenue rebuild attempt; pause order status updates and retry")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["backfill"]:
+        print(f"DailyRevenue rebuilt: {rebuild_daily_revenue()} days")
+    else:
+        print("usage: python -m accounting.daily_revenue backfill")
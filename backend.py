@@ -2,27 +2,36 @@ from datetime import datetime
 import json
 from bson import ObjectId # type: ignore
 from flask import Flask, Response, request, jsonify, send_file # type: ignore
-import os, re, time, subprocess, logging
+import io, os, re, time, subprocess, logging
 import requests # type: ignore
 from datetime import datetime, timezone, timedelta
 from flask_bcrypt import Bcrypt # type: ignore
 from config import jwt_config
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt # type: ignore
-from mongoDB import get_user_collection, user_find, create_date_id, get_revenues, get_expenses, insert_expense, del_all_coll, blacklisted_tokens_collection, backstage_user, get_user_collection # 從 mongoDB.py 導入
-from func import create_uuid, generate_trend_chart, export_to_excel, total, format_user_data
+from mongoDB import get_user_collection, find_user_by_email, create_date_id, get_expenses, iter_revenues, iter_expenses, aggregate_revenues, aggregate_expenses, insert_expense, del_all_coll, backstage_user, get_user_collection # 從 mongoDB.py 導入
+from token_revocation import token_revocation
+from db_indexes import register_index, register_query, apply_indexes
+import request_metrics, request_profiler
+from chart_renderer import chart_renderer
+from func import create_uuid, total, format_user_data
 from dotenv import load_dotenv # type: ignore
-from accounting.balance_sheet import balance_sheet,balance_sheet_save
-from accounting.cash_flow_statement import Cash_Flow_Statement, save_cash_flow_statement
-from accounting.income_statement import get_income_statement, save_income_statement
+from accounting.balance_sheet import balance_sheet,balance_sheet_save, save_balance_sheet_to_excel
+from accounting.cash_flow_statement import Cash_Flow_Statement, save_cash_flow_statement, save_to_excel
+from accounting.income_statement import get_income_statement, save_income_statement, save_income_statement_to_excel
 from accounting.account_function import get_history, add_entry, set_opening_balance
+from accounting.daily_revenue import get_daily_revenue
+from export_engine import export_report as stream_export_report, FORMATS as EXPORT_FORMATS
+from jobs.job_sys import register_job_type, job_accepted, submit_job_sys, get_job_sys, download_job_sys
 from menu.menu_sys import get_menu_sys, get_menu_item_sys, create_menu_item_sys, delete_menu_item_sys, update_menu_item_sys
-from order.order_sys import get_orders_sys, get_order_sys, update_order_sys, create_order_sys, delete_order_sys
+from order.order_sys import get_orders_sys, export_orders_sys, get_order_sys, update_order_sys, create_order_sys, delete_order_sys, get_order_qr_code_sys
+from points.points_sys import update_points_sys, get_points_ledger_sys
 from coupons.coupons_sys import create_coupon_sys, get_user_coupons_sys, delete_coupon_sys, get_all_coupons_sys, update_coupon_sys, get_coupon_sys, bind_coupon_sys, create_admin_coupon_sys
 from payment_api import payment_bp
 from line_api import line_bp
+from internal_api import internal_bp
 from flask_cors import CORS # type: ignore
-from waiting.waiting_system import take_queue, cancel_queue, call_specific_queue, auto_call_queue, get_queue_info
-from reservation.reservation_sys import set_reservation_slots_sys, add_reservation_sys, get_reservations_sys, cancel_reservation_sys, get_all_reservations_sys, get_today_reservations_sys, delete_reservation_sys, get_reservations_by_date_sys
+from waiting.waiting_system import take_queue, cancel_queue, call_specific_queue, auto_call_queue, seat_queue, get_queue_info, stream_queue_info
+from reservation.reservation_sys import set_reservation_slots_sys, export_reservations_sys, add_reservation_sys, get_reservations_sys, cancel_reservation_sys, get_all_reservations_sys, get_today_reservations_sys, delete_reservation_sys, get_reservations_by_date_sys, get_reservation_availability_sys
 
 # 載入 .env 檔案
 load_dotenv()
@@ -34,8 +43,19 @@ token = os.getenv('TOKEN')
 flask_secret_key = os.getenv('FLASK_SECRET_KEY')
 
 app = Flask(__name__)
+request_metrics.init_app(app)   # 各路由耗時、DB 指令次數統計
+request_profiler.init_app(app)   # X-Profile-Token 觸發的單一請求取樣分析
 CORS(app, resources={r"/*": {"origins": "*"}})
 collection=get_user_collection()
+
+# 會員、後台帳號、支出索引（其他子系統的索引在各自模組中登記）
+register_index("Users", "email", unique=True)   # 登入以 email 查詢
+register_index("BSusers", "username", unique=True)
+register_index("Expenses", "created_time")   # 報表依 created_time 查詢支出
+register_query("login by email", "Users", {"email": "user@example.com"})
+register_query("backstage login", "BSusers", {"username": "admin"})
+register_query("report expenses", "Expenses", {"created_time": {"$gte": datetime(2025, 1, 1), "$lte": datetime(2025, 2, 1)}})
+apply_indexes()   # 建立所有登記的索引（已存在則略過）
 bcrypt=Bcrypt(app)
 app.config.from_object(jwt_config)
 jwt = JWTManager(app)
@@ -51,6 +71,7 @@ if not app.secret_key:
 # 註冊藍圖
 app.register_blueprint(payment_bp, url_prefix='/payment')
 app.register_blueprint(line_bp, url_prefix='/line')
+app.register_blueprint(internal_bp, url_prefix='/internal')
 
 def is_valid_email(email):
     email_regex = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"  #check email 格式是否正確
@@ -116,7 +137,7 @@ def login():
     password = data.get('password')
 
     # 檢查用戶是否存在
-    user = next((u for u in user_find() if u['email'] == email), None)
+    user = find_user_by_email(email, {"password": 1})
     if not user or not bcrypt.check_password_hash(user['password'], password):
         return jsonify({"error": "Email does not exist or password is incorrect"}), 401
     user_id=str(user["_id"])   # 確保 user_id 是 UUID 字串
@@ -128,12 +149,12 @@ def login():
 
 @jwt.token_in_blocklist_loader
 def check_token_revoked(jwt_header, jwt_payload):
-    return blacklisted_tokens_collection.find_one({"jti":jwt_payload["jti"]}) is not None
+    return token_revocation.is_revoked(jwt_payload["jti"])   # 查詢是否在黑名單（布隆過濾器 + LRU 快取）
 @app.route("/logOut", methods=["POST"])
 @jwt_required()
 def logOut():
     jti=get_jwt()["jti"]
-    blacklisted_tokens_collection.insert_one({"jti":jti})
+    token_revocation.revoke(jti)
     return jsonify({"message":"Logout successful"}),200
 
 
@@ -157,33 +178,17 @@ def get_user():
 @app.route("/update_points", methods=["POST"])
 def update_points():
     try:
-        data = request.json
-        user_id = data.get("user_id")
-        points = data.get("points")  # 加/扣的點數 (正數為加點，負數為扣點)
-
-        user=collection.find_one({"_id":user_id})
-        if not user:
-            return jsonify({"error":"User does not exist"}), 404
-
-        current_points = user.get("points", 0)   # 確保點數欄位存在
-
-        new_points = current_points + points   # 計算新的點數
-        if new_points < 0:
-            return jsonify({"error": "Not enough points"}), 400
-
-        collection.update_one(   # 更新用戶點數
-            {"_id": user["_id"]},  # uuid 作為查詢條件
-            {"$set": {"points": new_points}}
-        )
-
-        return jsonify({
-            "message": "點數更新成功",
-            "new_points": new_points
-        }), 200
+        return update_points_sys()   # 條件式 $inc，並寫入 PointsLedger
     except Exception as e:
         return jsonify({"error": f"An error occurred : {str(e)}"}), 500
 
 
+""" 點數餘額與異動紀錄 """
+@app.route("/points/<user_id>", methods=["GET"])
+def get_points_ledger(user_id):
+    return get_points_ledger_sys(user_id)
+
+
 
 
 @app.route("/api/expenses/add", methods=["POST"])   # 新增支出api
@@ -197,16 +202,37 @@ def add_expenses():
     
 
 
+def wants_async():   # async=true 時改為背景工作
+    return request.args.get("async", "false").lower()=="true"
+
 def serialize_document(doc):
     """將 MongoDB 文件中的 ObjectId 轉換為字符串"""
     return {key: str(value) if key == "_id" else value for key, value in doc.items()}
 
+def get_report_revenues(start, end, source):
+    """
+    取得報表收入資料
+    - orders：逐筆訂單（依 updated_at，不分狀態）
+    - rollup：每日營收彙總（只計已完成訂單），一天一筆
+    """
+    if source=="rollup":
+        return [{
+            "updated_at":doc["date"],
+            "total_price":doc.get("gross", 0),
+            "discount_amount":doc.get("discount", 0),
+            "final_price":doc.get("final_price", 0),
+            "count":doc.get("count", 0)
+        } for doc in get_daily_revenue(start, end)]
+    return iter_revenues(start, end)   # cursor，逐批讀取
+
 @app.route("/api/search/report", methods=["GET"])   # 搜尋收入支出報表&生成圖形報表
 def get_report():
     start_date=request.args.get("start_date")
     end_date=request.args.get("end_date")
     chart=request.args.get("chart", "fales").lower()=="true"
     chart_type=request.args.get("chart_type", "line").lower()
+    aggregate=request.args.get("aggregate", "false").lower()=="true"   # 只回傳統計（由資料庫分組加總）
+    source=request.args.get("source", "orders").lower()   # 收入來源：orders 或 rollup（每日彙總）
 
     try:
         start=datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S")
@@ -214,19 +240,33 @@ def get_report():
     except ValueError:
         return jsonify({"error":"Invalid date format. Use 'YYYY-MM-DD HH:MM:SS'"})
 
-    revenues=[serialize_document(doc) for doc in get_revenues(start, end)]
-    expenses=[serialize_document(doc) for doc in get_expenses(start, end)]
-
-    total_revenue=total(revenues, "total_price")
-    total_expense=total(expenses, "amount")
-    
     if chart:
         try:
-                # 生成折線圖
-            img = generate_trend_chart(revenues, expenses, chart_type)
-            return send_file(img, mimetype="image/png")
+                # 生成折線圖（相同區間與類型的圖片有快取，命中時不查資料庫）
+            def load_chart_data():
+                revenues=[(r["updated_at"], r["total_price"]) for r in get_report_revenues(start, end, source)]
+                expenses=[(e["created_time"], e["amount"]) for e in get_expenses(start, end)]
+                return revenues, expenses, chart_type
+            img = chart_renderer.get((start, end, chart_type, source), load_chart_data)
+            return send_file(io.BytesIO(img), mimetype="image/png")
         except Exception as e:
             return jsonify({"error": f"Failed to generate chart: {str(e)}"}), 500
+
+    if aggregate:
+        revenue_summary=aggregate_revenues(start, end)
+        expense_summary=aggregate_expenses(start, end)
+        return jsonify({
+            "total_revenue":revenue_summary.pop("total"),
+            "total_expense":expense_summary.pop("total"),
+            "revenues":revenue_summary,   # count、by_day、by_hour、by_payment_method
+            "expenses":expense_summary    # count、by_day、by_hour
+            })
+
+    revenues=[serialize_document(doc) for doc in get_report_revenues(start, end, source)]
+    expenses=[serialize_document(doc) for doc in get_expenses(start, end)]
+
+    total_revenue=total(revenues, "total_price")
+    total_expense=total(expenses, "amount")
     
     revenue_data=[{"total_price": r["total_price"], "updated_at": r["updated_at"].strftime("%Y-%m-%d %H:%M:%S")} for r in revenues]
     expense_data=[{"amount": e["amount"], "created_time": e["created_time"].strftime("%Y-%m-%d %H:%M:%S")} for e in expenses]
@@ -240,19 +280,34 @@ def get_report():
     
 
 
-@app.route("/api/report/export", methods=["GET"])  # 匯出excel
+def run_report_export(params, progress=None):   # 匯出報表（同步 API 與背景工作共用）
+    start=datetime.strptime(params["start_date"], "%Y-%m-%d %H:%M:%S")
+    end=datetime.strptime(params["end_date"], "%Y-%m-%d %H:%M:%S")
+    # 由 cursor 逐列寫入檔案，不先把整個區間的資料載入記憶體
+    revenues=get_report_revenues(start, end, params.get("source", "orders"))
+    expenses=iter_expenses(start, end)
+    sheets=[("Revenues", revenues, ("updated_at", "total_price")), ("Expenses", expenses, ("created_time", "amount"))]
+    return stream_export_report(sheets, params.get("format", "xlsx"), progress)
+
+@app.route("/api/report/export", methods=["GET"])  # 匯出excel / csv / csv.gz，async=true 時改為背景工作
 def export_report():
     try:
-        start_date=request.args.get("start_date")
-        end_date=request.args.get("end_date")
-        start=datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S")
-        end=datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
-
-        revenues=get_revenues(start, end)
-        expenses=get_expenses(start, end)
-        output=export_to_excel(revenues, expenses)
-        return send_file(output, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        as_attachment=True, download_name="report_xlsx")
+        params={
+            "start_date":request.args.get("start_date"),
+            "end_date":request.args.get("end_date"),
+            "source":request.args.get("source", "orders").lower(),   # 收入來源：orders 或 rollup（每日彙總）
+            "format":request.args.get("format", "xlsx").lower()   # xlsx、csv 或 csv.gz
+        }
+        datetime.strptime(params["start_date"], "%Y-%m-%d %H:%M:%S")   # 先檢查日期格式
+        datetime.strptime(params["end_date"], "%Y-%m-%d %H:%M:%S")
+        if params["format"] not in EXPORT_FORMATS:
+            return jsonify({"error":f"Invalid format. Allowed values are {list(EXPORT_FORMATS)}"}), 400
+
+        if wants_async():
+            return job_accepted("report_export", params)
+
+        output, mimetype, filename=run_report_export(params)
+        return send_file(output, mimetype=mimetype, as_attachment=True, download_name=filename)
     except Exception as e:
         logging.error(f"Error in exporting report :{e}")
         return jsonify({"error":str(e)}), 500
@@ -307,11 +362,21 @@ def get_orders():
     """取得訂單列表"""
     return get_orders_sys()
 
+@app.route('/orders/export', methods=["GET"])
+def export_orders():
+    """匯出訂單（NDJSON 串流，可用 since 增量同步）"""
+    return export_orders_sys()
+
 @app.route('/orders/<order_id>', methods=["POST"])
 def get_order(order_id):
     """查詢單一訂單資訊"""
     return get_order_sys(order_id)
 
+@app.route('/orders/<order_id>/qrcode', methods=["GET"])
+def get_order_qr_code(order_id):
+    """取得訂單 QR Code（png / svg）"""
+    return get_order_qr_code_sys(order_id)
+
 @app.route('/orders/<order_id>', methods=["PUT"])
 def update_order(order_id):
     """修改訂單資訊"""
@@ -371,6 +436,23 @@ def bind_coupon():
 
 # 會計報表api
 # -----------------------------------------------------
+XLSX_MIMETYPE="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def statement_job(build, to_excel, download_name):   # 會計報表背景工作
+    def runner(params, progress):
+        result=build()
+        if isinstance(result, tuple):
+            result=result[0]
+        if "error" in result:
+            raise Exception(result["error"])
+        return to_excel(result), XLSX_MIMETYPE, download_name
+    return runner
+
+register_job_type("report_export", run_report_export)
+register_job_type("cash_flow_statement", statement_job(Cash_Flow_Statement, save_to_excel, "現金流量表.xlsx"))
+register_job_type("income_statement", statement_job(get_income_statement, save_income_statement_to_excel, "損益表.xlsx"))
+register_job_type("balance_sheet", statement_job(balance_sheet, save_balance_sheet_to_excel, "資產負債表.xlsx"))
+
 #現金流量表
 @app.route('/accounting/cash_flow_statement', methods=["GET"])
 def fetch_cash_flow_statement():
@@ -379,6 +461,8 @@ def fetch_cash_flow_statement():
  #現金流量表導出excel   
 @app.route('/accounting/cash_flow_statement/save', methods=["POST"])
 def download_cash_flow_statement():
+    if wants_async():
+        return job_accepted("cash_flow_statement", {})
     return save_cash_flow_statement()
 
 #損益表
@@ -389,6 +473,8 @@ def fetch_income_statement():
 #損益表導出excel
 @app.route('/accounting/income_statement/save', methods=["POST"])
 def download_income_statement():
+    if wants_async():
+        return job_accepted("income_statement", {})
     return save_income_statement()
 
 #資產負債表
@@ -399,6 +485,8 @@ def fetch_balance_sheet():
 #資產負債表導出excel
 @app.route("/accounting/balance_sheet/save", methods=["POST"])
 def download_balance_sheet():
+    if wants_async():
+        return job_accepted("balance_sheet", {})
     return balance_sheet_save()
 
 #記帳歷史紀錄
@@ -418,6 +506,25 @@ def fetch_set_opening_balance():
 
 
 
+# 背景工作api
+# -----------------------------------------------------
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """建立背景工作（report_export、cash_flow_statement、income_statement、balance_sheet）"""
+    return submit_job_sys()
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """查詢背景工作狀態與進度"""
+    return get_job_sys(job_id)
+
+@app.route("/jobs/<job_id>/download", methods=["GET"])
+def download_job(job_id):
+    """下載背景工作產出檔"""
+    return download_job_sys(job_id)
+
+
+
 #========================後台環境==============================#
 
 @app.route("/backstage/registers", methods=["POST"])
@@ -522,15 +629,11 @@ def get_users():
         
 
 
-@jwt.token_in_blocklist_loader
-def check_token_revoked(jwt_header, jwt_payload):
-    return blacklisted_tokens_collection.find_one({"jti":jwt_payload["jti"]}) is not None   # 查詢是否在黑名單
-
 @app.route("/backstage/logout", methods=["POST"])
 @jwt_required()
 def logout():
     jti=get_jwt()["jti"]
-    blacklisted_tokens_collection.insert_one({"jti":jti})
+    token_revocation.revoke(jti)
     return jsonify({"message":"Logged out successfully"}), 200
 
 # 候位系統api
@@ -552,10 +655,18 @@ def queue_call(queue_number):
 def queue_auto_call():
     return auto_call_queue()
 #取得候位資訊
+@app.route("/queue/seat", methods=["POST"])
+def queue_seat():
+    return seat_queue()
+
 @app.route("/queue/info", methods=["GET"])
 def queue_info():
     return get_queue_info()
 
+@app.route("/queue/stream", methods=["GET"])
+def queue_stream():
+    return stream_queue_info()
+
 # 定位系統api
 # -----------------------------------------------------
 @app.route("/set_reservation_slots", methods=["POST"])
@@ -583,11 +694,21 @@ def get_all_reservations():
     """查詢所有預約"""
     return get_all_reservations_sys()
 
+@app.route("/reservations/export", methods=["GET"])
+def export_reservations():
+    """匯出預約（NDJSON 串流，可用 since 增量同步）"""
+    return export_reservations_sys()
+
 @app.route("/reservations/date", methods=["GET"])
 def get_reservations_by_date():
     """根據指定日期查詢預約"""
     return get_reservations_by_date_sys()
 
+@app.route("/reservations/availability", methods=["GET"])
+def get_reservation_availability():
+    """查詢剩餘座位"""
+    return get_reservation_availability_sys()
+
 @app.route("/reservations/today", methods=["GET"])
 def get_today_reservations():
     """查詢當天所有預約"""
@@ -599,4 +720,4 @@ def delete_reservation(reservation_id):
     return delete_reservation_sys(reservation_id)
 
 if __name__ == "__main__":
-    app.run(debug=True, threaded=False)
+    app.run(debug=True, threaded=True)   # 開發用；正式環境請用 gunicorn -c gunicorn.conf.py wsgi:app
@@ -0,0 +1,56 @@
+import os, statistics, sys, time
+
+"""
+效能測試共用工具
+- 在 repo 根目錄以 python -m bench.<名稱> 執行，各腳本的參數見 --help
+- 需要 MongoDB 的測試連到 BENCH_MONGO_URI（預設本機 mongod）的 BENCH_DATABASE_NAME（預設 order_sys_bench），會清空並寫入測試資料
+- 必須在載入其他專案模組前 import 本模組：改寫 MONGO_URI / DATABASE_NAME，不會連到 .env 設定的資料庫
+- 結果可導到 bench_output.txt（已列在 .gitignore）
+"""
+
+BENCH_MONGO_URI = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+BENCH_DATABASE_NAME = os.getenv("BENCH_DATABASE_NAME", "order_sys_bench")
+os.environ["MONGO_URI"] = BENCH_MONGO_URI
+os.environ["DATABASE_NAME"] = BENCH_DATABASE_NAME
+
+
+def bench_db():
+    """測試資料庫（pymongo Database），連不到 mongod 時結束程式"""
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    client = MongoClient(BENCH_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        sys.exit(f"no mongod at {BENCH_MONGO_URI}: {e}")
+    return client[BENCH_DATABASE_NAME]
+
+
+def timed(func, *args, **kwargs):
+    """回傳 (秒數, 結果)"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def percentiles(samples):
+    """秒數樣本轉為毫秒的 p50 / p99 / 平均"""
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+    return {"n": len(ordered), "p50_ms": at(0.5), "p99_ms": at(0.99), "mean_ms": statistics.fmean(ordered) * 1000}
+
+
+def print_table(rows):
+    """rows 為欄位相同的 dict list，輸出對齊的表格"""
+    if not rows:
+        return
+    columns = list(rows[0])
+    cells = [[f"{row[column]:.3f}" if isinstance(row[column], float) else str(row[column]) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+    sys.stdout.flush()
@@ -0,0 +1,130 @@
+import argparse, random
+from datetime import datetime, timedelta
+from bench.common import bench_db, timed, percentiles, print_table
+from flask import Flask, jsonify
+import json_response
+from json_response import dumps
+
+"""
+JSON 回應編碼耗時（user-005）：菜單、優惠券、預約列表各 10k 筆時，每個請求的編碼時間
+- encode（不需要 MongoDB）：同一份資料以 flask.jsonify（舊作法）、json_response.dumps（orjson / 標準 json）編碼
+- --mongo：寫入 10k 筆到測試資料庫後呼叫 get_menu_sys / get_all_coupons_sys / get_all_reservations_sys
+    before：舊作法，每次查詢後 jsonify
+    rebuild：快取失效後的第一個請求（查詢 + 編碼一次）
+    cached：資料未異動時的請求（直接回傳已編碼的 bytes）
+
+    python -m bench.encode
+    python -m bench.encode --rows 10000 --repeat 50 --mongo
+"""
+
+CREATED = datetime(2025, 1, 1, 12, 0)
+
+
+def menu_item(i):
+    return {"_id": f"{10000000 + i}", "name": f"品項 {i}", "description": "招牌餐點" * 4, "price": 80 + i % 200,
+            "category": ["主餐", "飲料", "甜點"][i % 3], "image_url": f"https://i.imgur.com/{i:08d}.jpg",
+            "imgur_deletehash": f"{i:016x}", "is_available": i % 7 != 0,
+            "created_at": CREATED + timedelta(minutes=i), "updated_at": CREATED + timedelta(minutes=i)}
+
+
+def coupon(i):
+    return {"_id": f"C{i:08d}", "user_id": f"u{i % 997:07d}", "discount": 50, "cost": 100, "status": "active",
+            "created_at": CREATED + timedelta(minutes=i), "expiration_date": CREATED + timedelta(days=30, minutes=i)}
+
+
+def reservation(i):
+    return {"_id": f"2501{i:08d}", "user_id": f"u{i % 997:07d}", "time_range": "18:00-20:00", "guests": 1 + i % 6,
+            "reservation_date": CREATED.replace(hour=0) + timedelta(days=i % 60), "contact_info": f"09{i:08d}",
+            "status": "active", "created_at": CREATED + timedelta(minutes=i), "updated_at": CREATED + timedelta(minutes=i)}
+
+
+DATASETS = {
+    "menu": ("Menu", menu_item),
+    "coupons": ("Coupons", coupon),
+    "reservations": ("Reservations", reservation),
+}
+
+
+def measure(func, repeat):
+    func()   # 暖機
+    return percentiles([timed(func)[0] for _ in range(repeat)])
+
+
+def bench_encode(app, rows, repeat):
+    """同一份資料以不同方式編碼"""
+    results = []
+    for name, (_, make) in DATASETS.items():
+        docs = [make(i) for i in range(rows)]
+        payload = docs if name == "menu" else {name: docs}
+        with app.app_context():
+            results.append(dict({"dataset": name, "encoder": "flask.jsonify"}, **measure(lambda: jsonify(payload).get_data(), repeat)))
+        results.append(dict({"dataset": name, "encoder": "dumps (orjson)" if json_response.orjson else "dumps (json)"},
+                            **measure(lambda: dumps(payload), repeat)))
+        if json_response.orjson is not None:
+            orjson, json_response.orjson = json_response.orjson, None
+            try:
+                results.append(dict({"dataset": name, "encoder": "dumps (json)"}, **measure(lambda: dumps(payload), repeat)))
+            finally:
+                json_response.orjson = orjson
+    return results
+
+
+def bench_endpoints(app, db, rows, repeat):
+    """寫入測試資料後量測實際的讀取 API"""
+    from menu.menu_sys import get_menu_sys
+    from menu.menu_cache import menu_cache
+    from coupons.coupons_sys import get_all_coupons_sys, coupons_result_cache
+    from reservation.reservation_sys import get_all_reservations_sys, reservations_result_cache
+
+    for collection, make in DATASETS.values():
+        db[collection].drop()
+        db[collection].insert_many([make(i) for i in range(rows)])
+
+    def before(collection, wrap):
+        def run():
+            docs = list(db[collection].find())
+            return jsonify(docs if wrap is None else {wrap: docs}).get_data()
+        return run
+
+    def rebuild(func, reset):
+        def run():
+            reset()
+            return func()
+        return run
+
+    def reset_menu():
+        menu_cache.snapshot = None
+
+    def reset_result(cache):
+        return lambda: setattr(cache, "body", None)
+
+    endpoints = [
+        ("get_menu_sys", get_menu_sys, reset_menu, before("Menu", None)),
+        ("get_all_coupons_sys", get_all_coupons_sys, reset_result(coupons_result_cache), before("Coupons", "coupons")),
+        ("get_all_reservations_sys", get_all_reservations_sys, reset_result(reservations_result_cache), before("Reservations", "reservations")),
+    ]
+    results = []
+    for name, func, reset, old in endpoints:
+        with app.test_request_context("/"):
+            results.append(dict({"endpoint": name, "path": "before"}, **measure(old, repeat)))
+            results.append(dict({"endpoint": name, "path": "rebuild"}, **measure(rebuild(func, reset), repeat)))
+            results.append(dict({"endpoint": name, "path": "cached"}, **measure(func, repeat)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--mongo", action="store_true", help="also time the real read endpoints against a local mongod")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    print_table(bench_encode(app, args.rows, args.repeat))
+    if args.mongo:
+        print()
+        print_table(bench_endpoints(app, bench_db(), args.rows, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
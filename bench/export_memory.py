@@ -0,0 +1,124 @@
+import argparse, io, json, os, resource, subprocess, sys, time
+from datetime import datetime, timedelta
+from bench.common import bench_db, print_table
+
+"""
+報表匯出的記憶體與時間（user-013）：串流匯出與 pandas 作法在 100k、1M 筆時的比較
+- 每個情境在獨立的子行程執行，記錄匯出期間最高 RSS 比匯出前增加多少（ru_maxrss）
+- pandas：user-013 之前的作法，整批讀成 list 後建立 DataFrame，以 openpyxl 寫入 BytesIO
+- xlsx / csv / csv.gz：export_engine.export_report 逐筆寫入
+- 資料來源預設為產生的資料（只比較寫檔）；--mongo 時寫入測試資料庫，改由 iter_revenues / iter_expenses 的 cursor 讀取
+- 筆數為收入與支出合計（各一半）
+
+    python -m bench.export_memory
+    python -m bench.export_memory --rows 100000 1000000 --paths pandas xlsx csv.gz --mongo
+"""
+
+PATHS = ["pandas", "xlsx", "csv", "csv.gz"]
+START = datetime(2024, 1, 1)
+
+
+def revenue_rows(count):
+    for i in range(count):
+        yield {"total_price": 100 + i % 900, "updated_at": START + timedelta(seconds=i * 30)}
+
+
+def expense_rows(count):
+    for i in range(count):
+        yield {"amount": 50 + i % 400, "created_time": START + timedelta(seconds=i * 30)}
+
+
+def seed(rows):
+    """寫入 Orders / Expenses 測試資料"""
+    db = bench_db()
+    db.Orders.drop()
+    db.Expenses.drop()
+    half = rows // 2
+    for collection, make in ((db.Orders, revenue_rows), (db.Expenses, expense_rows)):
+        batch = []
+        for doc in make(half):
+            batch.append(doc)
+            if len(batch) == 10000:
+                collection.insert_many(batch)
+                batch = []
+        if batch:
+            collection.insert_many(batch)
+    db.Orders.create_index("updated_at")
+    db.Expenses.create_index("created_time")
+
+
+def sources(rows, mongo):
+    half = rows // 2
+    if not mongo:
+        return revenue_rows(half), expense_rows(half)
+    from mongoDB import iter_revenues, iter_expenses
+    end = START + timedelta(seconds=half * 30)
+    return iter_revenues(START, end), iter_expenses(START, end)
+
+
+def export_pandas(revenues, expenses):
+    """user-013 之前的 func.export_to_excel"""
+    import pandas as pd
+    df_revenues = pd.DataFrame(list(revenues))
+    df_expenses = pd.DataFrame(list(expenses))
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        df_revenues.to_excel(writer, index=False, sheet_name="Revenues")
+        df_expenses.to_excel(writer, index=False, sheet_name="Expenses")
+    output.seek(0, os.SEEK_END)
+    return output.tell()
+
+
+def export_streaming(fmt, revenues, expenses):
+    from export_engine import export_report
+    output, _, _ = export_report([("Revenues", revenues, ("updated_at", "total_price")),
+                                  ("Expenses", expenses, ("created_time", "amount"))], fmt)
+    output.seek(0, os.SEEK_END)
+    size = output.tell()
+    output.close()
+    return size
+
+
+def child(path, rows, mongo):
+    """子行程：執行一種匯出並以 JSON 輸出結果"""
+    import pandas, openpyxl, export_engine   # 先載入模組，不計入匯出的記憶體
+    if mongo:
+        import mongoDB
+        mongoDB.get_client().admin.command("ping")
+    revenues, expenses = sources(rows, mongo)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    size = export_pandas(revenues, expenses) if path == "pandas" else export_streaming(path, revenues, expenses)
+    seconds = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    unit = 1 if sys.platform == "darwin" else 1024   # ru_maxrss：macOS 為 bytes，Linux 為 KB
+    print(json.dumps({"peak_mb": (peak - baseline) * unit / (1024 * 1024), "seconds": seconds, "output_mb": size / (1024 * 1024)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=PATHS)
+    parser.add_argument("--mongo", action="store_true", help="read rows from the bench database instead of generating them")
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]), args.mongo)
+        return
+
+    rows = []
+    for count in args.rows:
+        if args.mongo:
+            seed(count)
+        for path in args.paths:
+            command = [sys.executable, "-m", "bench.export_memory", "--child", path, str(count)] + (["--mongo"] if args.mongo else [])
+            result = subprocess.run(command, capture_output=True, text=True, check=True)
+            rows.append(dict({"rows": count, "path": path}, **json.loads(result.stdout.strip().splitlines()[-1])))
+            print_table(rows[-1:])
+    print()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import argparse, http.client, multiprocessing, os, subprocess, sys, threading, time
+from datetime import datetime
+from bench.common import bench_db, percentiles, print_table
+
+"""
+吞吐量與 worker 數（user-015）：以 gunicorn.conf.py 啟動 wsgi:app，worker 數由 1 增加時每秒處理的請求數
+- 每個 worker 數各自啟動一次 gunicorn（GUNICORN_WORKERS / GUNICORN_THREADS / GUNICORN_BIND 由本腳本設定），連到測試資料庫
+- 用戶端為 --clients 個行程、每個行程 --connections 條 keep-alive 連線，持續送 GET 請求 --duration 秒
+- 用戶端與服務在同一台機器時會互搶 CPU，worker 數超過 CPU 數後吞吐量不再增加是正常的
+- 預設量測 /menu（菜單快取）與 /queue/info（候位資訊，QUEUE_STORE=mongo 時每次讀資料庫）
+
+    python -m bench.load_test
+    python -m bench.load_test --workers 1 2 4 8 --paths /menu --duration 20 --clients 4 --connections 16
+"""
+
+
+def seed_menu(items=50):
+    db = bench_db()
+    now = datetime.now()
+    db.Menu.drop()
+    db.Menu.insert_many([
+        {"_id": f"{30000000 + i}", "name": f"品項 {i}", "description": "", "price": 60 + i * 5, "category": "主餐",
+         "image_url": "", "imgur_deletehash": "", "is_available": True, "created_at": now, "updated_at": now}
+        for i in range(items)
+    ])
+    db.Counts.update_one({"_id": "menu_version"}, {"$inc": {"sequence_value": 1}, "$set": {"updated_at": now}}, upsert=True)
+
+
+def start_server(app, workers, threads, port):
+    env = dict(os.environ,
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads),
+               GUNICORN_BIND=f"127.0.0.1:{port}",
+               GUNICORN_ACCESSLOG="/dev/null",
+               GUNICORN_LOGLEVEL="warning")
+    env.setdefault("FLASK_SECRET_KEY", "bench")
+    return subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", app], env=env)
+
+
+def wait_ready(port, path, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"gunicorn exited with {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", path)
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"server on port {port} not ready after {timeout}s")
+
+
+def client(args):
+    """用戶端行程：connections 條連線持續送請求到 deadline，回傳 (延遲樣本, 錯誤數)"""
+    port, path, connections, deadline = args
+    samples, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker():
+        local, failed = [], 0
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                if response.status == 200:
+                    local.append(time.perf_counter() - started)
+                else:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1   # worker 依 max_requests 重啟時連線會被關閉，重新連線
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        connection.close()
+        with lock:
+            samples.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors[0]
+
+
+def load(port, path, clients, connections, duration):
+    deadline = time.time() + duration
+    with multiprocessing.get_context("spawn").Pool(clients) as pool:
+        results = pool.map(client, [(port, path, connections, deadline)] * clients)
+    samples = [sample for result, _ in results for sample in result]
+    return samples, sum(errors for _, errors in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="wsgi:app")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--paths", nargs="+", default=["/menu", "/queue/info"])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--port", type=int, default=18100)
+    parser.add_argument("--no-seed", action="store_true", help="do not write the bench menu")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        seed_menu()
+    rows = []
+    for workers in args.workers:
+        server = start_server(args.app, workers, args.threads, args.port)
+        try:
+            wait_ready(args.port, args.paths[0], server)
+            for path in args.paths:
+                load(args.port, path, args.clients, args.connections, 1)   # 暖機（各 worker 建立連線、載入快取）
+                samples, errors = load(args.port, path, args.clients, args.connections, args.duration)
+                rows.append(dict({"workers": workers, "path": path, "req/s": len(samples) / args.duration, "errors": errors},
+                                 **percentiles(samples or [0])))
+                print_table(rows[-1:])
+        finally:
+            server.terminate()
+            server.wait()
+    print()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse, os, random
+from datetime import datetime
+import bcrypt
+from bench.common import bench_db, timed, percentiles, print_table
+from mongoDB import find_user_by_email, user_find
+
+"""
+登入查詢延遲（user-001）：Users 由 1k 增加到 1M 筆時，以 email 索引查詢的延遲應維持不變
+- Users 依序補到各個筆數（已有的資料沿用，只插入不足的部分），email 建唯一索引
+- lookup：find_user_by_email(email, {"password": 1})，即 /login 對資料庫做的查詢
+- scan：舊版 user_find() 讀出全部會員再逐筆比對 email，只在 --scan-max 以下的筆數執行
+- --endpoint：另外以 Flask test client 打 /login（密碼以 4 rounds 的 bcrypt 雜湊，避免雜湊時間蓋過查詢時間）
+
+    python -m bench.login
+    python -m bench.login --sizes 1000 10000 100000 1000000 --lookups 5000 --endpoint
+"""
+
+PASSWORD = "bench-password"
+BATCH = 10000
+
+
+def email_of(i):
+    return f"user{i:07d}@bench.local"
+
+
+def fill_users(db, size, password_hash):
+    """把 Users 補到 size 筆"""
+    existing = db.Users.count_documents({})
+    now = datetime.now()
+    for start in range(existing, size, BATCH):
+        db.Users.insert_many([
+            {"_id": f"bench{i:07d}", "email": email_of(i), "password": password_hash, "points": 0, "register_time": now}
+            for i in range(start, min(start + BATCH, size))
+        ], ordered=False)
+
+
+def legacy_find(email):
+    """user-001 之前的登入查詢：讀出所有會員後逐筆比對"""
+    return next((user for user in user_find() if user.get("email") == email), None)
+
+
+def endpoint_client():
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+    from backend import app
+    return app.test_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--scan-max", type=int, default=10000, help="largest user count to run the full-scan path on")
+    parser.add_argument("--scan-lookups", type=int, default=20)
+    parser.add_argument("--endpoint", action="store_true", help="also time POST /login through the Flask app")
+    args = parser.parse_args()
+
+    db = bench_db()
+    db.Users.drop()
+    db.Users.create_index("email", unique=True)
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(4)).decode()
+    client = endpoint_client() if args.endpoint else None
+    rng = random.Random(1)
+
+    rows = []
+    for size in sorted(args.sizes):
+        fill_users(db, size, password_hash)
+        emails = [email_of(rng.randrange(size)) for _ in range(args.lookups)]
+        cases = [("lookup", lambda email: find_user_by_email(email, {"password": 1}), emails)]
+        if size <= args.scan_max:
+            cases.append(("scan", legacy_find, emails[:args.scan_lookups]))
+        if client is not None:
+            cases.append(("POST /login", lambda email: client.post("/login", json={"email": email, "password": PASSWORD}), emails))
+
+        for name, func, inputs in cases:
+            samples = []
+            for email in inputs:
+                seconds, result = timed(func, email)
+                assert result is not None and getattr(result, "status_code", 200) == 200
+                samples.append(seconds)
+            rows.append(dict({"users": size, "path": name}, **percentiles(samples)))
+        print_table(rows[-len(cases):])
+    print()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
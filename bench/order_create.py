@@ -0,0 +1,113 @@
+import argparse, random, threading, time
+from datetime import datetime, timedelta
+import requests
+from bench.common import bench_db, BENCH_DATABASE_NAME, BENCH_MONGO_URI, percentiles, print_table
+
+"""
+建立訂單延遲（user-008）：POST /orders 的 p50 / p99 與吞吐量
+- 以 HTTP 打執行中的服務，同一支腳本可以量測任何版本（例如 user-008 之前的 commit 與目前版本）
+- 服務必須連到測試資料庫：
+    MONGO_URI=mongodb://localhost:27017/?replicaSet=rs0 DATABASE_NAME=order_sys_bench FLASK_SECRET_KEY=bench \\
+        gunicorn -c gunicorn.conf.py wsgi:app
+  BENCH_MONGO_URI / BENCH_DATABASE_NAME 需與服務相同（單機 mongod 也可以，replica set 較接近正式環境）
+- 腳本寫入會員、菜單與每個請求各一張優惠券，情境：
+    plain：不使用優惠券
+    coupon：每筆訂單領用一張優惠券（原子領用）
+
+    python -m bench.order_create --url http://127.0.0.1:8000 --requests 2000 --concurrency 16
+    # 比較修改前：git checkout <user-008 之前的 commit>，重啟服務後再執行一次
+"""
+
+MENU_ITEMS = 50
+
+
+def seed(db, users, coupons):
+    """寫入會員、菜單與優惠券；菜單版本號遞增讓服務重新載入菜單"""
+    now = datetime.now()
+    for name in ("Users", "Menu", "Coupons"):
+        db[name].drop()
+    db.Users.insert_many([{"_id": f"bench{i:05d}", "email": f"order{i}@bench.local", "points": 0} for i in range(users)])
+    db.Menu.insert_many([
+        {"_id": f"{20000000 + i}", "name": f"品項 {i}", "description": "", "price": 60 + i * 5, "category": "主餐",
+         "image_url": "", "imgur_deletehash": "", "is_available": True, "created_at": now, "updated_at": now}
+        for i in range(MENU_ITEMS)
+    ])
+    db.Coupons.insert_many([
+        {"_id": f"BENCH{i:07d}", "user_id": f"bench{i % users:05d}", "discount": 30, "cost": 100, "status": "active",
+         "created_at": now, "expiration_date": now + timedelta(days=1)}
+        for i in range(coupons)
+    ])
+    db.Counts.update_one({"_id": "menu_version"}, {"$inc": {"sequence_value": 1}, "$set": {"updated_at": now}}, upsert=True)
+
+
+def payload(i, users, with_coupon, rng):
+    data = {
+        "user_id": f"bench{i % users:05d}",
+        "items": [{"menu_item_id": f"{20000000 + rng.randrange(MENU_ITEMS)}", "quantity": rng.randint(1, 3)} for _ in range(3)],
+        "payment_method": "online",
+    }
+    if with_coupon:
+        data["coupon_code"] = f"BENCH{i:07d}"
+    return data
+
+
+def run(url, total, concurrency, users, with_coupon):
+    """同時 concurrency 個連線送出 total 筆訂單，回傳 (延遲樣本, 失敗數, 秒數)"""
+    samples, failures = [], []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            body = payload(i, users, with_coupon, rng)
+            started = time.perf_counter()
+            response = session.post(f"{url}/orders", json=body)
+            elapsed = time.perf_counter() - started
+            with lock:
+                (samples if response.status_code == 201 else failures).append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, len(failures), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"server {args.url}, database {BENCH_DATABASE_NAME} at {BENCH_MONGO_URI}")
+    db = bench_db()
+    rows = []
+    for concurrency in args.concurrency:
+        for scenario in ("plain", "coupon"):
+            seed(db, args.users, args.requests + args.warmup)
+            run(args.url, args.warmup, 1, args.users, False)   # 暖機（載入菜單快取、建立連線）
+            samples, failures, seconds = run(args.url, args.requests, concurrency, args.users, scenario == "coupon")
+            if not samples:
+                raise SystemExit(f"all {failures} requests failed; is the server using database {BENCH_DATABASE_NAME}?")
+            stats = percentiles(samples)
+            rows.append({"scenario": scenario, "concurrency": concurrency, "failed": failures,
+                         "req/s": len(samples) / seconds, **stats})
+            if scenario == "coupon":
+                used = db.Coupons.count_documents({"status": "used"})
+                assert used == len(samples), f"{used} coupons used for {len(samples)} orders"
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
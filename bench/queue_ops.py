@@ -0,0 +1,79 @@
+import argparse, random, time
+from datetime import datetime
+from bench.common import bench_db, print_table
+from waiting.queue_store import MemoryQueueStore, MongoQueueStore
+
+"""
+候位操作的單次耗時（user-022）：候位組數由 100 增加到 10k 時，每個操作的平均耗時應維持不變
+- 先放入 size 組候位，之後每一輪做 take ×3、info(號碼)、info()、call_next、call_for_table、cancel，候位組數維持在 size 左右
+- 預設只測 MemoryQueueStore；--mongo 另外測 MongoQueueStore（需要 mongod）
+
+    python -m bench.queue_ops
+    python -m bench.queue_ops --sizes 1000 10000 100000 --rounds 5000 --mongo
+"""
+
+OPERATIONS = ["take", "info(number)", "info()", "call_next", "call_for_table", "cancel"]
+
+
+def new_entry(rng):
+    return {"name": "bench", "phone": "", "people": rng.randint(1, 6), "source": "onsite", "created_at": datetime.utcnow()}
+
+
+def run(store, size, rounds, seed=22):
+    """回傳各操作的平均耗時（微秒）"""
+    rng = random.Random(seed)
+    for _ in range(size):
+        store.take(new_entry(rng))
+
+    totals = dict.fromkeys(OPERATIONS, 0)
+    counts = dict.fromkeys(OPERATIONS, 0)
+
+    def measure(name, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        totals[name] += time.perf_counter() - started
+        counts[name] += 1
+        return result
+
+    for _ in range(rounds):
+        numbers = [measure("take", store.take, new_entry(rng)) for _ in range(3)]
+        measure("info(number)", store.info, numbers[0])
+        measure("info()", store.info)
+        measure("call_next", store.call_next)
+        measure("call_for_table", store.call_for_table, 6)   # 人數最多 6，一定叫得到
+        measure("cancel", store.cancel, numbers[rng.randrange(3)])
+    return {name: totals[name] / counts[name] * 1e6 for name in OPERATIONS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--mongo", action="store_true", help="also benchmark MongoQueueStore")
+    args = parser.parse_args()
+
+    stores = [("memory", MemoryQueueStore)]
+    if args.mongo:
+        db = bench_db()
+
+        def mongo_store():
+            db.WaitingQueue.drop()
+            db.Counts.delete_one({"_id": MongoQueueStore.STATE_ID})
+            db.WaitingQueue.create_index([("status", 1), ("_id", 1)])
+            db.WaitingQueue.create_index([("status", 1), ("people", -1), ("_id", 1)])
+            db.WaitingQueue.create_index([("status", 1), ("created_at", 1)])
+            return MongoQueueStore(db.WaitingQueue, db.Counts)
+
+        stores.append(("mongo", mongo_store))
+
+    rows = []
+    for name, make_store in stores:
+        for size in args.sizes:
+            rounds = args.rounds if name == "memory" else min(args.rounds, 500)
+            result = run(make_store(), size, rounds)
+            rows.append(dict({"store": name, "waiting": size}, **{f"{op} us": value for op, value in result.items()}))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse, json, resource, selectors, socket, threading, time
+from datetime import datetime
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+from bench.common import percentiles, print_table
+
+"""
+候位推播的大量訂閱測試（user-023）
+- 預設在同一個行程內量測 QueueBroadcaster（MemoryQueueStore，不需要 MongoDB）：
+  N 個訂閱者各一條執行緒讀取 subscribe()，每次異動後量測所有訂閱者收到新版本的時間，並確認每次異動只讀取、編碼一次
+- --url：連到執行中的推播服務（stream_wsgi:app），以單一行程的 selectors 維持 N 條 /queue/stream 連線，
+  每隔 --interval 秒以 --control-url 的 POST /queue/take 取號，量測各連線收到新事件的延遲與被拒絕（503）的連線數
+  （跨行程的異動由推播服務每 QUEUE_STREAM_POLL_SECONDS 輪詢一次，延遲約為輪詢間隔）
+
+    python -m bench.sse_subscribers --subscribers 100 1000 2000
+    python -m bench.sse_subscribers --url http://127.0.0.1:8001 --control-url http://127.0.0.1:8000 --subscribers 5000
+"""
+
+
+class CountingStore:
+    """包裝候位資料，計算 info() 次數（每次 info() 對應一次編碼）"""
+
+    def __init__(self, store):
+        self.store = store
+        self.info_calls = 0
+
+    def info(self, queue_number=None):
+        self.info_calls += 1
+        return self.store.info(queue_number)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def bench_inprocess(subscribers, changes):
+    from waiting.queue_store import MemoryQueueStore
+    from waiting.queue_stream import QueueBroadcaster
+
+    store = CountingStore(MemoryQueueStore())
+    broadcaster = QueueBroadcaster(store)
+    broadcaster.publish()
+    received = {}   # 版本 -> 各訂閱者收到的時間
+    condition = threading.Condition()
+    stopped = threading.Event()
+
+    def subscriber():
+        for event in broadcaster.subscribe(heartbeat=0.2):
+            if stopped.is_set():
+                return
+            if event.startswith(b":"):
+                continue
+            version = int(event.split(b"\n", 1)[0][4:])
+            with condition:
+                received.setdefault(version, []).append(time.perf_counter())
+                condition.notify_all()
+
+    threads = [threading.Thread(target=subscriber, daemon=True) for _ in range(subscribers)]
+    for thread in threads:
+        thread.start()
+    with condition:   # 等所有訂閱者收到初始版本
+        condition.wait_for(lambda: len(received.get(broadcaster.version, ())) == subscribers, timeout=60)
+
+    latencies, publish_seconds = [], []
+    info_calls = store.info_calls
+    for _ in range(changes):
+        store.take({"name": None, "phone": None, "people": 2, "source": "onsite", "created_at": datetime.utcnow()})
+        started = time.perf_counter()
+        broadcaster.publish()
+        publish_seconds.append(time.perf_counter() - started)
+        version = broadcaster.version
+        with condition:
+            condition.wait_for(lambda: len(received.get(version, ())) == subscribers, timeout=60)
+            arrivals = list(received.get(version, ()))
+        latencies.extend(arrival - started for arrival in arrivals)
+    stopped.set()
+    fanout = percentiles(latencies)
+    return {"mode": "in-process", "subscribers": subscribers, "changes": changes,
+            "encodes/change": (store.info_calls - info_calls) / changes,
+            "publish_ms": percentiles(publish_seconds)["p50_ms"],
+            "p50_ms": fanout["p50_ms"], "p99_ms": fanout["p99_ms"], "max_ms": max(latencies) * 1000, "rejected": 0}
+
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+def bench_http(url, control_url, subscribers, changes, interval):
+    """以 selectors 維持 subscribers 條串流連線，取號後量測各連線收到新事件的時間"""
+    raise_fd_limit(subscribers + 64)
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    request = (f"GET /queue/stream HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: text/event-stream\r\n\r\n").encode()
+    selector = selectors.DefaultSelector()
+    streams = []   # 每條連線：{"status", "buffer", "events": [(時間, 版本)]}
+    for _ in range(subscribers):
+        sock = socket.create_connection((host, port))
+        sock.sendall(request)
+        sock.setblocking(False)
+        state = {"status": None, "buffer": b"", "events": []}
+        streams.append(state)
+        selector.register(sock, selectors.EVENT_READ, state)
+
+    stopped = threading.Event()
+
+    def read_loop():
+        while not stopped.is_set():
+            for key, _ in selector.select(timeout=0.1):
+                state = key.data
+                try:
+                    data = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                now = time.perf_counter()
+                if not data:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    continue
+                buffer = state["buffer"] + data
+                if state["status"] is None and b"\r\n" in buffer:
+                    state["status"] = int(buffer.split(b" ", 2)[1])
+                # 逐行找 "id: 版本"（chunked 的長度行不會含有 "id: "）
+                lines = buffer.split(b"\n")
+                state["buffer"] = lines.pop()
+                for line in lines:
+                    if line.startswith(b"id: "):
+                        state["events"].append((now, int(line[4:].strip())))
+
+    reader = threading.Thread(target=read_loop, daemon=True)
+    reader.start()
+    time.sleep(max(interval, 2))   # 等連線建立、收到初始事件
+
+    sent_at = []
+    for _ in range(changes):
+        body = json.dumps({"people": 2, "source": "onsite"}).encode()
+        sent_at.append(time.perf_counter())
+        urlopen(Request(f"{control_url}/queue/take", data=body, headers={"Content-Type": "application/json"}), timeout=10).read()
+        time.sleep(interval)
+    time.sleep(interval)
+    stopped.set()
+    reader.join()
+
+    accepted = [state for state in streams if state["status"] == 200]
+    latencies = []
+    for started in sent_at:
+        for state in accepted:
+            arrival = next((at for at, _ in state["events"] if at >= started), None)
+            if arrival is not None:
+                latencies.append(arrival - started)
+    fanout = percentiles(latencies or [0])
+    return {"mode": "http", "subscribers": subscribers, "changes": changes, "encodes/change": None, "publish_ms": None,
+            "p50_ms": fanout["p50_ms"], "p99_ms": fanout["p99_ms"], "max_ms": max(latencies or [0]) * 1000,
+            "rejected": subscribers - len(accepted)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[100, 1000, 2000])
+    parser.add_argument("--changes", type=int, default=20)
+    parser.add_argument("--url", help="stream server base URL (stream_wsgi:app)")
+    parser.add_argument("--control-url", default="http://127.0.0.1:8000", help="main app base URL used for POST /queue/take")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between changes in --url mode")
+    args = parser.parse_args()
+
+    rows = []
+    for subscribers in args.subscribers:
+        if args.url:
+            rows.append(bench_http(args.url.rstrip("/"), args.control_url.rstrip("/"), subscribers, args.changes, args.interval))
+        else:
+            rows.append(bench_inprocess(subscribers, args.changes))
+        print_table(rows[-1:])
+    print()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
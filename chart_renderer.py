@@ -0,0 +1,102 @@
+import io, os, multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from cachetools import TTLCache
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+"""
+收入支出趨勢圖
+- 使用 matplotlib 物件導向 API（不共用 pyplot 全域狀態），直接輸出到記憶體
+- 在獨立的行程池中繪圖，不佔用請求執行緒
+- 資料點過多時改以每日加總繪製
+- 依 (起訖時間, 圖表類型) 快取圖片
+"""
+
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))   # 繪圖行程數
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))   # 超過此點數改為每日加總
+CHART_CACHE_TTL = int(os.getenv("CHART_CACHE_TTL", "300"))   # 圖片快取秒數
+
+
+def aggregate_by_day(points):
+    """將 (時間, 金額) 依日期加總"""
+    totals = defaultdict(int)
+    for when, value in points:
+        totals[when.date()] += value
+    return sorted(totals.items())
+
+
+def render_trend_chart(revenues, expenses, chart_type="line"):
+    """
+    繪製趨勢圖並回傳 PNG bytes
+    revenues / expenses 為 (時間, 金額) 的 list
+    """
+    if len(revenues) > CHART_MAX_POINTS or len(expenses) > CHART_MAX_POINTS:
+        revenues = aggregate_by_day(revenues)
+        expenses = aggregate_by_day(expenses)
+
+    revenues_dates = [when for when, _ in revenues]
+    revenues_values = [value for _, value in revenues]
+    expenses_dates = [when for when, _ in expenses]
+    expenses_values = [value for _, value in expenses]
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if chart_type == "line":
+        ax.plot(revenues_dates, revenues_values, label="Revenue", color="green", marker="o")
+        ax.plot(expenses_dates, expenses_values, label="Expense", color="red", marker="o")
+    elif chart_type == "bar":
+        ax.bar(revenues_dates, revenues_values, label="Revenue", color="green", alpha=0.7)
+        ax.bar(expenses_dates, expenses_values, label="Expense", color="red", alpha=0.7)
+
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Amount")
+    ax.set_title("Revenue & Expenses")
+    ax.tick_params(axis="x", labelrotation=45)   # 旋轉 X 軸標籤以避免重疊
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+
+    output = io.BytesIO()
+    fig.savefig(output, format="png")
+    return output.getvalue()
+
+
+class ChartRenderer:
+    def __init__(self, workers=CHART_WORKERS, cache_ttl=CHART_CACHE_TTL):
+        self.workers = workers
+        self.cache = TTLCache(maxsize=256, ttl=cache_ttl)
+        self.lock = Lock()
+        self.executor = None
+        self.pid = None
+
+    def _get_executor(self):
+        # 行程池在第一次使用時才建立（fork 後的 worker 各自建立），子行程以 spawn 啟動
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self.pid = os.getpid()
+            return self.executor
+
+    def render(self, revenues, expenses, chart_type="line"):
+        """在行程池中繪圖，回傳 PNG bytes"""
+        return self._get_executor().submit(render_trend_chart, revenues, expenses, chart_type).result()
+
+    def get(self, key, load_data):
+        """
+        依 key 取得快取圖片，沒有時呼叫 load_data() 取得 (revenues, expenses, chart_type) 後繪圖
+        """
+        with self.lock:
+            image = self.cache.get(key)
+        if image is None:
+            image = self.render(*load_data())
+            with self.lock:
+                self.cache[key] = image
+        return image
+
+
+chart_renderer = ChartRenderer()
@@ -1,11 +1,17 @@
 from datetime import datetime, timedelta
-from mongoDB import get_user_collection, get_coupons_collection
+from mongoDB import get_coupons_collection
 import random
 from flask import request, jsonify
 from datetime import datetime
+from json_response import json_response, EncodedResultCache
+from db_indexes import register_index, register_query
+from points.points_sys import change_points, PointsUserNotFound, InsufficientPoints
 
-users_collection = get_user_collection()
 coupons_collection = get_coupons_collection()
+register_index("Coupons", [("user_id", 1), ("status", 1)])   # 會員優惠券、下單領用
+register_query("user coupons", "Coupons", {"user_id": "abcd1234"})
+
+coupons_result_cache = EncodedResultCache("coupons")  # 優惠券列表快取，優惠券異動時需 invalidate()
 
 def generate_coupon_code():
     """生成 10 位數的隨機優惠券碼"""
@@ -29,6 +35,7 @@ def delete_coupon_sys(coupon_id):
 
     # 從資料庫刪除該優惠券
     coupons_collection.delete_one({"_id": coupon_id})
+    coupons_result_cache.invalidate()
 
     return jsonify({"message": "Coupon deleted successfully"}), 200
 
@@ -42,51 +49,62 @@ def create_coupon_sys():
 
     if not user_id or not discount or not cost:
         return jsonify({"error": "Missing required fields"}), 400
-    
-    # 檢查會員是否存在
-    user = users_collection.find_one({"_id": user_id})
-    if not user:
-        return jsonify({"error": "找不到該會員"}), 404
-    
-    # 確保會員點數足夠
-    user_points = user.get("points", 0)
-    if user_points < cost:
-        return jsonify({"error": "會員點數不足"}), 400
+    try:
+        discount, cost = int(discount), int(cost)
+    except (TypeError, ValueError):
+        return jsonify({"error": "discount and cost must be integers"}), 400
+    if cost <= 0:
+        return jsonify({"error": "cost must be positive"}), 400
 
     # 產生優惠券代碼
     coupon_code = generate_coupon_code()
-    
-    # 設定有效期限 (默認 30 天後過期)
-    now = datetime.now()
-    expiration_date = now + timedelta(days=30)
 
-    # 優惠券資料
-    coupon = {
-        "_id": str(coupon_code),
-        "user_id": str(user_id),
-        "discount": int(discount),
-        "cost": int(cost),
-        "status": "active",  # 預設為可用狀態
-        "created_at": now,
-        "expiration_date": expiration_date
-    }
+    # 先扣除會員點數（點數不足時不會扣）
+    try:
+        change_points(user_id, -cost, "coupon_redeem", ref=str(coupon_code))
+    except PointsUserNotFound:
+        return jsonify({"error": "找不到該會員"}), 404
+    except InsufficientPoints:
+        return jsonify({"error": "會員點數不足"}), 400
 
-    # 插入優惠券到資料庫
+    # 扣點後任何一步失敗都退回點數
     try:
+        # 設定有效期限 (默認 30 天後過期)
+        now = datetime.now()
+        expiration_date = now + timedelta(days=30)
+
+        # 優惠券資料
+        coupon = {
+            "_id": str(coupon_code),
+            "user_id": str(user_id),
+            "discount": discount,
+            "cost": cost,
+            "status": "active",  # 預設為可用狀態
+            "created_at": now,
+            "expiration_date": expiration_date
+        }
+
+        # 插入優惠券到資料庫
         coupons_collection.insert_one(coupon)
-        # 扣除會員點數
-        users_collection.update_one({"_id": user_id}, {"$inc": {"points": -cost}})
     except Exception as e:
+        # 優惠券建立失敗，退回點數
+        change_points(user_id, cost, "coupon_redeem_refund", ref=str(coupon_code))
         return jsonify({"error": "Failed to create coupon", "details": str(e)}), 500
 
+    # 優惠券已建立，清除快取失敗時不退點（優惠券列表在下次異動前可能未更新）
+    try:
+        coupons_result_cache.invalidate()
+    except Exception as e:
+        print(f"coupon cache invalidate failed: {e}")
+
     return jsonify({"message": "Coupon created successfully", "coupon": coupon}), 201
 
 def get_all_coupons_sys():
     """取得所有優惠券（管理員用）"""
-    try:
+    def build():
         # 從資料庫取得所有優惠券資料
-        coupons = list(coupons_collection.find())
-        
+        coupons = coupons_collection.find()
+
         # 將資料轉換為 JSON 格式
         coupon_list = [{
             "_id": str(coupon["_id"]),
@@ -97,8 +115,11 @@ def get_all_coupons_sys():
             "created_at": coupon.get("created_at"),
             "expiration_date": coupon.get("expiration_date")
         } for coupon in coupons]
-        
-        return jsonify({"coupons": coupon_list}), 200
+        return {"coupons": coupon_list}
+
+    try:
+        # 優惠券未異動時直接回傳已編碼的結果
+        return json_response(coupons_result_cache.get(build), 200)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -124,6 +145,7 @@ def update_coupon_sys(coupon_id):
     if result.matched_count == 0:
         return jsonify({"error": "Coupon not found"}), 404
     elif result.modified_count > 0:
+        coupons_result_cache.invalidate()
         return jsonify({"message": "Coupon updated successfully", "updated_fields": update_fields}), 200
     else:
         return jsonify({"message": "No changes made"}), 200
@@ -181,6 +203,7 @@ def create_admin_coupon_sys():
     # 插入優惠券到資料庫
     try:
         coupons_collection.insert_one(coupon)
+        coupons_result_cache.invalidate()
     except Exception as e:
         return jsonify({"error": "新增優惠券失敗", "details": str(e)}), 500
 
@@ -216,6 +239,7 @@ def bind_coupon_sys():
     )
 
     if result.modified_count > 0:
+        coupons_result_cache.invalidate()
         return jsonify({"message": "Coupon successfully bound to user"}), 200
     else:
         return jsonify({"error": "Failed to bind coupon"}), 500
\ No newline at end of file
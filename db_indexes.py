@@ -0,0 +1,93 @@
+import importlib, sys
+from pymongo.errors import PyMongoError
+from mongoDB import db
+
+"""
+索引登記表
+- 各子系統在模組載入時以 register_index 登記所需索引，以 register_query 登記常用查詢
+- apply_indexes()：建立所有登記的索引（已存在則略過，可重複執行）
+- explain_queries()：以 explain() 檢查登記的查詢是否走索引（IXSCAN）而非全表掃描（COLLSCAN）
+
+命令列：
+    python -m db_indexes apply     建立索引
+    python -m db_indexes explain   檢查常用查詢的執行計畫
+"""
+
+# 登記索引與查詢的模組（命令列執行時需先載入）
+INDEX_MODULES = [
+    "backend",
+]
+
+registered_indexes = []   # (集合, keys, options)
+registered_queries = []   # (名稱, 集合, filter, sort)
+
+
+def register_index(collection, keys, **options):
+    """登記索引，keys 可為欄位名稱或 [(欄位, 方向), ...]"""
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    registered_indexes.append((collection, list(keys), options))
+
+
+def register_query(name, collection, filter, sort=None):
+    """登記需走索引的常用查詢（filter 中放範例值即可）"""
+    registered_queries.append((name, collection, filter, sort))
+
+
+def apply_indexes():
+    """建立所有登記的索引，回傳 (成功的索引名稱, 失敗訊息)"""
+    created, failed = [], []
+    for collection, keys, options in registered_indexes:
+        try:
+            created.append(f"{collection}.{db[collection].create_index(keys, **options)}")
+        except PyMongoError as e:   # 例如既有資料違反 unique，不影響其他索引
+            failed.append(f"{collection} {keys}: {e}")
+    for message in failed:
+        print(f"create index failed: {message}")
+    return created, failed
+
+
+def _stages(plan):
+    """列出執行計畫中的所有 stage"""
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+def explain_queries():
+    """回傳 [(查詢名稱, 執行計畫 stage 列表, 是否走索引)]"""
+    results = []
+    for name, collection, filter, sort in registered_queries:
+        cursor = db[collection].find(filter)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = [stage for stage in _stages(plan) if stage]
+        results.append((name, stages, "COLLSCAN" not in stages))
+    return results
+
+
+if __name__ == "__main__":
+    for module in INDEX_MODULES:
+        importlib.import_module(module)
+    # 各模組登記在 db_indexes 模組（非 __main__）上，改用該模組的函式
+    registry = importlib.import_module("db_indexes")
+    apply_indexes, explain_queries = registry.apply_indexes, registry.explain_queries
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "apply"
+    if command == "apply":
+        created, failed = apply_indexes()
+        print(f"{len(created)} indexes ensured, {len(failed)} failed")
+        sys.exit(1 if failed else 0)
+    elif command == "explain":
+        apply_indexes()
+        results = explain_queries()
+        for name, stages, ok in results:
+            print(f"{'OK  ' if ok else 'SCAN'} {name}: {' <- '.join(stages)}")
+        sys.exit(0 if all(ok for _, _, ok in results) else 1)
+    else:
+        print("usage: python -m db_indexes [apply|explain]")
+        sys.exit(2)
@@ -0,0 +1,111 @@
+import csv, gzip, io, time
+from tempfile import SpooledTemporaryFile
+from openpyxl import Workbook
+
+"""
+報表匯出（串流寫入，記憶體用量固定）
+- xlsx：openpyxl write-only 模式逐列寫入
+- csv / csv.gz：逐列寫入，gzip 邊寫邊壓縮；CSV 沒有工作表，所有資料統一為 type, timestamp, amount 三欄
+- 輸出寫到 SpooledTemporaryFile，超過 SPOOL_MAX_SIZE 後改寫到暫存檔
+- ExportProgress 記錄已寫入的列數與位元組數
+"""
+
+SPOOL_MAX_SIZE = 8 * 1024 * 1024   # 輸出檔超過 8MB 後改寫到磁碟
+CSV_HEADER = ["type", "timestamp", "amount"]   # type 為工作表名稱
+
+FORMATS = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "report.xlsx"),
+    "csv": ("text/csv", "report.csv"),
+    "csv.gz": ("application/gzip", "report.csv.gz"),
+}
+
+
+class ExportProgress:
+    """匯出進度（列數、位元組數）"""
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "elapsed": round((self.finished_at or time.time()) - self.started_at, 3),
+            "finished": self.finished_at is not None,
+        }
+
+
+class CountingWriter(io.RawIOBase):
+    """包裝輸出檔，累計寫入的位元組數"""
+
+    def __init__(self, raw, progress):
+        self.raw = raw
+        self.progress = progress
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        written = self.raw.write(data)
+        self.progress.bytes += len(data)
+        return written
+
+
+def _rows(sheet_rows, progress):
+    """將 dict 逐筆轉為 list（第一列為欄位名稱，以第一筆資料的欄位為準）"""
+    header = None
+    for doc in sheet_rows:
+        doc.pop("_id", None)
+        if header is None:
+            header = list(doc.keys())
+            yield header
+        yield [doc.get(key) for key in header]
+        progress.rows += 1
+
+
+def _write_xlsx(output, sheets, progress):
+    workbook = Workbook(write_only=True)
+    for name, sheet_rows, _ in sheets:
+        worksheet = workbook.create_sheet(title=name)
+        for row in _rows(sheet_rows, progress):
+            worksheet.append(row)
+    workbook.save(CountingWriter(output, progress))
+
+
+def _write_csv(output, sheets, progress, compress=False):
+    raw = CountingWriter(output, progress)
+    binary = gzip.GzipFile(fileobj=raw, mode="wb") if compress else raw
+    text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(CSV_HEADER)
+    for name, sheet_rows, (time_field, amount_field) in sheets:
+        for doc in sheet_rows:
+            writer.writerow([name, doc.get(time_field), doc.get(amount_field)])
+            progress.rows += 1
+    text.flush()
+    text.detach()
+    if compress:
+        binary.close()
+
+
+def export_report(sheets, fmt="xlsx", progress=None):
+    """
+    sheets：[(工作表名稱, 可迭代的 dict 資料 / MongoDB cursor, (時間欄位, 金額欄位)), ...]
+    xlsx 每個工作表保留原本的欄位；CSV 以時間、金額欄位寫成 CSV_HEADER 的格式
+    回傳 (檔案物件, mimetype, 檔名)
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid format. Allowed values are {list(FORMATS)}")
+    progress = progress or ExportProgress()
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    if fmt == "xlsx":
+        _write_xlsx(output, sheets, progress)
+    else:
+        _write_csv(output, sheets, progress, compress=(fmt == "csv.gz"))
+    progress.finished_at = time.time()
+    output.seek(0)
+    mimetype, filename = FORMATS[fmt]
+    return output, mimetype, filename
@@ -1,10 +1,9 @@
-import uuid, io, openpyxl, matplotlib, os, requests
-import pandas as pd
-import matplotlib.pyplot as plt
+import uuid, io, openpyxl, os, requests, threading
 import qrcode
 from io import BytesIO
 from datetime import datetime
-from mongoDB import get_user_collection
+from mongoDB import get_user_collection, reserve_sequence_block
+from chart_renderer import chart_renderer
 from flask import request, jsonify
 from dotenv import load_dotenv
 
@@ -18,8 +17,7 @@ IMGUR_API_URL = os.getenv("IMGUR_API_URL")
 IMGUR_CLIENT_SECRET = os.getenv("IMGUR_CLIENT_SECRET")
 IMGUR_ACCESS_TOKEN = os.getenv("IMGUR_ACCESS_TOKEN")
 """generate_order_id"""
-current_date = None # 用來存儲當天的日期
-sequence_number = 0 # 用來存儲當天的序號
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "20"))  # 每次向資料庫預留的序號數量
 
 
 """ userID """
@@ -35,6 +33,21 @@ def format_user_data(user):
         "points":user.get("points", 0)
     }
 
+""" 日期參數 """
+def parse_date_arg(value):
+    """日期參數可為 YYYY-MM-DD、YYYY-MM-DD HH:MM:SS 或 ISO 8601"""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid date format: {value}")
+
+
 """ 計算總額 """
 def total(data, key):
     return sum(item[key] for item in data)
@@ -42,49 +55,44 @@ def total(data, key):
 
 
 """ 收入支出趨勢圖 """
-matplotlib.use('Agg')  # 設置無需 GUI 的後端
 def generate_trend_chart(revenues, expenses, chart_type="line"):   # 生成趨勢圖
-    revenues_dates=[item["updated_at"] for item in revenues]
-    revenues_values=[item["total_price"] for item in revenues]
-
-    expenses_dates=[item["created_time"] for item in expenses]
-    expenses_values=[item["amount"] for item in expenses]
-    # 繪製圖表
-    plt.figure(figsize=(10, 6))
-    if chart_type=="line":
-        plt.plot(revenues_dates, revenues_values, label="Revenue", color="green", marker="o")
-        plt.plot(expenses_dates, expenses_values, label="Expense", color="red", marker="o")
-    elif chart_type=="bar":
-        plt.bar(revenues_dates, revenues_values, label="Revenue", color="green", alpha=0.7)
-        plt.bar(expenses_dates, expenses_values, label="Expense", color="red",alpha=0.7)
-    
-    plt.xlabel("Date")
-    plt.ylabel("Amount")
-    plt.title(f"Revenue & Expenses")
-    plt.xticks(rotation=45)   # 旋轉 X 軸標籤以避免重疊
-    plt.legend()
-    plt.grid(True)
+    revenues_points=[(item["updated_at"], item["total_price"]) for item in revenues]
+    expenses_points=[(item["created_time"], item["amount"]) for item in expenses]
+    # 於背景行程池繪圖，回傳記憶體中的 PNG
+    return io.BytesIO(chart_renderer.render(revenues_points, expenses_points, chart_type))
 
-    # 儲存圖表
-    file_name=f"trend_chart.png"
-    chart_path=os.path.join(os.getcwd(), file_name)
-    plt.savefig(chart_path)
-    plt.close()
-    return chart_path
 
+class SequenceAllocator:
+    """
+    每日序號分配器（多 worker 共用不重複）
+    - 每次向 Counts 集合 $inc 預留 block_size 個序號，之後直接從記憶體發號
+    - 跨日或預留的序號用完才再向資料庫預留
+    - fork 後的子行程會丟棄父行程留下的序號段，避免重複
+    """
+
+    def __init__(self, counter_name, block_size=ID_BLOCK_SIZE):
+        self.counter_name = counter_name
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.date_part = None  # 目前序號段所屬日期
+        self.next_value = 0    # 下一個可用序號
+        self.last_value = 0    # 序號段的最後一號
+        self.pid = None        # 序號段所屬行程
 
+    def next(self, date_part):
+        with self.lock:
+            if self.date_part != date_part or self.pid != os.getpid() or self.next_value > self.last_value:
+                self.last_value = reserve_sequence_block(self.counter_name, date_part, self.block_size)
+                self.next_value = self.last_value - self.block_size + 1
+                self.date_part = date_part
+                self.pid = os.getpid()
+            value = self.next_value
+            self.next_value += 1
+            return value
 
-""" 匯出 收入與支出excel """
-def export_to_excel(Revenues, Expenses):
-    df_Revenues=pd.DataFrame(Revenues)
-    df_Expenses=pd.DataFrame(Expenses)
 
-    output=io.BytesIO()   #寫入excell
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df_Revenues.to_excel(writer, index=False, sheet_name="Revenues")
-        df_Expenses.to_excel(writer, index=False, sheet_name="Expenses")
-    output.seek(0)
-    return output
+order_sequence = SequenceAllocator("order_id")
+reservation_sequence = SequenceAllocator("reservation_id")
 
 
 def generate_order_id():
@@ -100,18 +108,12 @@ def generate_order_id():
     結果會出現如下
     2412311114001
     """
-    global current_date, sequence_number
-
     # 取得當前日期和時間（時區 UTC+8）
     now = datetime.now()
     date_part = now.strftime('%y%m%d') # 提取日期部分，例如 "241231"
     time_part = now.strftime('%H%M')   # 提取時間部分，例如 "1114"
 
-    if current_date != date_part:  # 檢查是否是新的一天
-        current_date = date_part   # 更新為新的日期
-        sequence_number = 0        # 重置當天序號
-
-    sequence_number += 1
+    sequence_number = order_sequence.next(date_part)  # 當天序號，跨日由分配器重置
     menber = f"{sequence_number:03}" # 格式化為 3 位數字，例如 "001"
 
     order_id = f"{date_part}{time_part}{menber}"
@@ -119,18 +121,12 @@ def generate_order_id():
 
 def generate_reservation_id():
     '''會員預約id'''
-    global current_date, sequence_number
-
     # 取得當前日期和時間（時區 UTC+8）
     now = datetime.now()
     date_part = now.strftime('%y%m%d') # 提取日期部分，例如 "241231"
     time_part = now.strftime('%H%M')   # 提取時間部分，例如 "1114"
 
-    if current_date != date_part:  # 檢查是否是新的一天
-        current_date = date_part   # 更新為新的日期
-        sequence_number = 0        # 重置當天序號
-
-    sequence_number += 1
+    sequence_number = reservation_sequence.next(date_part)  # 與訂單分開計數
     menber = f"{sequence_number:02}" # 格式化為 2 位數字，例如 "01"
 
     reservation_id = f"{date_part}{time_part}{menber}"
@@ -0,0 +1,38 @@
+import multiprocessing, os
+
+"""
+gunicorn 設定（正式環境）
+啟動：gunicorn -c gunicorn.conf.py wsgi:app
+所有設定皆可由環境變數覆寫
+"""
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+
+# worker 與執行緒數：預設 CPU 數 * 2 + 1 個 worker，每個 worker 4 個執行緒
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"   # /queue/stream 每條串流佔用一個執行緒，大量訂閱改由 stream_wsgi:app 另開行程
+
+# 預先載入 app（路由、設定、索引建立只在 master 執行一次）
+# MongoDB 連線在各 worker 第一次使用時才建立（見 mongoDB.get_client）
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# 連線保持與逾時
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# 處理一定數量的請求後重啟 worker，避免記憶體持續增長；加上隨機值避免同時重啟
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-")
+errorlog = os.getenv("GUNICORN_ERRORLOG", "-")
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+
+def post_fork(server, worker):
+    """fork 後確認 worker 不沿用 master 的 MongoDB 連線"""
+    import mongoDB
+    mongoDB.get_client()
+    server.log.info(f"worker {worker.pid}: MongoDB client created after fork")
@@ -0,0 +1,99 @@
+import hmac, ipaddress, os, time
+from flask import Blueprint, Response, jsonify, request, send_file
+from mongoDB import get_client, client_options
+from mongo_monitoring import pool_metrics, command_metrics
+from request_metrics import request_metrics
+from request_profiler import list_profiles, get_profile_path
+
+
+# 建立 Blueprint（內部監控用）
+internal_bp = Blueprint('internal', __name__)
+
+# 設定 INTERNAL_METRICS_TOKEN 後，需帶 X-Internal-Token 標頭才能存取
+# 未設定時只允許本機直接連線（經反向代理轉送的請求一律拒絕），避免 /internal/profiles 等路由對外公開
+INTERNAL_METRICS_TOKEN = os.getenv('INTERNAL_METRICS_TOKEN')
+FORWARDED_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+
+
+def is_local_request():
+    """請求直接來自本機（loopback），且沒有反向代理轉送的標頭"""
+    if any(request.headers.get(name) for name in FORWARDED_HEADERS):
+        return False
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    if getattr(address, 'ipv4_mapped', None):
+        address = address.ipv4_mapped
+    return address.is_loopback
+
+
+@internal_bp.before_request
+def check_internal_token():
+    if INTERNAL_METRICS_TOKEN:
+        token = request.headers.get('X-Internal-Token', '')
+        if not hmac.compare_digest(token.encode(), INTERNAL_METRICS_TOKEN.encode()):
+            return jsonify({'error': 'Forbidden'}), 403
+    elif not is_local_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+
+def mongo_prometheus_lines():
+    """連線池與指令統計轉為 Prometheus text 格式"""
+    lines = ['# TYPE mongodb_pool_connections gauge']
+    pools = pool_metrics.snapshot()
+    for address, stats in pools.items():
+        lines.append(f'mongodb_pool_connections{{address="{address}",state="open"}} {stats["connections_open"]}')
+        lines.append(f'mongodb_pool_connections{{address="{address}",state="in_use"}} {stats["connections_in_use"]}')
+    lines.append('# TYPE mongodb_pool_checkout_wait_seconds_total counter')
+    for address, stats in pools.items():
+        lines.append(f'mongodb_pool_checkout_wait_seconds_total{{address="{address}"}} {stats["wait_seconds_total"]}')
+    commands = command_metrics.snapshot()
+    lines.append('# TYPE mongodb_commands_total counter')
+    for name, stats in sorted(commands.items()):
+        lines.append(f'mongodb_commands_total{{command="{name}"}} {stats["count"]}')
+    lines.append('# TYPE mongodb_command_seconds_total counter')
+    for name, stats in sorted(commands.items()):
+        lines.append(f'mongodb_command_seconds_total{{command="{name}"}} {stats["seconds_total"]}')
+    return lines
+
+
+# 各路由請求統計、連線池與指令統計（本 worker）
+# 預設為 Prometheus text 格式，?format=json 回傳 JSON
+@internal_bp.route('/metrics', methods=['GET'])
+def metrics():
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'pid': os.getpid(),
+            'client_options': client_options(),
+            'pools': pool_metrics.snapshot(),
+            'commands': command_metrics.snapshot(),
+        })
+    body = request_metrics.render_prometheus() + '\n'.join(mongo_prometheus_lines()) + '\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+# 請求分析結果列表（各 worker 共用 PROFILE_DIR）
+@internal_bp.route('/profiles', methods=['GET'])
+def profiles():
+    return jsonify({'profiles': list_profiles()}), 200
+
+
+# 下載 flame graph 用的 folded stacks
+@internal_bp.route('/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    path = get_profile_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=f'{profile_id}.folded')
+
+
+# 健康檢查：ping MongoDB
+@internal_bp.route('/health', methods=['GET'])
+def health():
+    started = time.perf_counter()
+    try:
+        get_client().admin.command('ping')
+    except Exception as e:
+        return jsonify({'status': 'error', 'mongo': str(e)}), 503
+    return jsonify({'status': 'ok', 'mongo_ping_ms': round((time.perf_counter() - started) * 1000, 2)}), 200
@@ -0,0 +1,221 @@
+import hashlib, json, os, shutil, socket, tempfile, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import request, jsonify, send_file, url_for
+from mongoDB import get_jobs_collection
+from export_engine import ExportProgress
+from db_indexes import register_index
+
+"""
+背景工作（報表匯出等耗時請求）
+- 以 register_job_type 註冊工作類型，runner(params, progress) 回傳 (檔案物件, mimetype, 下載檔名)
+- 工作狀態存在 Jobs 集合：queued → running → done / failed
+- 產出檔存在 JOB_ARTIFACT_DIR，相同類型與參數的工作在 JOB_CACHE_TTL 內直接沿用
+- 工作記錄所屬行程（owner）與心跳時間（heartbeat_at），行程內背景執行緒每 JOB_HEARTBEAT_SECONDS 更新一次
+  queued / running 的工作超過 JOB_STALE_SECONDS 沒有心跳（worker 重啟或當掉）視為失敗，不再擋住相同工作的建立
+"""
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))   # 背景工作執行緒數
+JOB_CACHE_TTL = int(os.getenv("JOB_CACHE_TTL", "600"))   # 產出檔沿用秒數
+JOB_ARTIFACT_DIR = os.getenv("JOB_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "order_sys_jobs"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))   # 心跳更新間隔
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))   # 超過此秒數沒有心跳視為工作已中斷
+
+jobs_collection = get_jobs_collection()
+job_types = {}   # 工作類型 -> runner
+running_progress = {}   # 本行程執行中的工作進度 job_id -> ExportProgress
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+local_jobs = set()   # 本行程 queued / running 的工作（由心跳執行緒更新 heartbeat_at）
+local_jobs_lock = threading.Lock()
+heartbeat_pid = None   # 心跳執行緒所屬的行程（fork 後需重新啟動）
+
+register_index("Jobs", "cache_key")
+register_index("Jobs", "expires_at", expireAfterSeconds=0)   # 過期的工作紀錄自動刪除
+register_index("Jobs", [("status", 1), ("heartbeat_at", 1)])   # 找出沒有心跳的工作
+
+
+def register_job_type(name, runner):
+    """註冊工作類型"""
+    job_types[name] = runner
+
+
+def make_cache_key(job_type, params):
+    raw = json.dumps([job_type, params], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cleanup_artifacts():
+    """刪除超過沿用時間的產出檔"""
+    if not os.path.isdir(JOB_ARTIFACT_DIR):
+        return
+    deadline = time.time() - JOB_CACHE_TTL
+    for name in os.listdir(JOB_ARTIFACT_DIR):
+        path = os.path.join(JOB_ARTIFACT_DIR, name)
+        try:
+            if os.path.getmtime(path) < deadline:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def job_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _heartbeat():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with local_jobs_lock:
+            job_ids = list(local_jobs)
+        if not job_ids:
+            continue
+        try:
+            jobs_collection.update_many(
+                {"_id": {"$in": job_ids}, "status": {"$in": ["queued", "running"]}},
+                {"$set": {"heartbeat_at": datetime.now()}}
+            )
+        except Exception as e:
+            print(f"job heartbeat failed: {e}")
+
+
+def start_heartbeat():
+    """啟動心跳執行緒（每個行程各自啟動一次）"""
+    global heartbeat_pid
+    with local_jobs_lock:
+        if heartbeat_pid == os.getpid():
+            return
+        heartbeat_pid = os.getpid()
+        local_jobs.clear()   # fork 前父行程的工作不屬於本行程
+    threading.Thread(target=_heartbeat, name="job-heartbeat", daemon=True).start()
+
+
+def fail_stale_jobs(query):
+    """符合 query 且超過 JOB_STALE_SECONDS 沒有心跳的 queued / running 工作標記為失敗"""
+    now = datetime.now()
+    jobs_collection.update_many(
+        {**query, "status": {"$in": ["queued", "running"]}, "heartbeat_at": {"$lt": now - timedelta(seconds=JOB_STALE_SECONDS)}},
+        {"$set": {"status": "failed", "error": "worker lost", "finished_at": now}}
+    )
+
+
+def run_job(job_id, job_type, params):
+    progress = ExportProgress()
+    running_progress[job_id] = progress
+    jobs_collection.update_one({"_id": job_id}, {"$set": {"status": "running", "started_at": datetime.now()}})
+    try:
+        output, mimetype, download_name = job_types[job_type](params, progress)
+        os.makedirs(JOB_ARTIFACT_DIR, exist_ok=True)
+        artifact = os.path.join(JOB_ARTIFACT_DIR, job_id)
+        with open(artifact + ".tmp", "wb") as f:
+            shutil.copyfileobj(output, f)
+        os.replace(artifact + ".tmp", artifact)
+        output.close()
+        jobs_collection.update_one({"_id": job_id}, {"$set": {
+            "status": "done",
+            "artifact": artifact,
+            "mimetype": mimetype,
+            "download_name": download_name,
+            "progress": progress.to_dict(),
+            "finished_at": datetime.now()
+        }})
+    except Exception as e:
+        jobs_collection.update_one({"_id": job_id}, {"$set": {
+            "status": "failed",
+            "error": str(e),
+            "progress": progress.to_dict(),
+            "finished_at": datetime.now()
+        }})
+    finally:
+        running_progress.pop(job_id, None)
+        with local_jobs_lock:
+            local_jobs.discard(job_id)
+
+
+def submit_job(job_type, params):
+    """
+    建立背景工作，回傳 Jobs 文件
+    相同類型與參數的工作若仍在執行或產出檔仍可沿用，直接回傳該工作
+    """
+    if job_type not in job_types:
+        raise ValueError(f"Invalid job type. Allowed values are {list(job_types)}")
+
+    cache_key = make_cache_key(job_type, params)
+    fail_stale_jobs({"cache_key": cache_key})
+    now = datetime.now()
+    existing = jobs_collection.find_one(
+        {"cache_key": cache_key, "status": {"$in": ["queued", "running", "done"]}, "expires_at": {"$gt": now}},
+        sort=[("created_at", -1)]
+    )
+    if existing and (existing["status"] != "done" or os.path.exists(existing.get("artifact", ""))):
+        return existing
+
+    cleanup_artifacts()
+    job = {
+        "_id": uuid.uuid4().hex,
+        "type": job_type,
+        "params": params,
+        "cache_key": cache_key,
+        "status": "queued",
+        "owner": job_owner(),
+        "heartbeat_at": now,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=JOB_CACHE_TTL)
+    }
+    jobs_collection.insert_one(job)
+    start_heartbeat()
+    with local_jobs_lock:
+        local_jobs.add(job["_id"])
+    executor.submit(run_job, job["_id"], job_type, params)
+    return job
+
+
+def format_job(job):
+    """Jobs 文件轉為 API 回傳格式"""
+    data = {
+        "job_id": job["_id"],
+        "type": job["type"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "finished_at": job.get("finished_at"),
+        "progress": running_progress[job["_id"]].to_dict() if job["_id"] in running_progress else job.get("progress"),
+        "error": job.get("error")
+    }
+    if job["status"] == "done":
+        data["download_url"] = url_for("download_job", job_id=job["_id"])
+    return data
+
+
+def job_accepted(job_type, params):
+    """建立背景工作並回傳 202（供既有的匯出 API 在 async=true 時使用）"""
+    try:
+        job = submit_job(job_type, params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(format_job(job)), 202
+
+
+def submit_job_sys():
+    """建立背景工作：{"type": ..., "params": {...}}"""
+    data = request.json or {}
+    return job_accepted(data.get("type"), data.get("params") or {})
+
+
+def get_job_sys(job_id):
+    """查詢背景工作狀態"""
+    fail_stale_jobs({"_id": job_id})
+    job = jobs_collection.find_one({"_id": job_id})
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(format_job(job)), 200
+
+
+def download_job_sys(job_id):
+    """下載背景工作的產出檔"""
+    job = jobs_collection.find_one({"_id": job_id})
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": "Job is not finished", "status": job["status"]}), 409
+    if not os.path.exists(job.get("artifact", "")):
+        return jsonify({"error": "Job artifact has expired"}), 410
+    return send_file(job["artifact"], mimetype=job["mimetype"], as_attachment=True, download_name=job["download_name"])
@@ -0,0 +1,120 @@
+import json, os, threading, time
+from functools import lru_cache
+from datetime import date, datetime, timezone
+from bson import ObjectId # type: ignore
+from flask import Response # type: ignore
+from mongoDB import get_data_version, bump_data_version
+
+try:
+    import orjson # type: ignore
+except ImportError:   # 未安裝 orjson 時退回標準 json
+    orjson = None
+
+"""
+JSON 回應編碼
+- dumps：datetime 與 ObjectId 的格式與 flask.jsonify 相同，安裝 orjson 時使用 orjson 加速
+- EncodedResultCache：保存查詢結果編碼後的 bytes，資料版本未變時直接回傳
+- ndjson_response：逐筆串流 MongoDB cursor，記憶體用量與資料量無關
+"""
+
+RESULT_VERSION_POLL_SECONDS = float(os.getenv("RESULT_VERSION_POLL_SECONDS", "1"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))   # 匯出時每批從 MongoDB 取回的筆數
+
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+@lru_cache(maxsize=4096)
+def _http_day(ordinal):
+    day = date.fromordinal(ordinal)
+    return f"{_WEEKDAYS[day.weekday()]}, {day.day:02d} {_MONTHS[day.month - 1]} {day.year:04d}"
+
+
+def _http_date(value):
+    """
+    與 werkzeug.http.http_date（flask.jsonify）相同的日期格式，naive datetime 視為 UTC
+    日期部分依日快取、時間取 isoformat()，約為 http_date 的 1/4 時間（列表中每筆都有日期欄位，原本佔編碼時間的大部分）
+    """
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    elif value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return f"{_http_day(value.toordinal())} {value.isoformat()[11:19]} GMT"
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return _http_date(obj)   # 與 flask.jsonify 相同的日期格式
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _default_iso(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return _default(obj)
+
+
+def dumps(data, iso_dates=False):
+    """將資料編碼為 JSON bytes（iso_dates=True 時日期輸出為 ISO 8601）"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS if iso_dates else orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(data, default=_default, option=option)
+    default = _default_iso if iso_dates else _default
+    return json.dumps(data, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(body, status=200):
+    """以已編碼的 bytes（或尚未編碼的資料）建立 JSON 回應"""
+    if not isinstance(body, bytes):
+        body = dumps(body)
+    return Response(body, status=status, mimetype="application/json")
+
+
+def ndjson_response(cursor):
+    """將 cursor 以 newline-delimited JSON 串流回應（日期為 ISO 8601，可直接當作下次的 since）"""
+    def generate():
+        try:
+            for doc in cursor.batch_size(EXPORT_BATCH_SIZE):
+                yield dumps(doc, iso_dates=True) + b"\n"
+        finally:
+            cursor.close()
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+class EncodedResultCache:
+    """
+    依資料版本號快取編碼後的查詢結果（每個 worker 各自一份）
+    - 寫入端在資料異動後呼叫 invalidate() 遞增版本號
+    - 讀取時最多每 poll_interval 秒檢查一次版本號
+    """
+
+    def __init__(self, name, poll_interval=RESULT_VERSION_POLL_SECONDS):
+        self.name = name
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.version = None
+        self.body = None
+        self.checked_at = 0
+
+    def get(self, build):
+        """build() 回傳要編碼的資料，只在版本變更時才會被呼叫"""
+        if self.body is not None and time.monotonic() - self.checked_at < self.poll_interval:
+            return self.body
+
+        with self.lock:
+            if self.body is not None and time.monotonic() - self.checked_at < self.poll_interval:
+                return self.body
+            version = get_data_version(self.name)["sequence_value"]
+            if self.body is None or self.version != version:
+                self.body = dumps(build())
+                self.version = version
+            self.checked_at = time.monotonic()
+            return self.body
+
+    def invalidate(self):
+        bump_data_version(self.name)
+        with self.lock:
+            self.body = None
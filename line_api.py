@@ -4,11 +4,15 @@ import requests
 import jwt
 import datetime
 from mongoDB import find_line_user, create_line_user
+from db_indexes import register_index, register_query
 
 
 # 建立 Blueprint
 line_bp = Blueprint('line', __name__)
 
+register_index("LineUsers", "user_id", unique=True)
+register_query("line user", "LineUsers", {"user_id": "U1234567890"})
+
 # LINE 商家參數
 LINE_CHANNEL_ID = os.getenv('LINE_CHANNEL_ID')
 LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
@@ -0,0 +1,68 @@
+import os, threading, time
+from mongoDB import get_menu_collection, get_menu_version, bump_menu_version
+from json_response import dumps
+
+"""
+菜單快取（每個 worker 各自一份）
+- 以 Counts 中的 menu_version 作為版本號，菜單異動時遞增
+- 讀取時最多每 MENU_VERSION_POLL_SECONDS 秒檢查一次版本，版本變更才重新載入整份菜單
+"""
+
+MENU_VERSION_POLL_SECONDS = float(os.getenv("MENU_VERSION_POLL_SECONDS", "1"))
+
+menu_collection = get_menu_collection()
+
+
+class MenuSnapshot:
+    """某一版本的完整菜單"""
+
+    def __init__(self, version, updated_at, items):
+        self.version = version
+        self.updated_at = updated_at  # 最後異動時間（Last-Modified）
+        self.items = items
+        self.by_id = {item["_id"]: item for item in items}
+        self._encoded = None
+
+    @property
+    def encoded(self):
+        """編碼後的菜單 JSON（同一版本只編碼一次）"""
+        if self._encoded is None:
+            self._encoded = dumps(self.items)
+        return self._encoded
+
+    @property
+    def etag(self):
+        return f"menu-{self.version}"
+
+
+class MenuCache:
+    def __init__(self, poll_interval=MENU_VERSION_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.checked_at = 0  # 上次檢查版本號的時間
+
+    def get(self):
+        """取得目前菜單快照，必要時從資料庫重新載入"""
+        snapshot = self.snapshot
+        if snapshot is not None and time.monotonic() - self.checked_at < self.poll_interval:
+            return snapshot
+
+        with self.lock:
+            if self.snapshot is not None and time.monotonic() - self.checked_at < self.poll_interval:
+                return self.snapshot
+            version_doc = get_menu_version()
+            if self.snapshot is None or self.snapshot.version != version_doc["sequence_value"]:
+                items = list(menu_collection.find())
+                self.snapshot = MenuSnapshot(version_doc["sequence_value"], version_doc.get("updated_at"), items)
+            self.checked_at = time.monotonic()
+            return self.snapshot
+
+    def invalidate(self):
+        """遞增版本號並清除本地快取（其他 worker 於下次檢查時重新載入）"""
+        bump_menu_version()
+        with self.lock:
+            self.snapshot = None
+
+
+menu_cache = MenuCache()
@@ -3,6 +3,8 @@ from flask import request, jsonify
 from datetime import datetime
 from mongoDB import get_menu_collection
 from func import upload_image_to_imgur, delete_image_to_imgur
+from menu.menu_cache import menu_cache
+from json_response import json_response
 
 
 menu_collection = get_menu_collection()
@@ -16,10 +18,15 @@ def generate_unique_id():
 
 def get_menu_sys():
     try:
-        menu = list(menu_collection.find())
-        if not menu:
+        snapshot = menu_cache.get()  # 從快取取得菜單，版本未變不查資料庫
+        if not snapshot.items:
             return jsonify({"error": "Menu not found"}), 404
-        return jsonify(menu), 200
+
+        response = json_response(snapshot.encoded)  # 同一版本的菜單只編碼一次
+        response.set_etag(snapshot.etag)
+        if snapshot.updated_at:
+            response.last_modified = snapshot.updated_at
+        return response.make_conditional(request)  # 客戶端版本一致時回傳 304
     
     except Exception as e:
         return {"error": str(e)}
@@ -77,6 +84,7 @@ def create_menu_item_sys():
         }
 
         menu_collection.insert_one(menu_item)
+        menu_cache.invalidate()
         return jsonify({"message": "菜單品項成功建立", "item": menu_item}), 201
     except Exception as e:
         return jsonify({"error": f"Database error: {e}"}), 500
@@ -119,6 +127,7 @@ def update_menu_item_sys(item_id):
 
     if result.modified_count == 0:
         return jsonify({"error": "No changes made"}), 400
+    menu_cache.invalidate()
 
     updated_menu_item = menu_collection.find_one({"_id": item_id})
     # 返回更新後的菜單項目
@@ -147,5 +156,6 @@ def delete_menu_item_sys(item_id):
 
     # 從 MongoDB 刪除該菜單項目
     menu_collection.delete_one({"_id": item_id})
+    menu_cache.invalidate()
 
     return jsonify({"message": "菜單項目已成功刪除"}), 200
\ No newline at end of file
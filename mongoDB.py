@@ -1,7 +1,9 @@
-import os
+import os, threading
+from datetime import datetime
 from pymongo.mongo_client import MongoClient
 from pymongo import ReturnDocument
 from dotenv import load_dotenv
+from mongo_monitoring import pool_metrics, command_metrics, request_commands
 
 # 載入 .env 檔案中的環境變數
 load_dotenv()
@@ -16,8 +18,89 @@ if not database_name:
     raise ValueError("DATABASE_NAME is not set in the environment variables.")
     
     # 建立 MongoDB 連線
-client = MongoClient(mongoDB_url)
-db = client[database_name]
+# 連線參數（皆可由環境變數設定，未設定則使用 pymongo 預設值）
+CLIENT_OPTION_ENV = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", int),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", int),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    "compressors": ("MONGO_COMPRESSORS", str),   # 例如 "zstd,snappy,zlib"（zstd 需安裝 zstandard、snappy 需安裝 python-snappy）
+    "readPreference": ("MONGO_READ_PREFERENCE", str),   # 例如 "secondaryPreferred"
+    "appname": ("MONGO_APP_NAME", str),
+}
+
+def client_options():
+    """從環境變數讀取 MongoClient 參數"""
+    options = {}
+    for option, (env, cast) in CLIENT_OPTION_ENV.items():
+        value = os.getenv(env)
+        if value:
+            options[option] = cast(value)
+    return options
+
+_clients = {}   # pid -> MongoClient，每個行程（fork 後的 worker）各自建立連線
+_client_lock = threading.Lock()
+
+def _reset_client_lock():
+    global _client_lock
+    _client_lock = threading.Lock()   # fork 時鎖可能正被其他執行緒持有，子行程重新建立
+
+os.register_at_fork(after_in_child=_reset_client_lock)
+
+def get_client():
+    """取得目前行程的 MongoClient（第一次使用時才建立，fork 後的子行程會另建新連線）"""
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(pid)
+            if client is None:
+                # 新行程的監控數據從零開始（不沿用 fork 前 master 的統計）
+                pool_metrics.reset()
+                command_metrics.reset()
+                client = MongoClient(
+                    mongoDB_url,
+                    event_listeners=[pool_metrics, command_metrics, request_commands],
+                    **client_options()
+                )
+                _clients[pid] = client
+    return client
+
+
+class _LazyCollection:
+    """集合代理：每次操作時才取得目前行程連線上的集合"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def _collection(self):
+        return get_client()[database_name][self._name]
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self._collection(), attr)
+
+    def __getitem__(self, name):
+        return _LazyCollection(f"{self._name}.{name}")
+
+
+class _LazyDatabase:
+    """資料庫代理：模組載入時不建立連線，讓 gunicorn preload 後再 fork 也安全"""
+
+    def __getitem__(self, name):
+        return _LazyCollection(name)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _LazyCollection(name)
+
+
+db = _LazyDatabase()
 
 # 使用者資訊
 # ----------------------------------------------------
@@ -29,6 +112,10 @@ def user_find():
     """查詢所有使用者資訊"""
     return list(get_user_collection().find())
 
+def find_user_by_email(email, projection=None):
+    """以 email 查詢單一使用者（走 email 唯一索引，只取需要的欄位）"""
+    return get_user_collection().find_one({"email": email}, projection)
+
 # 訂單系統
 # -----------------------------------------------------
 def get_order_collection():
@@ -42,6 +129,14 @@ def get_menu_collection():
     """取得 Menu 集合"""
     return db["Menu"]
 
+def get_menu_version():
+    """取得菜單版本號（菜單有異動時遞增）"""
+    return get_data_version("menu")
+
+def bump_menu_version():
+    """菜單新增/修改/刪除後遞增版本號，讓各 worker 的菜單快取失效"""
+    return bump_data_version("menu")
+
 # 優惠券系統
 # ------------------------------------------------------
 def get_coupons_collection():
@@ -57,6 +152,10 @@ def reservation_settings_collection():
     """取得 Reservations_settings 集合"""
     return db["reservation_settings"]
 
+def get_reservation_capacity_collection():
+    """取得 ReservationCapacity 集合（各日期時段已預約人數）"""
+    return db["ReservationCapacity"]
+
 """ 修改db當中Expenses的id """
 expense_collection=db["Expenses"]
 def create_date_id(date_prefix:str)->str:
@@ -70,6 +169,31 @@ def create_date_id(date_prefix:str)->str:
     return f"{date_prefix}{sequence:04d}"
 
 
+def get_data_version(name:str)->dict:
+    """取得資料版本號（快取判斷資料是否異動用）"""
+    return db.Counts.find_one({"_id":f"{name}_version"}) or {"sequence_value":0, "updated_at":None}
+
+def bump_data_version(name:str)->dict:
+    """資料異動後遞增版本號，讓各 worker 的快取失效"""
+    return db.Counts.find_one_and_update(
+        {"_id":f"{name}_version"},
+        {"$inc":{"sequence_value":1}, "$set":{"updated_at":datetime.now()}},
+        return_document=ReturnDocument.AFTER,
+        upsert=True
+        )
+
+
+def reserve_sequence_block(counter_name:str, date_part:str, block_size:int)->int:
+    """向 Counts 預留一段序號（每日各自計數），回傳該段的最後一號"""
+    count=db.Counts.find_one_and_update(
+        {"_id":f"{counter_name}:{date_part}"},
+        {"$inc":{"sequence_value":block_size}},   # 一次預留 block_size 個序號
+        return_document=ReturnDocument.AFTER,
+        upsert=True
+        )
+    return count["sequence_value"]
+
+
 """ 刪除db集合中資料(工程用) 使用前請再確認！！！ """
 def del_all_coll():
     try:
@@ -84,11 +208,51 @@ def insert_expense(data):   #支出
     db.Expenses.insert_one(data)
 
 
+def iter_revenues(start_date, end_date, batch_size=1000):   # 查詢收入（回傳 cursor，逐批讀取）
+    return db.Orders.find({"updated_at":{"$gte":start_date, "$lte":end_date}}, {"_id":0, "total_price":1, "updated_at":1}).batch_size(batch_size)
+
+def iter_expenses(start_date, end_date, batch_size=1000):   # 查詢支出（回傳 cursor，逐批讀取）
+    return db.Expenses.find({"created_time":{"$gte":start_date, "$lte":end_date}}, {"_id":0, "amount":1, "created_time":1}).batch_size(batch_size)
+
 def get_revenues(start_date, end_date):   # 查詢收入（抓訂餐資訊）
-    return list(db.Orders.find({"updated_at":{"$gte":start_date, "$lte":end_date}}, {"_id":0, "total_price":1, "updated_at":1}))
+    return list(iter_revenues(start_date, end_date))
 
 def get_expenses(start_date, end_date):   # 查詢支出
-    return list(db.Expenses.find({"created_time":{"$gte":start_date, "$lte":end_date}}, {"_id":0, "amount":1, "created_time":1}))
+    return list(iter_expenses(start_date, end_date))
+
+
+def _bucket_stages(date_field, amount_field, extra_groups=()):
+    """產生 $facet 各分組：總額、每日、每小時（與額外欄位分組）"""
+    def group_by(key):
+        return [
+            {"$group":{"_id":key, "total":{"$sum":f"${amount_field}"}, "count":{"$sum":1}}},
+            {"$sort":{"_id":1}},
+            {"$project":{"_id":0, "key":"$_id", "total":1, "count":1}}
+        ]
+    facets={
+        "total":group_by(None),
+        "by_day":group_by({"$dateToString":{"format":"%Y-%m-%d", "date":f"${date_field}"}}),
+        "by_hour":group_by({"$dateToString":{"format":"%Y-%m-%d %H:00", "date":f"${date_field}"}}),
+    }
+    for field in extra_groups:
+        facets[f"by_{field}"]=group_by(f"${field}")
+    return facets
+
+def _aggregate_report(collection, date_field, amount_field, start_date, end_date, extra_groups=()):
+    result=next(collection.aggregate([
+        {"$match":{date_field:{"$gte":start_date, "$lte":end_date}}},
+        {"$facet":_bucket_stages(date_field, amount_field, extra_groups)}
+    ]))
+    totals=result.pop("total")
+    result["total"]=totals[0]["total"] if totals else 0
+    result["count"]=totals[0]["count"] if totals else 0
+    return result
+
+def aggregate_revenues(start_date, end_date):   # 收入統計（由 MongoDB 分組加總）
+    return _aggregate_report(db.Orders, "updated_at", "total_price", start_date, end_date, ("payment_method",))
+
+def aggregate_expenses(start_date, end_date):   # 支出統計（由 MongoDB 分組加總）
+    return _aggregate_report(db.Expenses, "created_time", "amount", start_date, end_date)
 
 
 
@@ -105,6 +269,28 @@ def get_accounting():   # 取得所有會計項目
 def get_AccountHistory():   #取得會計寫入紀錄
     return db["AccountHistory"]
 
+def get_daily_revenue_collection():   #取得每日營收彙總
+    return db["DailyRevenue"]
+
+
+# 背景工作
+# ------------------------------------------------------
+def get_jobs_collection():
+    """取得 Jobs 集合"""
+    return db["Jobs"]
+
+def get_points_ledger_collection():
+    """取得 PointsLedger 集合（點數異動紀錄）"""
+    return db["PointsLedger"]
+
+def get_waiting_queue_collection():
+    """取得 WaitingQueue 集合（現場候位）"""
+    return db["WaitingQueue"]
+
+def get_counts_collection():
+    """取得 Counts 集合（序號與狀態計數）"""
+    return db["Counts"]
+
 
 # LINE使用者資料
 # ------------------------------------------------------
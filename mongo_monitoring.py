@@ -0,0 +1,172 @@
+import threading
+from contextvars import ContextVar
+from pymongo import monitoring
+
+"""
+MongoDB 連線池與指令監控（每個行程各自統計）
+- PoolMetrics：連線池 CMAP 事件，統計使用中連線數、取得連線等待時間
+- CommandMetrics：指令事件，統計各指令次數與耗時
+- RequestCommandTracker：把指令記到目前請求（供 request_metrics 統計每個請求的 DB 次數與耗時）
+"""
+
+# 取得連線等待時間的分布（秒）
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _new_pool_stats():
+    return {
+        "connections_open": 0,
+        "connections_in_use": 0,
+        "checkouts": 0,
+        "checkout_failures": 0,
+        "wait_seconds_total": 0.0,
+        "wait_seconds_max": 0.0,
+        "wait_buckets": [0] * len(WAIT_BUCKETS),
+        "pool_clears": 0,
+    }
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+
+    def reset(self):
+        with self.lock:
+            self.pools = {}
+
+    def _stats(self, address):
+        key = f"{address[0]}:{address[1]}"
+        stats = self.pools.get(key)
+        if stats is None:
+            stats = self.pools[key] = _new_pool_stats()
+        return stats
+
+    def _record_wait(self, stats, duration):
+        if duration is None:
+            return
+        stats["wait_seconds_total"] += duration
+        stats["wait_seconds_max"] = max(stats["wait_seconds_max"], duration)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if duration <= bound:
+                stats["wait_buckets"][i] += 1
+                break
+
+    def pool_created(self, event):
+        with self.lock:
+            self._stats(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self._stats(event.address)["pool_clears"] += 1
+
+    def pool_closed(self, event):
+        with self.lock:
+            self.pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        with self.lock:
+            self._stats(event.address)["connections_open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            self._stats(event.address)["connections_open"] -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            stats = self._stats(event.address)
+            stats["checkout_failures"] += 1
+            self._record_wait(stats, getattr(event, "duration", None))
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            stats = self._stats(event.address)
+            stats["checkouts"] += 1
+            stats["connections_in_use"] += 1
+            self._record_wait(stats, getattr(event, "duration", None))
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self._stats(event.address)["connections_in_use"] -= 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                address: dict(stats, wait_buckets=dict(zip(map(str, WAIT_BUCKETS), stats["wait_buckets"])))
+                for address, stats in self.pools.items()
+            }
+
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def reset(self):
+        with self.lock:
+            self.commands = {}
+
+    def _record(self, event, failed):
+        with self.lock:
+            stats = self.commands.setdefault(event.command_name, {"count": 0, "failures": 0, "seconds_total": 0.0})
+            stats["count"] += 1
+            stats["failures"] += int(failed)
+            stats["seconds_total"] += event.duration_micros / 1e6
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, False)
+
+    def failed(self, event):
+        self._record(event, True)
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.commands.items()}
+
+
+class RequestCommandTracker(monitoring.CommandListener):
+    """
+    指令事件在發出指令的執行緒上回呼，以 ContextVar 找到目前請求的紀錄
+    start() 回傳的 list 會收到 (指令名稱, 秒數, 是否失敗)
+    """
+
+    def __init__(self):
+        self.current = ContextVar("mongo_request_commands", default=None)
+
+    def start(self):
+        commands = []
+        return commands, self.current.set(commands)
+
+    def stop(self, token):
+        self.current.reset(token)
+
+    def _record(self, event, failed):
+        commands = self.current.get()
+        if commands is not None:
+            commands.append((event.command_name, event.duration_micros / 1e6, failed))
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, False)
+
+    def failed(self, event):
+        self._record(event, True)
+
+
+pool_metrics = PoolMetrics()
+command_metrics = CommandMetrics()
+request_commands = RequestCommandTracker()
@@ -1,7 +1,15 @@
-from flask import request, jsonify, send_file
+import base64, io, json
+from flask import request, jsonify, send_file, url_for
 from datetime import datetime
 from mongoDB import get_order_collection, get_menu_collection, get_user_collection, get_coupons_collection
-from func import generate_order_id, generate_qr_code
+from func import generate_order_id, parse_date_arg
+from menu.menu_cache import menu_cache
+from coupons.coupons_sys import coupons_result_cache
+from json_response import ndjson_response
+from accounting.daily_revenue import record_order_status
+from qr_renderer import qr_renderer, ERROR_CORRECTION, MIMETYPES
+from db_indexes import register_index, register_query
+from points.points_sys import change_points, PointsUserNotFound
 
 
 menu_collection = get_menu_collection()
@@ -9,11 +17,105 @@ order_collection = get_order_collection()
 users_collection = get_user_collection()
 coupons_collection = get_coupons_collection()
 
+# 訂單分頁查詢用的複合索引（created_at, _id 由新到舊），以及增量匯出（since）用的 updated_at 索引
+register_index("Orders", [("created_at", -1), ("_id", -1)])
+for field in ("status", "payment_method", "user_id"):
+    register_index("Orders", [(field, 1), ("created_at", -1), ("_id", -1)])
+register_index("Orders", [("updated_at", 1), ("_id", 1)])
+register_query("orders page", "Orders", {}, [("created_at", -1), ("_id", -1)])
+register_query("orders by status", "Orders", {"status": "pending"}, [("created_at", -1), ("_id", -1)])
+register_query("orders by user", "Orders", {"user_id": "abcd1234"}, [("created_at", -1), ("_id", -1)])
+register_query("orders export since", "Orders", {"updated_at": {"$gte": datetime(2025, 1, 1)}}, [("updated_at", 1), ("_id", 1)])
+
+DEFAULT_PAGE_SIZE = 50   # 訂單列表每頁預設筆數
+MAX_PAGE_SIZE = 500      # 訂單列表每頁最大筆數
+
+
+def encode_order_cursor(order):
+    """將最後一筆訂單的 (created_at, _id) 編碼為下一頁的 after 參數"""
+    raw = json.dumps([order["created_at"].isoformat(), order["_id"]])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_order_cursor(cursor):
+    """解析 after 參數，回傳 (created_at, _id)"""
+    created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return datetime.fromisoformat(created_at), order_id
+
 
 def get_orders_sys():
-    """取得訂單列表"""
-    orders = list(order_collection.find())
-    return jsonify(orders), 200
+    """
+    取得訂單列表（依 created_at、_id 由新到舊分頁）
+    - limit：每頁筆數
+    - after：上一頁回傳的 next_cursor
+    - status / payment_method / user_id：篩選條件
+    - start_date / end_date：created_at 範圍
+    - fields：只回傳指定欄位，以逗號分隔
+    """
+    args = request.args
+    try:
+        limit = min(max(int(args.get("limit", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    query = {}
+    for field in ("status", "payment_method", "user_id"):
+        if args.get(field):
+            query[field] = args.get(field)
+
+    try:
+        if args.get("start_date") or args.get("end_date"):
+            query["created_at"] = {}
+            if args.get("start_date"):
+                query["created_at"]["$gte"] = parse_date_arg(args.get("start_date"))
+            if args.get("end_date"):
+                query["created_at"]["$lte"] = parse_date_arg(args.get("end_date"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if args.get("after"):
+        try:
+            after_created_at, after_id = decode_order_cursor(args.get("after"))
+        except Exception:
+            return jsonify({"error": "Invalid after cursor"}), 400
+        # keyset 分頁：只取比上一頁最後一筆更舊的訂單
+        query = {"$and": [query, {"$or": [
+            {"created_at": {"$lt": after_created_at}},
+            {"created_at": after_created_at, "_id": {"$lt": after_id}},
+        ]}]}
+
+    projection = None
+    if args.get("fields"):
+        projection = {field.strip(): 1 for field in args.get("fields").split(",") if field.strip()}
+        projection["created_at"] = 1  # 分頁游標需要 created_at
+
+    orders = list(
+        order_collection.find(query, projection)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)  # 多取一筆判斷是否還有下一頁
+    )
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_order_cursor(orders[-1])
+
+    return jsonify({"orders": orders, "next_cursor": next_cursor}), 200
+
+
+def export_orders_sys():
+    """
+    匯出訂單（NDJSON 串流，依 updated_at、_id 由舊到新）
+    - since：只匯出 updated_at >= since 的訂單，可用上次匯出的最後一筆 updated_at 做增量同步
+    """
+    query = {}
+    if request.args.get("since"):
+        try:
+            query["updated_at"] = {"$gte": parse_date_arg(request.args.get("since"))}
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    cursor = order_collection.find(query).sort([("updated_at", 1), ("_id", 1)])
+    return ndjson_response(cursor)
 
 
 def get_order_sys(order_id):
@@ -60,16 +162,20 @@ def update_order_sys(order_id):
             return jsonify({"error": f"Invalid status. Allowed values are {allowed_statuses}"}), 400
         update_fields["status"] = new_status
 
+        update_fields["updated_at"] = datetime.now()
+        # 以原狀態為條件更新，避免同時異動造成重複回饋或重複統計
+        if not transition_order(order, update_fields):
+            return jsonify({"error": "Order status was changed by another request"}), 409
+
+        coupon_code = order.get("coupon_code")
+
         # 訂單完成後執行回饋邏輯
         if new_status == "completed":
             user_id = order.get("user_id")
             final_price = float(order.get("final_price", 0) or 0)  # 確保 final_price 為數字
-            coupon_code = order.get("coupon_code")
 
             # 非會員結帳  只顯示 "Order completed"
             if not user_id:
-                update_fields["updated_at"] = datetime.now()
-                order_collection.update_one({"_id": order_id}, {"$set": update_fields})
                 return jsonify({"message": "Order completed"}), 200
 
             # 會員未使用優惠券 回傳會員 ID 和回饋點數
@@ -77,16 +183,13 @@ def update_order_sys(order_id):
                 reward_points = int(final_price // 100)  # 100元回饋1點
 
                 if reward_points > 0:
-                    # 更新會員點數
-                    result = users_collection.update_one(
-                        {"_id": user_id},
-                        {"$inc": {"points": reward_points}}  # 直接增加點數
-                    )
-
-                    if result.modified_count > 0:
+                    # 更新會員點數（寫入 PointsLedger）
+                    try:
+                        change_points(user_id, reward_points, "order_reward", ref=order_id)
+                    except PointsUserNotFound:
+                        pass
+                    else:
                         print(f"會員 {user_id} 的點數已更新，增加 {reward_points} 點")
-                        update_fields["updated_at"] = datetime.now()
-                        order_collection.update_one({"_id": order_id}, {"$set": update_fields})
                         return jsonify({
                             "message": "Order completed",
                             "user_id": user_id,
@@ -94,8 +197,6 @@ def update_order_sys(order_id):
                         }), 200
 
             # 會員使用優惠券 → 只顯示 "Order completed"
-            update_fields["updated_at"] = datetime.now()
-            order_collection.update_one({"_id": order_id}, {"$set": update_fields})
             return jsonify({"message": "Order completed"}), 200
         
         # 訂單取消邏輯
@@ -103,14 +204,31 @@ def update_order_sys(order_id):
             # 若訂單使用了優惠券，恢復優惠券狀態為 "active"
             if coupon_code and coupon_code.lower() != "none":
                 coupons_collection.update_one({"_id": coupon_code}, {"$set": {"status": "active"}})
+                coupons_result_cache.invalidate()
 
-            update_fields["updated_at"] = datetime.now()
-            order_collection.update_one({"_id": order_id}, {"$set": update_fields})
             return jsonify({"message": "Order canceled"}), 200
         
     # 如果沒有更新任何欄位
     return jsonify({"error": "No valid fields to update"}), 400
 
+def transition_order(order, update_fields):
+    """訂單狀態仍為讀取時的狀態才更新，成功後更新每日營收彙總"""
+    result = order_collection.update_one(
+        {"_id": order["_id"], "status": order.get("status")},
+        {"$set": update_fields}
+    )
+    if result.matched_count == 0:
+        return False
+    record_order_status(order, update_fields["status"], update_fields["updated_at"])
+    return True
+
+def release_coupon(coupon_code, order_id):
+    """歸還由此訂單領用的優惠券"""
+    coupons_collection.update_one(
+        {"_id": coupon_code, "status": "used", "order_id": order_id},
+        {"$set": {"status": "active"}, "$unset": {"order_id": ""}}
+    )
+
 def create_order_sys():
     """用戶新增訂單"""
     data = request.json
@@ -132,22 +250,9 @@ def create_order_sys():
         if not user_data:
             return jsonify({"error": "Invalid user_id"}), 400
 
-    # 檢查優惠券
-    discount_amount = 0
-    if user_data and coupon_code:
-        coupon = coupons_collection.find_one({"_id": coupon_code, "user_id": user_id, "status": "active"})
-        if not coupon:
-            return jsonify({"error": "Invalid coupon _id or not assigned to this user"}), 400
-
-        # 檢查優惠券是否過期
-        if datetime.now() > coupon["expiration_date"]:
-            return jsonify({"error": "Coupon has expired"}), 400
-
-        discount_amount = int(coupon["discount"])  # 優惠金額
-
     # 查詢菜單項目
     menu_item_ids = [item["menu_item_id"] for item in items]
-    menu_items = {item["_id"]: item for item in menu_collection.find({"_id": {"$in": menu_item_ids}})}
+    menu_items = menu_cache.get().by_id  # 從菜單快取取得價格
 
     invalid_ids = [menu_id for menu_id in menu_item_ids if menu_id not in menu_items]
     if invalid_ids:
@@ -192,14 +297,33 @@ def create_order_sys():
     # 轉換 `order_items_dict` 為 `order_items` 列表
     order_items = list(order_items_dict.values())
 
+    order_id = generate_order_id()
+    now = datetime.now()
+
+    # 檢查並領用優惠券：以單一原子操作將 active 且未過期的優惠券改為 used，避免重複使用
+    discount_amount = 0
+    claimed_coupon = False
+    if user_data and coupon_code:
+        coupon = coupons_collection.find_one_and_update(
+            {"_id": coupon_code, "user_id": user_id, "status": "active", "expiration_date": {"$gte": now}},
+            {"$set": {"status": "used", "order_id": order_id}}  # 記錄領用的訂單，方便對帳
+        )
+        if not coupon:
+            # 領用失敗才再查一次，區分過期與無效
+            coupon = coupons_collection.find_one({"_id": coupon_code, "user_id": user_id, "status": "active"})
+            if coupon and now > coupon["expiration_date"]:
+                return jsonify({"error": "Coupon has expired"}), 400
+            return jsonify({"error": "Invalid coupon _id or not assigned to this user"}), 400
+
+        claimed_coupon = True
+        discount_amount = int(coupon["discount"])  # 優惠金額
+
     # 確保折扣金額不超過訂單總額
     discount_amount = min(discount_amount, total_price)
     final_price = max(total_price - discount_amount, 0)  # 確保不低於 0 元
     order_type = 2 if discount_amount > 0 else 1  # 若有折扣則為類型 2
 
     # 構建訂單資料
-    order_id = generate_order_id()
-    now = datetime.now()
     order = {
         "_id": order_id,
         "user_id": str(user_id),  
@@ -215,24 +339,65 @@ def create_order_sys():
         "updated_at": now,
     }
 
+    # 折扣為 0 時不佔用優惠券
+    if claimed_coupon and discount_amount <= 0:
+        release_coupon(coupon_code, order_id)
+        claimed_coupon = False
+
     # 插入訂單到數據庫
     try:
         order_collection.insert_one(order)
-        # 標記優惠券為已使用
-        if coupon_code and discount_amount > 0:
-            coupons_collection.update_one({"_id": coupon_code}, {"$set": {"status": "used"}})
     except Exception as e:
+        if claimed_coupon:
+            release_coupon(coupon_code, order_id)  # 訂單建立失敗，歸還優惠券
         return jsonify({"error": "Failed to create order", "details": str(e)}), 500
-    
-    # 現場付款才回傳 QR Code
-    if payment_method == "cash":
-        qr_code_image = generate_qr_code(order_id)
-        return send_file(qr_code_image, mimetype="image/png")
 
-    return jsonify({
+    if claimed_coupon:
+        coupons_result_cache.invalidate()
+    
+    response = {
         "message": "Order created successfully",
         "order": order
-    }), 201
+    }
+
+    # 現場付款才提供 QR Code：背景產生，回傳下載網址
+    if payment_method == "cash":
+        qr_renderer.submit(order_id)
+        response["qr_code_url"] = url_for("get_order_qr_code", order_id=order_id)
+
+    return jsonify(response), 201
+
+def get_order_qr_code_sys(order_id):
+    """
+    取得訂單 QR Code
+    - format：png（預設）或 svg
+    - size：每格像素（1~40，預設 10）
+    - error_correction：L / M（預設）/ Q / H
+    """
+    fmt = request.args.get("format", "png").lower()
+    error_correction = request.args.get("error_correction", "M").upper()
+    try:
+        box_size = int(request.args.get("size", 10))
+    except ValueError:
+        return jsonify({"error": "size must be an integer"}), 400
+
+    if fmt not in MIMETYPES:
+        return jsonify({"error": f"Invalid format. Allowed values are {list(MIMETYPES)}"}), 400
+    if error_correction not in ERROR_CORRECTION:
+        return jsonify({"error": f"Invalid error_correction. Allowed values are {list(ERROR_CORRECTION)}"}), 400
+    if not 1 <= box_size <= 40:
+        return jsonify({"error": "size must be between 1 and 40"}), 400
+
+    # 快取中沒有時（例如其他 worker 建立的訂單）先確認訂單存在
+    if not qr_renderer.is_cached(order_id, fmt, box_size, error_correction):
+        if not order_collection.find_one({"_id": order_id}, {"_id": 1}):
+            return jsonify({"error": "Order not found"}), 404
+
+    try:
+        image = qr_renderer.get(order_id, fmt, box_size, error_correction)
+    except Exception as e:
+        return jsonify({"error": "Failed to generate QR code", "details": str(e)}), 500
+    return send_file(io.BytesIO(image), mimetype=MIMETYPES[fmt])
 
 def delete_order_sys(order_id):
     """刪除訂單"""
@@ -0,0 +1,111 @@
+from datetime import datetime
+from flask import request, jsonify
+from pymongo import ReturnDocument
+from mongoDB import get_user_collection, get_points_ledger_collection
+from db_indexes import register_index, register_query
+
+"""
+會員點數
+- 點數餘額存在 Users.points，查詢餘額直接讀會員文件
+- change_points() 以條件式 $inc 一次完成檢查與加扣（扣點時條件為 points >= 扣除數），同時異動不會互相覆蓋
+- 每次異動寫入 PointsLedger：{user_id, delta, balance, reason, ref, created_at}，寫入失敗時還原點數並拋出原本的例外
+"""
+
+users_collection = get_user_collection()
+points_ledger_collection = get_points_ledger_collection()
+register_index("PointsLedger", [("user_id", 1), ("created_at", -1)])
+register_query("points ledger", "PointsLedger", {"user_id": "abcd1234"}, [("created_at", -1)])
+
+LEDGER_PAGE_SIZE = 50
+
+
+class PointsUserNotFound(LookupError):
+    pass
+
+
+class InsufficientPoints(ValueError):
+    pass
+
+
+def change_points(user_id, delta, reason, ref=None):
+    """
+    加扣會員點數（delta 正數為加點，負數為扣點），回傳異動後的點數
+    會員不存在時拋出 PointsUserNotFound，點數不足時拋出 InsufficientPoints
+    """
+    delta = int(delta)
+    query = {"_id": user_id}
+    if delta < 0:
+        query["points"] = {"$gte": -delta}
+
+    user = users_collection.find_one_and_update(
+        query,
+        {"$inc": {"points": delta}},
+        projection={"points": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user is None:
+        # 條件不成立：區分會員不存在與點數不足
+        if users_collection.count_documents({"_id": user_id}, limit=1) == 0:
+            raise PointsUserNotFound(user_id)
+        raise InsufficientPoints(user_id)
+
+    try:
+        points_ledger_collection.insert_one({
+            "user_id": user_id,
+            "delta": delta,
+            "balance": user["points"],
+            "reason": reason,
+            "ref": ref,
+            "created_at": datetime.now()
+        })
+    except Exception:
+        # 沒有異動紀錄的加扣不保留，呼叫端不必另外退回
+        users_collection.update_one({"_id": user_id}, {"$inc": {"points": -delta}})
+        raise
+    return user["points"]
+
+
+def get_points(user_id):
+    """讀取會員點數餘額，會員不存在時回傳 None"""
+    user = users_collection.find_one({"_id": user_id}, {"points": 1})
+    if not user:
+        return None
+    return user.get("points", 0)
+
+
+def update_points_sys():
+    """點數加扣：{"user_id": ..., "points": 正數加點 / 負數扣點, "reason": ...}"""
+    data = request.json or {}
+    user_id = data.get("user_id")
+    try:
+        points = int(data.get("points"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "points must be an integer"}), 400
+
+    try:
+        new_points = change_points(user_id, points, data.get("reason", "manual"))
+    except PointsUserNotFound:
+        return jsonify({"error": "User does not exist"}), 404
+    except InsufficientPoints:
+        return jsonify({"error": "Not enough points"}), 400
+
+    return jsonify({
+        "message": "點數更新成功",
+        "new_points": new_points
+    }), 200
+
+
+def get_points_ledger_sys(user_id):
+    """會員點數餘額與最近的異動紀錄（?limit= 預設 50 筆）"""
+    points = get_points(user_id)
+    if points is None:
+        return jsonify({"error": "User does not exist"}), 404
+    try:
+        limit = min(max(int(request.args.get("limit", LEDGER_PAGE_SIZE)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    ledger = list(points_ledger_collection.find({"user_id": user_id}).sort("created_at", -1).limit(limit))
+    for entry in ledger:
+        entry["_id"] = str(entry["_id"])
+    return jsonify({"user_id": user_id, "points": points, "ledger": ledger}), 200
@@ -0,0 +1,75 @@
+import io, os
+from concurrent.futures import ThreadPoolExecutor
+import qrcode
+import qrcode.image.svg
+from cachetools import LRUCache
+from threading import Lock
+
+"""
+QR Code 非同步產生
+- 在固定大小的執行緒池中產生，不佔用請求執行緒
+- 依 (order_id, 格式, 尺寸, 容錯等級) 快取結果，相同參數只產生一次
+"""
+
+QR_WORKERS = int(os.getenv("QR_WORKERS", "2"))   # 產生 QR Code 的執行緒數
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "1000"))   # 快取的 QR Code 數量
+
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def render_qr_code(data, fmt="png", box_size=10, error_correction="M", border=4):
+    """產生 QR Code，回傳圖片 bytes"""
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECTION[error_correction], box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    output = io.BytesIO()
+    if fmt == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(output)
+    else:
+        qr.make_image().save(output, format="PNG")
+    return output.getvalue()
+
+
+class QRCodeRenderer:
+    def __init__(self, workers=QR_WORKERS, cache_size=QR_CACHE_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qr-render")
+        self.cache = LRUCache(maxsize=cache_size)   # key -> Future
+        self.lock = Lock()
+
+    def submit(self, order_id, fmt="png", box_size=10, error_correction="M"):
+        """排入背景產生（已快取或產生中則直接回傳同一個 Future）"""
+        key = (order_id, fmt, box_size, error_correction)
+        created = False
+        with self.lock:
+            future = self.cache.get(key)
+            if future is None:
+                future = self.executor.submit(render_qr_code, order_id, fmt, box_size, error_correction)
+                self.cache[key] = future
+                created = True
+        if created:
+            future.add_done_callback(lambda f: self._evict_failed(key, f))
+        return future
+
+    def _evict_failed(self, key, future):
+        """產生失敗的結果不保留在快取中"""
+        if future.exception() is not None:
+            with self.lock:
+                if self.cache.get(key) is future:
+                    self.cache.pop(key, None)
+
+    def get(self, order_id, fmt="png", box_size=10, error_correction="M", timeout=10):
+        """取得 QR Code 圖片 bytes，尚未產生完成時等待"""
+        return self.submit(order_id, fmt, box_size, error_correction).result(timeout=timeout)
+
+    def is_cached(self, order_id, fmt="png", box_size=10, error_correction="M"):
+        with self.lock:
+            return (order_id, fmt, box_size, error_correction) in self.cache
+
+
+qr_renderer = QRCodeRenderer()
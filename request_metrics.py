@@ -0,0 +1,169 @@
+import logging, os, threading, time
+from flask import g, request
+from mongo_monitoring import request_commands
+
+"""
+每個路由的請求統計（每個 worker 各自統計）
+- 請求耗時、MongoDB 指令次數、DB 耗時、回應位元組數，以 histogram 累計
+- 串流回應在送完（call_on_close）才結算，串流期間的 DB 指令也算在該請求
+- 超過 SLOW_REQUEST_SECONDS 的請求記錄 log，附各指令次數與耗時
+- render_prometheus() 輸出 Prometheus text 格式（/internal/metrics）
+"""
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+logger = logging.getLogger("request_metrics")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def lines(self, name, labels):
+        """Prometheus histogram 格式（bucket 為累計值）"""
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_seconds = Histogram(LATENCY_BUCKETS)
+        self.db_commands = Histogram(COMMAND_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.statuses = {}
+
+
+HISTOGRAMS = (
+    ("http_request_duration_seconds", "latency", "請求耗時（秒）"),
+    ("http_request_db_seconds", "db_seconds", "請求內 MongoDB 指令耗時（秒）"),
+    ("http_request_db_commands", "db_commands", "請求內 MongoDB 指令次數"),
+    ("http_response_size_bytes", "response_bytes", "回應位元組數"),
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}   # (method, route) -> RouteStats
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+    def record(self, method, route, status, seconds, commands, response_bytes):
+        db_seconds = sum(duration for _, duration, _ in commands)
+        with self.lock:
+            stats = self.routes.get((method, route))
+            if stats is None:
+                stats = self.routes[(method, route)] = RouteStats()
+            stats.latency.observe(seconds)
+            stats.db_seconds.observe(db_seconds)
+            stats.db_commands.observe(len(commands))
+            stats.response_bytes.observe(response_bytes)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+        if seconds >= SLOW_REQUEST_SECONDS:
+            breakdown = {}
+            for name, duration, failed in commands:
+                item = breakdown.setdefault(name, [0, 0.0, 0])
+                item[0] += 1
+                item[1] += duration
+                item[2] += int(failed)
+            detail = ", ".join(
+                f"{name} x{count} {total * 1000:.1f}ms" + (f" ({failures} failed)" if failures else "")
+                for name, (count, total, failures) in sorted(breakdown.items(), key=lambda item: -item[1][1])
+            )
+            logger.warning(
+                f"slow request {method} {route} {status} {seconds * 1000:.1f}ms, "
+                f"db {len(commands)} commands {db_seconds * 1000:.1f}ms, {response_bytes} bytes"
+                + (f": {detail}" if detail else "")
+            )
+
+    def render_prometheus(self):
+        with self.lock:
+            routes = sorted(self.routes.items())
+            lines = []
+            for metric, attr, help_text in HISTOGRAMS:
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (method, route), stats in routes:
+                    labels = f'method="{method}",route="{_escape(route)}"'
+                    lines.extend(getattr(stats, attr).lines(metric, labels))
+            lines.append("# HELP http_requests_total 請求數（依狀態碼）")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route), stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+
+def _counting(iterable, counter):
+    """串流回應：邊送邊累計位元組數"""
+    for chunk in iterable:
+        counter[0] += len(chunk)
+        yield chunk
+
+
+def init_app(app):
+    """掛上請求統計（before_request / after_request）"""
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        g.request_commands, g.request_commands_token = request_commands.start()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        commands, token = g.pop("request_commands"), g.pop("request_commands_token")
+        method = request.method
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        status = response.status_code
+
+        counter = [0]
+        if response.content_length is not None:   # 一般回應與 send_file 檔案
+            counter[0] = response.content_length
+        elif response.is_streamed:
+            response.response = _counting(response.response, counter)
+        else:
+            counter[0] = response.calculate_content_length() or 0
+
+        def finish():
+            try:
+                request_commands.stop(token)
+            except ValueError:   # 在不同的 context 結束（例如串流由其他執行緒送出）
+                pass
+            request_metrics.record(method, route, status, time.perf_counter() - started, commands, counter[0])
+
+        response.call_on_close(finish)
+        return response
@@ -0,0 +1,194 @@
+import json, os, sys, tempfile, threading, time, uuid
+from collections import Counter
+from flask import g, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt # type: ignore
+
+"""
+單一請求的取樣分析（正式環境可常開）
+- 請求帶 X-Profile-Token 標頭且與 PROFILE_TOKEN 相同，或帶 X-Profile: 1 與後台 admin 的 JWT 時，該請求以取樣方式分析
+- 取樣執行緒每 PROFILE_INTERVAL 秒讀一次請求執行緒的呼叫堆疊（sys._current_frames），不影響被分析的程式
+- 結果存成 flame graph 用的 folded stacks 格式（每行 "a;b;c 次數"），可用 flamegraph.pl / speedscope 開啟
+- 每個 worker 同時只分析 PROFILE_MAX_CONCURRENT 個請求，每分鐘最多 PROFILE_MAX_PER_MINUTE 次，超過時照常處理不分析
+- 檔案存在 PROFILE_DIR（各 worker 共用），保留最新 PROFILE_KEEP 份，由 /internal/profiles 下載
+"""
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")   # 未設定時只接受 admin JWT
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "1"))
+PROFILE_MAX_PER_MINUTE = int(os.getenv("PROFILE_MAX_PER_MINUTE", "6"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "order_sys_profiles"))
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """在另一條執行緒定時取樣目標執行緒的呼叫堆疊"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileLimiter:
+    """限制同時分析數與每分鐘分析次數（每個 worker 各自計算）"""
+
+    def __init__(self, max_concurrent=PROFILE_MAX_CONCURRENT, max_per_minute=PROFILE_MAX_PER_MINUTE):
+        self.lock = threading.Lock()
+        self.max_concurrent = max_concurrent
+        self.max_per_minute = max_per_minute
+        self.active = 0
+        self.recent = []   # 最近一分鐘開始分析的時間
+
+    def acquire(self):
+        now = time.monotonic()
+        with self.lock:
+            self.recent = [t for t in self.recent if now - t < 60]
+            if self.active >= self.max_concurrent or len(self.recent) >= self.max_per_minute:
+                return False
+            self.active += 1
+            self.recent.append(now)
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+
+profile_limiter = ProfileLimiter()
+
+
+def _profile_path(profile_id, ext):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{ext}")
+
+
+def save_profile(profiler, meta):
+    """寫入 folded stacks 與說明檔，並刪除超過 PROFILE_KEEP 的舊檔"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = meta["profile_id"]
+    with open(_profile_path(profile_id, "folded"), "w", encoding="utf-8") as f:
+        f.write(profiler.folded())
+    with open(_profile_path(profile_id, "json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    for old in list_profiles()[PROFILE_KEEP:]:
+        for ext in ("folded", "json"):
+            try:
+                os.remove(_profile_path(old["profile_id"], ext))
+            except OSError:
+                pass
+
+
+def list_profiles():
+    """已存的分析結果（新到舊）"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda meta: meta["started_at"], reverse=True)
+
+
+def get_profile_path(profile_id):
+    """profile_id 對應的 folded stacks 檔，不存在時回傳 None"""
+    if not profile_id.isalnum():
+        return None
+    path = _profile_path(profile_id, "folded")
+    return path if os.path.exists(path) else None
+
+
+def profiling_requested():
+    if PROFILE_TOKEN and request.headers.get("X-Profile-Token") == PROFILE_TOKEN:
+        return True
+    if request.headers.get("X-Profile") == "1":
+        try:
+            verify_jwt_in_request(optional=True)
+        except Exception:   # token 無效時照常處理，交給路由本身回應
+            return False
+        return get_jwt().get("role") == "admin"
+    return False
+
+
+def init_app(app):
+    """掛上請求分析（before_request / after_request）"""
+
+    @app.before_request
+    def start_request_profiler():
+        if not profiling_requested():
+            return
+        if not profile_limiter.acquire():
+            g.profile_skipped = True
+            return
+        g.profiler = SamplingProfiler(threading.get_ident()).start()
+        g.profile_started_at = time.time()
+
+    @app.after_request
+    def finish_request_profiler(response):
+        if g.pop("profile_skipped", False):
+            response.headers["X-Profile-Skipped"] = "rate-limited"
+            return response
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+
+        profile_id = uuid.uuid4().hex
+        meta = {
+            "profile_id": profile_id,
+            "method": request.method,
+            "path": request.path,
+            "route": request.url_rule.rule if request.url_rule else None,
+            "status": response.status_code,
+            "started_at": g.pop("profile_started_at"),
+            "interval": profiler.interval,
+        }
+
+        def finish():
+            # 串流回應送完才停止取樣
+            try:
+                profiler.stop()
+                meta.update(duration=round(profiler.duration, 4), samples=profiler.samples)
+                save_profile(profiler, meta)
+            finally:
+                profile_limiter.release()
+
+        response.call_on_close(finish)
+        response.headers["X-Profile-Id"] = profile_id
+        return response
@@ -0,0 +1,126 @@
+import sys
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from mongoDB import get_reservation_capacity_collection, get_reservations_collection, reservation_settings_collection
+from db_indexes import register_index, register_query
+
+"""
+預約座位計數（ReservationCapacity）
+- 每個 (日期, 時段) 一份文件，預約時以條件式 $inc 保留座位（reserved + guests <= capacity），同時預約不會超賣
+- 取消 / 刪除有效預約時扣回座位；查詢剩餘座位以 _id 直接讀取（每個時段一份文件）
+- capacity 取自 reservation_settings（桌數 * 每桌人數），店家修改時段設定時同步更新今天以後的文件
+- 可執行 python -m reservation.reservation_capacity backfill 由現有的有效預約重建
+
+文件格式：
+{
+    "_id": "2025-01-31|18:00-20:00",
+    "date": datetime(2025, 1, 31),
+    "time_range": "18:00-20:00",
+    "capacity": 可預約人數,
+    "reserved": 已預約人數
+}
+"""
+
+capacity_collection = get_reservation_capacity_collection()
+register_index("ReservationCapacity", [("time_range", 1), ("date", 1)])   # 修改時段設定時更新之後的日期
+register_query("capacity by time range", "ReservationCapacity", {"time_range": "18:00-20:00", "date": {"$gte": datetime(2025, 1, 1)}})
+
+
+def _key(date, time_range):
+    return f"{date.strftime('%Y-%m-%d')}|{time_range}"
+
+
+def slot_capacity(slot):
+    """時段設定的可預約人數"""
+    return slot["tables"] * slot["max_per_table"]
+
+
+def reserve_seats(date, time_range, guests, capacity):
+    """保留座位，座位不足時回傳 False"""
+    if guests > capacity:
+        return False
+    query = {
+        "_id": _key(date, time_range),
+        "$expr": {"$lte": [{"$add": ["$reserved", guests]}, "$capacity"]}
+    }
+    update = {
+        "$inc": {"reserved": guests},
+        "$setOnInsert": {"date": date, "time_range": time_range, "capacity": capacity}
+    }
+    try:
+        result = capacity_collection.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        # 文件已存在但座位不足，或另一個請求剛建立文件：不 upsert 再試一次
+        result = capacity_collection.update_one(query, update)
+        return result.modified_count == 1
+    return result.modified_count == 1 or result.upserted_id is not None
+
+
+def release_seats(date, time_range, guests):
+    """取消 / 刪除有效預約時扣回座位"""
+    capacity_collection.update_one(
+        {"_id": _key(date, time_range), "reserved": {"$gte": guests}},
+        {"$inc": {"reserved": -guests}}
+    )
+
+
+def update_capacity(time_range, capacity, from_date):
+    """時段設定變更時，更新 from_date 以後已有預約的日期"""
+    capacity_collection.update_many(
+        {"time_range": time_range, "date": {"$gte": from_date}},
+        {"$set": {"capacity": capacity}}
+    )
+
+
+def get_availability(date, slots):
+    """查詢指定日期各時段的已預約與剩餘人數（slots 為時段設定，以 _id 一次讀取）"""
+    docs = {
+        doc["_id"]: doc
+        for doc in capacity_collection.find({"_id": {"$in": [_key(date, slot["time_range"]) for slot in slots]}})
+    }
+    availability = []
+    for slot in slots:
+        doc = docs.get(_key(date, slot["time_range"]), {})
+        capacity = doc.get("capacity", slot_capacity(slot))
+        reserved = doc.get("reserved", 0)
+        availability.append({
+            "time_range": slot["time_range"],
+            "capacity": capacity,
+            "reserved": reserved,
+            "available": max(capacity - reserved, 0)
+        })
+    return availability
+
+
+def rebuild_reservation_capacity():
+    """由 Reservations 的有效預約重建全部座位計數，回傳重建的時段數"""
+    capacities = {slot["time_range"]: slot_capacity(slot) for slot in reservation_settings_collection().find()}
+    pipeline = [
+        {"$match": {"status": "active"}},
+        {"$group": {
+            "_id": {"date": "$reservation_date", "time_range": "$time_range"},
+            "reserved": {"$sum": "$guests"},
+        }},
+    ]
+    docs = []
+    for row in get_reservations_collection().aggregate(pipeline, allowDiskUse=True):
+        date, time_range = row["_id"]["date"], row["_id"]["time_range"]
+        docs.append({
+            "_id": _key(date, time_range),
+            "date": date,
+            "time_range": time_range,
+            "capacity": capacities.get(time_range, 0),
+            "reserved": row["reserved"]
+        })
+
+    capacity_collection.delete_many({})
+    if docs:
+        capacity_collection.insert_many(docs)
+    return len(docs)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["backfill"]:
+        print(f"ReservationCapacity rebuilt: {rebuild_reservation_capacity()} slots")
+    else:
+        print("usage: python -m reservation.reservation_capacity backfill")
@@ -1,7 +1,10 @@
 from flask import request, jsonify
 from datetime import datetime
 from mongoDB import get_reservations_collection, reservation_settings_collection, get_user_collection
-from func import generate_reservation_id
+from func import generate_reservation_id, parse_date_arg
+from json_response import json_response, ndjson_response, EncodedResultCache
+from db_indexes import register_index, register_query
+from reservation.reservation_capacity import slot_capacity, reserve_seats, release_seats, update_capacity, get_availability
 
 reservations_collection = get_reservations_collection()
 
@@ -9,6 +12,17 @@ reservation_settings = reservation_settings_collection()
 
 users_collection = get_user_collection()
 
+register_index("Reservations", [("reservation_date", 1), ("time_range", 1)])   # 依日期查詢
+register_index("Reservations", [("contact_info", 1), ("user_id", 1), ("status", 1)])   # 取消預約、聯絡資訊查詢
+register_index("Reservations", [("updated_at", 1), ("_id", 1)])   # 增量匯出
+register_index("reservation_settings", "time_range")
+register_query("reservations by slot", "Reservations", {"reservation_date": datetime(2025, 1, 1), "time_range": "18:00-20:00"})
+register_query("reservations by date", "Reservations", {"reservation_date": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2025, 1, 2)}})
+register_query("cancel reservation", "Reservations", {"contact_info": "0912345678", "user_id": "abcd1234", "status": "active"})
+register_query("reservations export since", "Reservations", {"updated_at": {"$gte": datetime(2025, 1, 1)}}, [("updated_at", 1), ("_id", 1)])
+
+reservations_result_cache = EncodedResultCache("reservations")  # 全部預約列表快取，預約異動時需 invalidate()
+
 def set_reservation_slots_sys():
     """店家設定時段、桌數與每桌人數"""
     data = request.json
@@ -35,13 +49,15 @@ def set_reservation_slots_sys():
         if not isinstance(max_per_table, int) or max_per_table <= 0:
             return jsonify({"error": f"Invalid max_per_table value: {max_per_table}. Must be a positive integer."}), 400
 
-        # 儲存時段設定到 MongoDB
+        # 儲存時段設定到 MongoDB，並更新今天以後的座位上限
         try:
             reservation_settings.update_one(
                 {"time_range": time_range},
                 {"$set": {"tables": tables, "max_per_table": max_per_table}},
                 upsert=True
             )
+            today = datetime.combine(datetime.now().date(), datetime.min.time())
+            update_capacity(time_range, tables * max_per_table, today)
         except Exception as e:
             return jsonify({
                 "error": "Failed to update reservation slots",
@@ -71,6 +87,13 @@ def add_reservation_sys():
     except ValueError:
         return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD"}), 400
 
+    try:
+        guests = int(guests)
+    except (TypeError, ValueError):
+        return jsonify({"error": "guests must be a positive integer"}), 400
+    if guests <= 0:
+        return jsonify({"error": "guests must be a positive integer"}), 400
+
     # 確認 user_id 是否有效
     user_data = None
     if user_id:
@@ -83,39 +106,39 @@ def add_reservation_sys():
     if not slot:
         return jsonify({"error": "Invalid time range"}), 400
 
-    max_per_table = slot["max_per_table"]
-    total_tables = slot["tables"]
-
-    # 計算該時段的現有預約人數
-    existing_reservations = reservations_collection.find({
-        "reservation_date": reservation_date,
-        "time_range": time_range
-    })
-    total_reserved = sum(reservation["guests"] for reservation in existing_reservations)
-
-    if total_reserved + guests > total_tables * max_per_table:
+    # 保留座位（條件式 $inc，同時預約不會超賣）
+    if not reserve_seats(reservation_date, time_range, guests, slot_capacity(slot)):
         return jsonify({"error": "Not enough seats available"}), 400
 
-    # 生成預約 ID
-    reservation_id = generate_reservation_id()
-
-    # 儲存預約
-    reservation = {
-        "_id": reservation_id,
-        "user_id": user_id,
-        "time_range": time_range,
-        "guests": guests,
-        "reservation_date": reservation_date,  # 存儲為 datetime.datetime
-        "contact_info": contact_info,
-        "status": "active",
-        "created_at": datetime.now()
-    }
-
+    # 保留座位後任何一步失敗都釋放座位
     try:
+        # 生成預約 ID
+        reservation_id = generate_reservation_id()
+        now = datetime.now()
+
+        # 儲存預約
+        reservation = {
+            "_id": reservation_id,
+            "user_id": user_id,
+            "time_range": time_range,
+            "guests": guests,
+            "reservation_date": reservation_date,  # 存儲為 datetime.datetime
+            "contact_info": contact_info,
+            "status": "active",
+            "created_at": now,
+            "updated_at": now
+        }
         reservations_collection.insert_one(reservation)
     except Exception as e:
+        release_seats(reservation_date, time_range, guests)   # 預約建立失敗，釋放座位
         return jsonify({"error": "Failed to create reservation", "details": str(e)}), 500
 
+    # 預約已建立，清除快取失敗時不釋放座位（預約列表在下次異動前可能未更新）
+    try:
+        reservations_result_cache.invalidate()
+    except Exception as e:
+        print(f"reservation cache invalidate failed: {e}")
+
     return jsonify({
         "message": "Reservation created successfully",
         "reservation_id": reservation_id
@@ -168,11 +191,15 @@ def cancel_reservation_sys():
         if not reservation:
             return jsonify({"error": "Reservation not found"}), 404
 
-        # 更新預約狀態為 "canceled"
-        reservations_collection.update_one(
-            {"_id": reservation["_id"]},
-            {"$set": {"status": "canceled"}}
+        # 更新預約狀態為 "canceled"（以原狀態為條件，重複取消不會重複釋放座位）
+        result = reservations_collection.update_one(
+            {"_id": reservation["_id"], "status": "active"},
+            {"$set": {"status": "canceled", "updated_at": datetime.now()}}
         )
+        if result.modified_count == 0:
+            return jsonify({"error": "Reservation not found"}), 404
+        release_seats(reservation["reservation_date"], reservation["time_range"], reservation["guests"])
+        reservations_result_cache.invalidate()
 
         return jsonify({"message": "Reservation canceled successfully"}), 200
 
@@ -182,7 +209,7 @@ def cancel_reservation_sys():
 
 def get_all_reservations_sys():
     """查詢所有預約"""
-    try:
+    def build():
         # 查詢資料庫中所有預約
         reservations = list(reservations_collection.find())
 
@@ -191,13 +218,32 @@ def get_all_reservations_sys():
             for reservation in reservations:
                 reservation["_id"] = str(reservation["_id"])  # 將 ObjectId 轉換為字串
 
-            return jsonify({"reservations": reservations}), 200
+            return {"reservations": reservations}
         else:
-            return jsonify({"message": "No reservations found"}), 200
+            return {"message": "No reservations found"}
+
+    try:
+        # 預約未異動時直接回傳已編碼的結果
+        return json_response(reservations_result_cache.get(build), 200)
 
     except Exception as e:
         return jsonify({"error": "Failed to retrieve reservations", "details": str(e)}), 500
 
+def export_reservations_sys():
+    """
+    匯出預約（NDJSON 串流，依 updated_at、_id 由舊到新）
+    - since：只匯出 updated_at >= since 的預約，可用上次匯出的最後一筆 updated_at 做增量同步
+    """
+    query = {}
+    if request.args.get("since"):
+        try:
+            query["updated_at"] = {"$gte": parse_date_arg(request.args.get("since"))}
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    cursor = reservations_collection.find(query).sort([("updated_at", 1), ("_id", 1)])
+    return ndjson_response(cursor)
+
 def get_reservations_by_date_sys(): 
     """根據指定日期查詢預約"""
     date_str = request.args.get("date")  # 從查詢參數中獲取日期
@@ -261,19 +307,36 @@ def get_today_reservations_sys():
 def delete_reservation_sys(reservation_id):
     """根據預約 ID 刪除預約"""
     try:
-        # 在資料庫中查找該預約
-        reservation = reservations_collection.find_one({"_id": reservation_id})
+        # 刪除預約（同時取回刪除前的資料）
+        reservation = reservations_collection.find_one_and_delete({"_id": reservation_id})
 
         if not reservation:
             return jsonify({"error": f"Reservation with ID {reservation_id} not found"}), 404
 
-        # 刪除預約
-        result = reservations_collection.delete_one({"_id": reservation_id})
-
-        if result.deleted_count > 0:
-            return jsonify({"message": f"Reservation with ID {reservation_id} deleted successfully"}), 200
-        else:
-            return jsonify({"error": "Failed to delete reservation"}), 500
+        # 刪除的是有效預約時釋放座位
+        if reservation.get("status") == "active":
+            release_seats(reservation["reservation_date"], reservation["time_range"], reservation["guests"])
+        reservations_result_cache.invalidate()
+        return jsonify({"message": f"Reservation with ID {reservation_id} deleted successfully"}), 200
 
     except Exception as e:
         return jsonify({"error": "Failed to delete reservation", "details": str(e)}), 500
+
+def get_reservation_availability_sys():
+    """查詢指定日期各時段的剩餘座位（?date=YYYY-MM-DD&time_range= 可只查單一時段）"""
+    date_str = request.args.get("date")
+    time_range = request.args.get("time_range")
+
+    if not date_str:
+        return jsonify({"error": "Date is required. Please provide a date in the format YYYY-MM-DD"}), 400
+    try:
+        date = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD"}), 400
+
+    query = {"time_range": time_range} if time_range else {}
+    slots = list(reservation_settings.find(query))
+    if time_range and not slots:
+        return jsonify({"error": "Invalid time range"}), 400
+
+    return jsonify({"date": date_str, "slots": get_availability(date, slots)}), 200
@@ -0,0 +1,16 @@
+"""
+候位推播專用入口（只提供 /queue/stream），與主程式分開啟動，串流佔用的執行緒不影響其他 API：
+    GUNICORN_BIND=0.0.0.0:8001 GUNICORN_WORKERS=2 GUNICORN_THREADS=1000 QUEUE_STREAM_RESERVED_THREADS=0 \
+        gunicorn -c gunicorn.conf.py stream_wsgi:app
+反向代理將 /queue/stream 導到此行程；需使用 QUEUE_STORE=mongo 才能收到主程式的候位異動
+"""
+from flask import Flask
+from flask_cors import CORS # type: ignore
+from waiting.waiting_system import stream_queue_info
+
+app = Flask(__name__)
+CORS(app, resources={r"/*": {"origins": "*"}})
+app.add_url_rule("/queue/stream", "queue_stream", stream_queue_info, methods=["GET"])
+
+if __name__ == "__main__":
+    app.run(threaded=True)
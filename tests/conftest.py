@@ -0,0 +1,45 @@
+import os, sys, uuid
+import pytest
+
+"""
+測試共用設定
+- 需要 MongoDB 的測試連到 TEST_MONGO_URI（預設本機 mongod），每次執行使用獨立的資料庫，結束後刪除
+- 找不到 mongod 時這些測試直接 skip；不需要 MongoDB 的測試照常執行
+- 在載入任何專案模組前設定 MONGO_URI / DATABASE_NAME（load_dotenv 不覆蓋已設定的環境變數，不會連到 .env 的資料庫）
+
+執行：
+    python -m pytest -q tests
+    TEST_MONGO_URI=mongodb://localhost:27018/?replicaSet=rs0 python -m pytest -q tests
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017")
+TEST_DATABASE_NAME = f"order_sys_test_{uuid.uuid4().hex[:8]}"
+os.environ["MONGO_URI"] = TEST_MONGO_URI
+os.environ["DATABASE_NAME"] = TEST_DATABASE_NAME   # 子行程（多行程測試）沿用同一個資料庫
+
+
+@pytest.fixture(scope="session")
+def mongo_client():
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        client.close()
+        pytest.skip(f"no mongod at {TEST_MONGO_URI}")
+    yield client
+    client.drop_database(TEST_DATABASE_NAME)
+    client.close()
+
+
+@pytest.fixture
+def mongo_db(mongo_client):
+    """清空後的測試資料庫"""
+    database = mongo_client[TEST_DATABASE_NAME]
+    for name in database.list_collection_names():
+        database.drop_collection(name)
+    return database
@@ -0,0 +1,128 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+"""
+會員點數同時加扣測試（需要 mongod）
+- 100 個同時寫入不可遺失更新，PointsLedger 的 delta 加總等於餘額
+- 餘額接近 0 時同時扣點不可扣成負數
+- 寫入 PointsLedger 失敗時還原 $inc
+"""
+
+WRITERS = 100
+USER_ID = "points-test"
+
+
+@pytest.fixture
+def points(mongo_db):
+    points_sys = pytest.importorskip("points.points_sys")
+    mongo_db.Users.insert_one({"_id": USER_ID, "points": 0})
+    return points_sys
+
+
+def run_concurrently(func, args_list):
+    """所有呼叫在同一時間點開始，回傳各自的結果（例外也當作結果回傳）"""
+    barrier = threading.Barrier(len(args_list))
+
+    def call(args):
+        barrier.wait()
+        try:
+            return func(*args)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(args_list)) as pool:
+        return list(pool.map(call, args_list))
+
+
+class BalanceMonitor:
+    """背景持續讀取餘額，記錄看過的最小值"""
+
+    def __init__(self, mongo_db):
+        self.users = mongo_db.Users
+        self.lowest = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            balance = self.users.find_one({"_id": USER_ID})["points"]
+            self.lowest = balance if self.lowest is None else min(self.lowest, balance)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def balance(mongo_db):
+    return mongo_db.Users.find_one({"_id": USER_ID})["points"]
+
+
+def ledger(mongo_db):
+    return list(mongo_db.PointsLedger.find({"user_id": USER_ID}))
+
+
+def test_parallel_writers_lose_no_updates(points, mongo_db):
+    results = run_concurrently(points.change_points, [(USER_ID, 7, "test")] * WRITERS)
+
+    assert sorted(results) == [7 * i for i in range(1, WRITERS + 1)]   # 每次異動回傳不同的餘額
+    assert balance(mongo_db) == 7 * WRITERS
+    entries = ledger(mongo_db)
+    assert len(entries) == WRITERS
+    assert sum(entry["delta"] for entry in entries) == balance(mongo_db)
+
+
+def test_concurrent_deductions_near_zero(points, mongo_db):
+    points.change_points(USER_ID, 50, "test")
+    with BalanceMonitor(mongo_db) as monitor:
+        results = run_concurrently(points.change_points, [(USER_ID, -1, "test")] * WRITERS)
+
+    assert len([r for r in results if isinstance(r, int)]) == 50
+    assert all(isinstance(r, points.InsufficientPoints) for r in results if not isinstance(r, int))
+    assert balance(mongo_db) == 0
+    assert monitor.lowest >= 0
+    entries = ledger(mongo_db)
+    assert all(entry["balance"] >= 0 for entry in entries)
+    assert sum(entry["delta"] for entry in entries) == 0
+
+
+def test_mixed_credits_and_debits(points, mongo_db):
+    points.change_points(USER_ID, 20, "test")
+    deltas = [3 if i % 2 else -5 for i in range(WRITERS)]
+    with BalanceMonitor(mongo_db) as monitor:
+        results = run_concurrently(points.change_points, [(USER_ID, delta, "test") for delta in deltas])
+
+    applied = [delta for delta, r in zip(deltas, results) if isinstance(r, int)]
+    assert all(delta < 0 for delta, r in zip(deltas, results) if isinstance(r, points.InsufficientPoints))
+    assert balance(mongo_db) == 20 + sum(applied) >= 0
+    assert monitor.lowest >= 0
+    assert sum(entry["delta"] for entry in ledger(mongo_db)) == balance(mongo_db)
+
+
+def test_ledger_failure_reverts_change(points, mongo_db, monkeypatch):
+    points.change_points(USER_ID, 10, "test")
+
+    class FailingLedger:
+        def insert_one(self, doc):
+            raise RuntimeError("ledger unavailable")
+
+    monkeypatch.setattr(points, "points_ledger_collection", FailingLedger())
+    with pytest.raises(RuntimeError):
+        points.change_points(USER_ID, -4, "test")
+    with pytest.raises(RuntimeError):
+        points.change_points(USER_ID, 4, "test")
+
+    assert balance(mongo_db) == 10
+    assert sum(entry["delta"] for entry in ledger(mongo_db)) == 10
+
+
+def test_unknown_user_and_insufficient_points(points, mongo_db):
+    with pytest.raises(points.PointsUserNotFound):
+        points.change_points("nobody", 5, "test")
+    with pytest.raises(points.InsufficientPoints):
+        points.change_points(USER_ID, -1, "test")
+    assert ledger(mongo_db) == []
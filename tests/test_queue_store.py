@@ -0,0 +1,127 @@
+import random, threading
+from datetime import datetime
+import pytest
+
+"""
+候位資料同時取號 / 叫號測試
+- MemoryQueueStore 不需要 MongoDB；MongoQueueStore 需要 mongod（各執行緒各自建立 store，模擬多個 worker）
+- 號碼不重複發出、不重複叫號或取消，候位計數與實際候位資料一致，版本號等於異動次數
+"""
+
+WORKERS = 16
+
+queue_store = pytest.importorskip("waiting.queue_store")
+
+
+def new_entry(rng):
+    return {"name": "test", "phone": "", "people": rng.randint(1, 6), "source": "onsite", "created_at": datetime.utcnow()}
+
+
+def hammer(make_store, operations):
+    """WORKERS 個執行緒同時取號、叫號、取消，回傳各操作取得的號碼"""
+    taken, called, cancelled, errors = [], [], [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(WORKERS)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        store = make_store()
+        mine = []
+        barrier.wait()
+        try:
+            for _ in range(operations):
+                action = rng.random()
+                if action < 0.5:
+                    entry = new_entry(rng)
+                    number = store.take(entry)
+                    mine.append(number)
+                    with lock:
+                        taken.append((number, entry["people"]))
+                    continue
+                if action < 0.65 and mine:
+                    entry, result = store.cancel(mine.pop(rng.randrange(len(mine)))), cancelled
+                elif action < 0.8:
+                    entry, result = store.call_next(), called
+                elif action < 0.95:
+                    entry, result = store.call_for_table(rng.randint(1, 6)), called
+                else:
+                    entry, result = store.call(rng.randint(1, len(taken) + 1)), called
+                if entry is not None:
+                    with lock:
+                        result.append(entry["queue_number"])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    return taken, called, cancelled
+
+
+def check_consistent(store, taken, called, cancelled, waiting_groups, waiting_people):
+    numbers = [number for number, _ in taken]
+    assert sorted(numbers) == list(range(1, len(numbers) + 1))   # 號碼連續且不重複
+    assert len(called) == len(set(called))
+    assert len(cancelled) == len(set(cancelled))
+    assert not set(called) & set(cancelled)
+
+    people = dict(taken)
+    remaining = set(numbers) - set(called) - set(cancelled)
+    assert waiting_groups == len(remaining)
+    assert waiting_people == sum(people[number] for number in remaining)
+    assert store.version() == len(taken) + len(called) + len(cancelled)
+
+    info = store.info()
+    assert info["remaining_groups"] == max(len(remaining) - 1, 0)
+    assert info["next_number"] == (min(remaining) if remaining else None)
+
+    # 剩下的號碼依序叫完
+    drained = []
+    while (entry := store.call_next()) is not None:
+        drained.append(entry["queue_number"])
+    assert drained == sorted(remaining)
+    assert store.info()["waiting_people"] == 0
+
+
+def test_memory_store_concurrent_take_and_call():
+    store = queue_store.MemoryQueueStore()
+    taken, called, cancelled = hammer(lambda: store, 400)
+    check_consistent(store, taken, called, cancelled, len(store.waiting), store.waiting_people)
+
+
+def test_memory_store_groups_ahead_matches_scan():
+    """隨機操作後，groups_ahead 與逐筆計算的結果相同"""
+    rng = random.Random(24)
+    store = queue_store.MemoryQueueStore()
+    for step in range(5000):
+        action = rng.random()
+        if action < 0.5:
+            store.take(new_entry(rng))
+        elif action < 0.7 and store.waiting:
+            store.cancel(rng.choice(list(store.waiting)))
+        elif action < 0.85:
+            store.call_next()
+        else:
+            store.call_for_table(rng.randint(1, 6))
+        if store.waiting and step % 10 == 0:
+            number = rng.choice(list(store.waiting))
+            size = store.waiting[number]["people"]
+            expected = sum(1 for other, entry in store.waiting.items() if entry["people"] == size and other < number)
+            assert store.info(number)["groups_ahead"] == expected
+
+
+def test_mongo_store_concurrent_take_and_call(mongo_db):
+    make_store = lambda: queue_store.MongoQueueStore(mongo_db.WaitingQueue, mongo_db.Counts)
+    store = make_store()
+    taken, called, cancelled = hammer(make_store, 100)
+
+    state = mongo_db.Counts.find_one({"_id": store.STATE_ID})
+    waiting = list(mongo_db.WaitingQueue.find({"status": "waiting"}))
+    assert state["waiting_groups"] == len(waiting)
+    assert state["waiting_people"] == sum(entry["people"] for entry in waiting)
+    assert mongo_db.WaitingQueue.count_documents({"status": "completed"}) == len(called)
+    assert mongo_db.WaitingQueue.count_documents({"status": "cancelled"}) == len(cancelled)
+    check_consistent(store, taken, called, cancelled, state["waiting_groups"], state["waiting_people"])
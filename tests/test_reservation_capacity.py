@@ -0,0 +1,68 @@
+import random, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pytest
+
+"""
+ReservationCapacity 同時預約測試（需要 mongod）
+200 筆預約同時打同一個尚未建立文件的時段：同時 upsert 的請求會撞 DuplicateKeyError 走重試，仍不可超賣
+"""
+
+BOOKINGS = 200
+DATE = datetime(2025, 1, 31)
+TIME_RANGE = "18:00-20:00"
+
+
+@pytest.fixture
+def capacity(mongo_db):
+    return pytest.importorskip("reservation.reservation_capacity")
+
+
+def run_concurrently(func, args_list):
+    """所有呼叫在同一時間點開始（barrier），回傳各自的結果"""
+    barrier = threading.Barrier(len(args_list))
+
+    def call(args):
+        barrier.wait()
+        return func(*args)
+
+    with ThreadPoolExecutor(max_workers=len(args_list)) as pool:
+        return list(pool.map(call, args_list))
+
+
+def reserved(mongo_db):
+    doc = mongo_db.ReservationCapacity.find_one({"_id": f"{DATE:%Y-%m-%d}|{TIME_RANGE}"})
+    return doc["reserved"] if doc else 0
+
+
+def test_concurrent_bookings_fill_slot_exactly(capacity, mongo_db):
+    results = run_concurrently(capacity.reserve_seats, [(DATE, TIME_RANGE, 2, 100)] * BOOKINGS)
+
+    assert results.count(True) == 50
+    assert reserved(mongo_db) == 100
+    assert mongo_db.ReservationCapacity.count_documents({}) == 1
+
+
+def test_concurrent_mixed_party_sizes_never_overbook(capacity, mongo_db):
+    rng = random.Random(25)
+    sizes = [rng.randint(1, 6) for _ in range(BOOKINGS)]
+    results = run_concurrently(capacity.reserve_seats, [(DATE, TIME_RANGE, guests, 97) for guests in sizes])
+
+    booked = sum(guests for guests, ok in zip(sizes, results) if ok)
+    assert booked <= 97
+    assert reserved(mongo_db) == booked
+    # 已預約人數只增不減：被拒絕的預約在最後一樣坐不下（沒有誤判座位不足）
+    assert all(booked + guests > 97 for guests, ok in zip(sizes, results) if not ok)
+
+
+def test_concurrent_release_returns_all_seats(capacity, mongo_db):
+    results = run_concurrently(capacity.reserve_seats, [(DATE, TIME_RANGE, 3, 90)] * BOOKINGS)
+    assert results.count(True) == 30
+
+    run_concurrently(capacity.release_seats, [(DATE, TIME_RANGE, 3)] * results.count(True))
+    assert reserved(mongo_db) == 0
+
+    # 釋放後可以重新預約滿
+    results = run_concurrently(capacity.reserve_seats, [(DATE, TIME_RANGE, 3, 90)] * BOOKINGS)
+    assert results.count(True) == 30
+    assert reserved(mongo_db) == 90
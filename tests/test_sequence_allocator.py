@@ -0,0 +1,130 @@
+import multiprocessing, os, threading
+import pytest
+
+"""
+SequenceAllocator 壓力測試：多執行緒、多行程同時發號不可重複
+- 多執行緒、跨日、fork 後發號以行程共用記憶體模擬 Counts（不需要 MongoDB）
+- 多行程使用真正的 Counts 文件（需要 mongod）
+"""
+
+THREADS = 32
+IDS_PER_THREAD = 200
+PROCESSES = 4
+
+func = pytest.importorskip("func")
+requires_fork = pytest.mark.skipif(not hasattr(os, "fork"), reason="需要 fork")
+
+
+class SharedCounter:
+    """模擬 reserve_sequence_block：每個 (計數器, 日期) 一個共用記憶體計數，fork 後的子行程也看得到"""
+
+    def __init__(self, date_parts, counter_name="order_id"):
+        self.counter_name = counter_name
+        self.values = {date_part: multiprocessing.Value("q", 0) for date_part in date_parts}
+        self.calls = multiprocessing.Value("q", 0)
+
+    def __call__(self, counter_name, date_part, block_size):
+        assert counter_name == self.counter_name
+        value = self.values[date_part]
+        with value.get_lock():
+            value.value += block_size
+            with self.calls.get_lock():
+                self.calls.value += 1
+            return value.value
+
+
+def allocate_many(allocator, date_parts, count):
+    return [(date_parts[i % len(date_parts)], allocator.next(date_parts[i % len(date_parts)])) for i in range(count)]
+
+
+def allocate_threaded(allocator, date_parts, threads=THREADS, count=IDS_PER_THREAD):
+    results, lock = [], threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        ids = allocate_many(allocator, date_parts, count)
+        with lock:
+            results.extend(ids)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results
+
+
+def _child(allocator, date_parts, queue):
+    """fork 出的子行程：多執行緒發號後回傳給父行程"""
+    queue.put(allocate_threaded(allocator, date_parts, threads=4, count=100))
+
+
+def allocate_in_children(allocator, date_parts):
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    children = [ctx.Process(target=_child, args=(allocator, date_parts, queue)) for _ in range(PROCESSES)]
+    for child in children:
+        child.start()
+    results = [item for _ in children for item in queue.get(timeout=60)]
+    for child in children:
+        child.join(timeout=60)
+        assert child.exitcode == 0
+    return results
+
+
+def assert_unique(ids):
+    assert len(ids) == len(set(ids))
+
+
+def test_threads_get_unique_contiguous_ids(monkeypatch):
+    counter = SharedCounter(["250101"])
+    monkeypatch.setattr(func, "reserve_sequence_block", counter)
+    allocator = func.SequenceAllocator("order_id", block_size=7)
+
+    ids = allocate_threaded(allocator, ["250101"])
+
+    values = sorted(value for _, value in ids)
+    assert values == list(range(1, THREADS * IDS_PER_THREAD + 1))   # 單一行程不浪費序號
+    assert counter.calls.value == -(-THREADS * IDS_PER_THREAD // 7)   # 每 7 號才向資料庫預留一次
+
+
+def test_day_rollover_restarts_sequence(monkeypatch):
+    monkeypatch.setattr(func, "reserve_sequence_block", SharedCounter(["250101", "250102"]))
+    allocator = func.SequenceAllocator("order_id", block_size=5)
+
+    assert [allocator.next("250101") for _ in range(3)] == [1, 2, 3]
+    assert allocator.next("250102") == 1   # 跨日從 1 開始
+    assert allocator.next("250101") == 6   # 回到前一天時另外預留新的一段，不重複
+
+    ids = allocate_threaded(allocator, ["250101", "250102"])
+    assert_unique(ids + [("250101", 1), ("250101", 2), ("250101", 3), ("250102", 1), ("250101", 6)])
+
+
+@requires_fork
+def test_fork_discards_parent_block(monkeypatch):
+    counter = SharedCounter(["250101", "250102"])
+    monkeypatch.setattr(func, "reserve_sequence_block", counter)
+    allocator = func.SequenceAllocator("order_id", block_size=20)
+    parent_ids = [("250101", allocator.next("250101"))]   # 父行程已預留 1..20
+
+    child_ids = allocate_in_children(allocator, ["250101", "250102"])
+    parent_ids += allocate_many(allocator, ["250101"], 50)
+
+    assert_unique(parent_ids + child_ids)
+    assert not {value for date_part, value in child_ids if date_part == "250101"} & set(range(1, 21))
+
+
+@requires_fork
+def test_processes_share_counts_document(mongo_db):
+    allocator = func.SequenceAllocator("order_id", block_size=10)
+    parent_ids = [("250101", allocator.next("250101"))]   # fork 前先建立連線並預留一段
+
+    child_ids = allocate_in_children(allocator, ["250101", "250102"])
+    parent_ids += allocate_threaded(allocator, ["250101", "250102"], threads=8, count=50)
+
+    ids = parent_ids + child_ids
+    assert_unique(ids)
+    for date_part in ("250101", "250102"):
+        counter = mongo_db.Counts.find_one({"_id": f"order_id:{date_part}"})
+        assert max(value for day, value in ids if day == date_part) <= counter["sequence_value"]
@@ -0,0 +1,176 @@
+import hashlib, math, os, sys, threading, time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from cachetools import LRUCache
+from pymongo import UpdateOne
+from config import jwt_config
+from mongoDB import blacklisted_tokens_collection
+from db_indexes import register_index, register_query
+
+"""
+後台登出 token 黑名單快取
+- 布隆過濾器判斷「一定沒被撤銷」時直接回傳，不查 MongoDB
+- 最近撤銷的 jti 放在 LRU 中，命中即視為已撤銷
+- 背景執行緒定期（短輪詢）從 blacklisted_tokens 同步其他 worker 新增的撤銷紀錄
+- 舊版寫入的紀錄沒有 revoked_at，TTL 索引不會刪除；部署後執行一次 python -m token_revocation backfill 補上
+"""
+
+POLL_INTERVAL = float(os.getenv("TOKEN_REVOCATION_POLL_SECONDS", "2"))   # 增量同步間隔（秒）
+REBUILD_INTERVAL = float(os.getenv("TOKEN_REVOCATION_REBUILD_SECONDS", "3600"))   # 完整重建間隔（秒），清除已過期的 jti
+# revoked_at 由各 worker 自己的時鐘寫入，較晚寫入的紀錄時間可能較早；增量同步往回多讀這段時間
+POLL_OVERLAP = timedelta(seconds=float(os.getenv("TOKEN_REVOCATION_POLL_OVERLAP_SECONDS", "300")))
+BLOOM_CAPACITY = int(os.getenv("TOKEN_REVOCATION_CAPACITY", "100000"))   # 預估黑名單筆數
+BLOOM_ERROR_RATE = 0.001   # 誤判率
+LRU_SIZE = 10000   # 最近撤銷 jti 的快取數量
+
+
+class BloomFilter:
+    """簡易布隆過濾器（只增不減）"""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(int(capacity), 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)   # bit 數
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)   # 雜湊次數
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class TokenRevocationCache:
+    """JWT 撤銷快取，negative 結果不會碰到 MongoDB"""
+
+    def __init__(self, collection, poll_interval=POLL_INTERVAL, rebuild_interval=REBUILD_INTERVAL):
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self.rebuild_interval = rebuild_interval
+        self.lock = threading.Lock()
+        self.bloom = BloomFilter(BLOOM_CAPACITY)
+        self.recent = LRUCache(maxsize=LRU_SIZE)
+        self.watermark = None   # 已同步到的 revoked_at
+        self.window = {}   # 重疊區間內已同步的 jti -> revoked_at（避免重複處理）
+        self.last_rebuild = 0
+        self.pid = None   # 背景執行緒所屬的行程（fork 後需重新啟動）
+
+    def rebuild(self):
+        """從 blacklisted_tokens 完整重建布隆過濾器"""
+        jtis = [doc["jti"] for doc in self.collection.find({}, {"_id": 0, "jti": 1}) if "jti" in doc]
+        bloom = BloomFilter(max(BLOOM_CAPACITY, len(jtis) * 2))
+        for jti in jtis:
+            bloom.add(jti)
+        latest = self.collection.find_one({"revoked_at": {"$exists": True}}, {"revoked_at": 1}, sort=[("revoked_at", -1)])
+        with self.lock:
+            self.bloom = bloom
+            self.watermark = latest["revoked_at"] if latest else None
+            self.window = {}
+            self.last_rebuild = time.monotonic()
+
+    def poll(self):
+        """增量同步上次之後新增的撤銷紀錄"""
+        if time.monotonic() - self.last_rebuild >= self.rebuild_interval:
+            self.rebuild()
+            return
+        # 從 watermark 往回 POLL_OVERLAP 開始讀，時鐘誤差或寫入先後造成較早時間戳的紀錄也不會漏掉
+        since = self.watermark - POLL_OVERLAP if self.watermark else None
+        query = {"revoked_at": {"$gte": since}} if since else {"revoked_at": {"$exists": True}}
+        for doc in self.collection.find(query, {"_id": 0, "jti": 1, "revoked_at": 1}):
+            with self.lock:
+                if doc["jti"] in self.window:
+                    continue
+                self.window[doc["jti"]] = doc["revoked_at"]
+                self.bloom.add(doc["jti"])
+                if self.watermark is None or doc["revoked_at"] > self.watermark:
+                    self.watermark = doc["revoked_at"]
+        with self.lock:
+            if self.watermark:
+                cutoff = self.watermark - POLL_OVERLAP
+                self.window = {jti: at for jti, at in self.window.items() if at >= cutoff}
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"token revocation poll failed: {e}")
+
+    def start(self):
+        """啟動背景同步（每個行程各自啟動一次）"""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+        # 第一次重建成功後才算啟動；失敗時拋出例外，下次呼叫會再重試（不會留下空的布隆過濾器）
+        self.rebuild()
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        threading.Thread(target=self._run, name="token-revocation-poller", daemon=True).start()
+
+    def revoke(self, jti):
+        """寫入黑名單並立即更新本地快取"""
+        self.start()
+        self.collection.insert_one({"jti": jti, "revoked_at": datetime.now()})
+        with self.lock:
+            self.bloom.add(jti)
+            self.recent[jti] = True
+
+    def is_revoked(self, jti):
+        """布隆過濾器未命中即回傳 False；命中時才回 MongoDB 確認（排除誤判）"""
+        self.start()
+        with self.lock:
+            if jti in self.recent:
+                return True
+            if jti not in self.bloom:
+                return False
+        revoked = self.collection.find_one({"jti": jti}, {"_id": 1}) is not None
+        if revoked:
+            with self.lock:
+                self.recent[jti] = True
+        return revoked
+
+
+def backfill_revoked_at(collection=blacklisted_tokens_collection, batch_size=1000):
+    """
+    舊紀錄補上 revoked_at（以 ObjectId 的建立時間為撤銷時間，轉為與 datetime.now() 相同的本地時間），
+    讓 TTL 索引可以刪除；回傳更新筆數
+    """
+    updated = 0
+    batch = []
+    for doc in collection.find({"revoked_at": {"$exists": False}}, {"_id": 1}):
+        if isinstance(doc["_id"], ObjectId):
+            revoked_at = doc["_id"].generation_time.astimezone().replace(tzinfo=None)
+        else:
+            revoked_at = datetime.now()   # 無法得知寫入時間，從現在起算過期
+        batch.append(UpdateOne({"_id": doc["_id"], "revoked_at": {"$exists": False}}, {"$set": {"revoked_at": revoked_at}}))
+        if len(batch) == batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+
+# jti 索引 + revoked_at TTL 索引（token 過期後自動刪除黑名單紀錄）
+register_index("blacklisted_tokens", "jti")
+register_index("blacklisted_tokens", "revoked_at", expireAfterSeconds=int(jwt_config.JWT_ACCESS_TOKEN_EXPIRES.total_seconds()))
+register_query("token revoked", "blacklisted_tokens", {"jti": "example-jti"})
+
+token_revocation = TokenRevocationCache(blacklisted_tokens_collection)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["backfill"]:
+        print(f"blacklisted_tokens backfilled: {backfill_revoked_at()} records")
+    else:
+        print("usage: python -m token_revocation backfill")
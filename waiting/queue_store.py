@@ -0,0 +1,389 @@
+import heapq, os, threading, time
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from mongoDB import get_waiting_queue_collection, get_counts_collection
+from db_indexes import register_index
+
+"""
+候位資料儲存
+- MemoryQueueStore：存在本行程記憶體，只適合單一行程（開發、測試）
+- MongoQueueStore：存在 WaitingQueue 集合，多個 worker 共用，重啟後保留；取號與叫號皆為單一原子操作
+- 候位組數與總人數在取號、取消、叫號時增減，info() 不需掃描候位資料
+- 依人數分組：空出一張 capacity 人的桌子時，call_for_table() 叫人數不超過 capacity 的最大一組（同人數取最早的號碼）
+- 每個人數各自以指數移動平均記錄叫號間隔（翻桌時間），估計候位等待時間；叫號時更新，不需讀取歷史紀錄
+- 取號超過 QUEUE_WAITING_TTL_SECONDS 仍未叫號的資料改為 expired（同時扣掉候位計數），避免隔天仍留在候位中
+- 以環境變數 QUEUE_STORE=mongo / memory 選擇（預設 mongo）
+
+兩者介面相同：
+    take(entry) -> 號碼
+    get(queue_number) -> 號碼資料或 None（記憶體版只保留候位中的號碼，Mongo 版含已叫號 / 取消 / 過期）
+    cancel(queue_number) / call(queue_number) -> 被取消 / 叫號的資料，號碼不在候位中時回傳 None
+    call_next() -> 最早的候位資料或 None
+    call_for_table(capacity) -> 最適合該桌的候位資料或 None
+    info(queue_number=None) -> {"version", "current_number", "next_number", "next_people", "remaining_groups",
+                                "waiting_people", "turnaround_seconds"}
+        指定 queue_number 時另外回傳該號碼的 people、groups_ahead（同人數排在前面的組數）、estimated_wait_seconds
+    version() -> 候位資料版本（每次取號、取消、叫號、過期加一，供 /queue/stream 判斷是否異動）
+"""
+
+QUEUE_STORE = os.getenv("QUEUE_STORE", "mongo")
+QUEUE_TTL_SECONDS = int(os.getenv("QUEUE_TTL_SECONDS", "3600"))   # 已叫號 / 取消 / 過期的候位資料保留秒數
+QUEUE_WAITING_TTL_SECONDS = int(os.getenv("QUEUE_WAITING_TTL_SECONDS", "3600"))   # 候位中的資料超過此秒數改為 expired
+QUEUE_EXPIRE_CHECK_SECONDS = float(os.getenv("QUEUE_EXPIRE_CHECK_SECONDS", "30"))   # Mongo 版檢查過期資料的間隔
+TURNAROUND_ALPHA = float(os.getenv("QUEUE_TURNAROUND_ALPHA", "0.3"))   # 移動平均中最新一次間隔的權重
+TURNAROUND_MAX_GAP = float(os.getenv("QUEUE_TURNAROUND_MAX_GAP_SECONDS", "3600"))   # 超過此間隔（例如隔天）不計入
+DEFAULT_TURNAROUND = float(os.getenv("QUEUE_DEFAULT_TURNAROUND_SECONDS", "600"))   # 尚無資料時的翻桌時間
+
+
+def _info(version, current_number, next_entry, waiting_groups, waiting_people, turnaround):
+    return {
+        "version": version,
+        "current_number": current_number,
+        "next_number": next_entry["queue_number"] if next_entry else None,
+        "next_people": next_entry["people"] if next_entry else 0,
+        "remaining_groups": max(waiting_groups - 1, 0),   # 不含下一組
+        "waiting_people": waiting_people,   # 所有候位中的總人數
+        "turnaround_seconds": {key: round(value, 1) for key, value in turnaround.items()},   # 各人數的平均叫號間隔
+    }
+
+
+def _estimate(info, entry, groups_ahead):
+    """依同人數排在前面的組數與該人數的翻桌時間估計等待秒數"""
+    turnaround = info["turnaround_seconds"]
+    seconds = turnaround.get(str(entry["people"]), turnaround.get("all", DEFAULT_TURNAROUND))
+    info.update(
+        queue_number=entry["queue_number"],
+        people=entry["people"],
+        groups_ahead=groups_ahead,
+        estimated_wait_seconds=round((groups_ahead + 1) * seconds)
+    )
+    return info
+
+
+class TurnaroundEstimator:
+    """記憶體版的翻桌時間估計：{人數: 平均叫號間隔}，"all" 為不分人數"""
+
+    def __init__(self):
+        self.turnaround = {}
+        self.last_called_at = {}
+
+    def record(self, people, when):
+        for key in (str(people), "all"):
+            last = self.last_called_at.get(key)
+            self.last_called_at[key] = when
+            if last is None:
+                continue
+            gap = (when - last).total_seconds()
+            if gap > TURNAROUND_MAX_GAP:
+                continue
+            current = self.turnaround.get(key)
+            self.turnaround[key] = gap if current is None else (1 - TURNAROUND_ALPHA) * current + TURNAROUND_ALPHA * gap
+
+
+def _turnaround_stages(people, now):
+    """Mongo 版的翻桌時間估計：在更新候位狀態文件的 pipeline 中計算移動平均（單一原子更新）"""
+    fields = {}
+    for key in (str(people), "all"):
+        last = f"$last_called_at.{key}"
+        current = f"$turnaround.{key}"
+        gap = {"$divide": [{"$subtract": [now, last]}, 1000]}
+        fields[f"turnaround.{key}"] = {"$cond": [
+            {"$and": [{"$gt": [last, None]}, {"$lte": [gap, TURNAROUND_MAX_GAP]}]},
+            {"$cond": [
+                {"$gt": [current, None]},
+                {"$add": [{"$multiply": [1 - TURNAROUND_ALPHA, current]}, {"$multiply": [TURNAROUND_ALPHA, gap]}]},
+                gap
+            ]},
+            current
+        ]}
+        fields[f"last_called_at.{key}"] = now
+    return fields
+
+
+class RankCounter:
+    """
+    可在尾端加入的 Fenwick tree（樹狀陣列），記錄同人數候位號碼的順位
+    號碼依取號順序 append() 取得順位，離開候位時 remove()；ahead() 回傳排在前面仍在候位的組數，皆為 O(log n)
+    """
+
+    def __init__(self, size=0):
+        self.tree = [0] + [i & -i for i in range(1, size + 1)]   # 前 size 個順位皆在候位中
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def _prefix(self, i):
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def append(self):
+        """加入一個在候位中的順位，回傳該順位（從 1 開始）"""
+        i = len(self.tree)
+        # tree[i] 涵蓋 (i - lowbit(i), i]，其中 i 本身為 1，其餘由前綴和相減取得
+        self.tree.append(1 + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+        return i
+
+    def remove(self, rank):
+        while rank < len(self.tree):
+            self.tree[rank] -= 1
+            rank += rank & -rank
+
+    def ahead(self, rank):
+        return self._prefix(rank - 1)
+
+
+class MemoryQueueStore:
+    """
+    候位中的號碼存在 min-heap（取號 O(log n)，查看下一組 O(1)），另依人數各存一個 min-heap
+    取消或叫號只從 waiting 移除，heap 中的號碼留到浮到頂端時才丟棄（lazy deletion）
+    號碼依取號時間遞增，過期的資料一定在 heap 頂端，每次操作前從頂端移除即可
+    同人數排在前面的組數由各人數的 RankCounter 計算（O(log n)）
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.current_number = None
+        self.waiting = {}   # queue_number -> entry
+        self.heap = []   # 候位號碼（可能含已取消 / 已叫號的號碼）
+        self.buckets = {}   # 人數 -> 該人數的候位號碼 heap
+        self.counters = {}   # 人數 -> 該人數的 RankCounter
+        self.ranks = {}   # queue_number -> 在同人數中的順位
+        self.waiting_people = 0
+        self._version = 0
+        self.estimator = TurnaroundEstimator()
+
+    def _top(self, heap):
+        """丟棄 heap 頂端已不在候位中的號碼，回傳最小的候位號碼"""
+        while heap and heap[0] not in self.waiting:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _rebuild(self):
+        """被跳過的號碼太多時重建 heap 與順位計數，避免無限制變大"""
+        self.heap = list(self.waiting)
+        heapq.heapify(self.heap)
+        self.buckets = {}
+        for queue_number, entry in self.waiting.items():
+            self.buckets.setdefault(entry["people"], []).append(queue_number)
+        self.counters = {}
+        self.ranks = {}
+        for people, numbers in self.buckets.items():
+            numbers.sort()   # 已排序的 list 即為 min-heap
+            self.counters[people] = RankCounter(len(numbers))
+            self.ranks.update((queue_number, rank) for rank, queue_number in enumerate(numbers, 1))
+
+    def _remove(self, queue_number, called=False):
+        entry = self.waiting.pop(queue_number, None)
+        if entry is not None:
+            self.waiting_people -= entry["people"]
+            self._version += 1
+            self.counters[entry["people"]].remove(self.ranks.pop(queue_number))
+            if called:
+                self.current_number = queue_number
+                self.estimator.record(entry["people"], datetime.utcnow())
+            slots = max(len(self.heap), sum(len(counter) for counter in self.counters.values()))
+            if slots > 2 * len(self.waiting) + 64:
+                self._rebuild()
+        return entry
+
+    def _expire(self):
+        """移除取號超過 QUEUE_WAITING_TTL_SECONDS 的候位資料"""
+        deadline = datetime.utcnow() - timedelta(seconds=QUEUE_WAITING_TTL_SECONDS)
+        while True:
+            queue_number = self._top(self.heap)
+            if queue_number is None or self.waiting[queue_number]["created_at"] >= deadline:
+                return
+            self._remove(queue_number)
+
+    def take(self, entry):
+        with self.lock:
+            self._expire()
+            self.counter += 1
+            self.waiting[self.counter] = dict(entry, queue_number=self.counter, status="waiting")
+            self.waiting_people += entry["people"]
+            self._version += 1
+            heapq.heappush(self.heap, self.counter)
+            heapq.heappush(self.buckets.setdefault(entry["people"], []), self.counter)
+            self.ranks[self.counter] = self.counters.setdefault(entry["people"], RankCounter()).append()
+            return self.counter
+
+    def get(self, queue_number):
+        with self.lock:
+            self._expire()
+            return self.waiting.get(queue_number)
+
+    def version(self):
+        with self.lock:
+            self._expire()
+            return self._version
+
+    def cancel(self, queue_number):
+        with self.lock:
+            self._expire()
+            entry = self._remove(queue_number)
+            return entry and dict(entry, status="cancelled")
+
+    def call(self, queue_number):
+        with self.lock:
+            self._expire()
+            entry = self._remove(queue_number, called=True)
+            return entry and dict(entry, status="completed")
+
+    def call_next(self):
+        with self.lock:
+            self._expire()
+            queue_number = self._top(self.heap)
+            if queue_number is None:
+                return None
+            return dict(self._remove(queue_number, called=True), status="completed")
+
+    def call_for_table(self, capacity):
+        with self.lock:
+            self._expire()
+            # 人數種類有限，由大到小找第一個有人候位且坐得下的人數
+            for people in sorted(self.buckets, reverse=True):
+                if people > capacity:
+                    continue
+                queue_number = self._top(self.buckets[people])
+                if queue_number is None:
+                    del self.buckets[people]
+                    continue
+                return dict(self._remove(queue_number, called=True), status="completed")
+            return None
+
+    def info(self, queue_number=None):
+        with self.lock:
+            self._expire()
+            next_number = self._top(self.heap)
+            next_entry = self.waiting[next_number] if next_number is not None else None
+            info = _info(self._version, self.current_number, next_entry, len(self.waiting), self.waiting_people,
+                         self.estimator.turnaround)
+            entry = self.waiting.get(queue_number)
+            if entry is None:
+                return info
+            groups_ahead = self.counters[entry["people"]].ahead(self.ranks[queue_number])
+            return _estimate(info, entry, groups_ahead)
+
+
+class MongoQueueStore:
+    """
+    WaitingQueue 文件：{_id: 號碼, queue_number, name, phone, people, source, status, created_at, called_at}
+    號碼、目前叫號與候位計數存在 Counts 的 {_id: "waiting_queue", sequence_value, current_number, waiting_groups, waiting_people, version}
+    候位中的資料超過 QUEUE_WAITING_TTL_SECONDS 時經由 _close() 改為 expired（扣掉候位計數，不直接以 TTL 刪除以免計數失準），
+    已叫號 / 取消 / 過期的資料在 closed_at 後 QUEUE_TTL_SECONDS 刪除
+    """
+
+    STATE_ID = "waiting_queue"
+
+    def __init__(self, collection, counts):
+        self.collection = collection
+        self.counts = counts
+        self.next_expire_check = 0   # 下次檢查過期資料的時間（time.monotonic()）
+
+    def _maybe_expire(self):
+        """每 QUEUE_EXPIRE_CHECK_SECONDS 最多檢查一次，把過期的候位資料逐筆改為 expired"""
+        now = time.monotonic()
+        if now < self.next_expire_check:
+            return
+        self.next_expire_check = now + QUEUE_EXPIRE_CHECK_SECONDS
+        deadline = datetime.utcnow() - timedelta(seconds=QUEUE_WAITING_TTL_SECONDS)
+        while self._close({"created_at": {"$lt": deadline}}, "expired", sort=[("created_at", 1)]) is not None:
+            pass
+
+    def take(self, entry):
+        self._maybe_expire()
+        state = self.counts.find_one_and_update(
+            {"_id": self.STATE_ID},
+            {"$inc": {"sequence_value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        queue_number = state["sequence_value"]
+        self.collection.insert_one(dict(entry, _id=queue_number, queue_number=queue_number, status="waiting"))
+        # 寫入候位資料後才更新計數與版本，讀到新版本的 info() 一定看得到這筆資料
+        self.counts.update_one(
+            {"_id": self.STATE_ID},
+            {"$inc": {"waiting_groups": 1, "waiting_people": entry["people"], "version": 1}}
+        )
+        return queue_number
+
+    def get(self, queue_number):
+        return self.collection.find_one({"_id": queue_number})
+
+    def version(self):
+        self._maybe_expire()
+        state = self.counts.find_one({"_id": self.STATE_ID}, {"version": 1}) or {}
+        return state.get("version", 0)
+
+    def _close(self, query, status, sort=None):
+        """把一筆候位中的資料改為 completed / cancelled / expired，並扣掉候位計數"""
+        now = datetime.utcnow()
+        changes = {"status": status, "closed_at": now}
+        if status == "completed":
+            changes["called_at"] = now
+        entry = self.collection.find_one_and_update(
+            dict(query, status="waiting"),
+            {"$set": changes},
+            sort=sort,
+            return_document=ReturnDocument.AFTER
+        )
+        if entry is not None:
+            fields = {
+                "waiting_groups": {"$add": ["$waiting_groups", -1]},
+                "waiting_people": {"$add": ["$waiting_people", -entry["people"]]},
+                "version": {"$add": ["$version", 1]},
+            }
+            if status == "completed":
+                fields["current_number"] = entry["queue_number"]
+                fields.update(_turnaround_stages(entry["people"], now))
+            self.counts.update_one({"_id": self.STATE_ID}, [{"$set": fields}])
+        return entry
+
+    def cancel(self, queue_number):
+        self._maybe_expire()
+        return self._close({"_id": queue_number}, "cancelled")
+
+    def call(self, queue_number):
+        self._maybe_expire()
+        return self._close({"_id": queue_number}, "completed")
+
+    def call_next(self):
+        self._maybe_expire()
+        return self._close({}, "completed", sort=[("_id", 1)])
+
+    def call_for_table(self, capacity):
+        self._maybe_expire()
+        # (status, people -1, _id) 索引：第一筆即人數最多且號碼最小的一組
+        return self._close({"people": {"$lte": capacity}}, "completed", sort=[("people", -1), ("_id", 1)])
+
+    def info(self, queue_number=None):
+        self._maybe_expire()
+        state = self.counts.find_one({"_id": self.STATE_ID}) or {}
+        next_entry = self.collection.find_one({"status": "waiting"}, sort=[("_id", 1)])
+        info = _info(state.get("version", 0), state.get("current_number"), next_entry, state.get("waiting_groups", 0),
+                     state.get("waiting_people", 0), state.get("turnaround", {}))
+        if queue_number is None:
+            return info
+        entry = self.collection.find_one({"_id": queue_number, "status": "waiting"})
+        if entry is None:
+            return info
+        groups_ahead = self.collection.count_documents(
+            {"status": "waiting", "people": entry["people"], "_id": {"$lt": queue_number}}
+        )
+        return _estimate(info, entry, groups_ahead)
+
+
+def create_queue_store():
+    if QUEUE_STORE == "memory":
+        return MemoryQueueStore()
+    if QUEUE_STORE != "mongo":
+        raise ValueError("Invalid QUEUE_STORE. Allowed values are ['mongo', 'memory']")
+    register_index("WaitingQueue", [("status", 1), ("_id", 1)])   # 依號碼順序找下一組
+    register_index("WaitingQueue", [("status", 1), ("people", -1), ("_id", 1)])   # 依桌子人數找候位組、計算同人數的順位
+    register_index("WaitingQueue", [("status", 1), ("created_at", 1)])   # 找出過期的候位資料
+    register_index("WaitingQueue", "closed_at", expireAfterSeconds=QUEUE_TTL_SECONDS)   # 已叫號 / 取消 / 過期的資料自動刪除
+    return MongoQueueStore(get_waiting_queue_collection(), get_counts_collection())
@@ -0,0 +1,103 @@
+import os, threading, time
+from flask import Response, request
+from json_response import dumps
+
+"""
+候位資訊推播（Server-Sent Events）
+- 每個行程一個 QueueBroadcaster：背景執行緒每 QUEUE_STREAM_POLL_SECONDS 讀一次候位版本（其他 worker 的異動也會收到）
+- 版本改變時才讀取候位資訊並編碼一次，所有訂閱者共用同一份 bytes
+- 本行程的取號、取消、叫號後呼叫 publish() 立即推播
+- 訂閱者閒置時每 QUEUE_STREAM_HEARTBEAT_SECONDS 送一次註解行，避免連線被 proxy 關閉
+- gthread worker 下每條串流佔用一個執行緒直到斷線：
+  主程式（wsgi:app）預設只讓 GUNICORN_THREADS - QUEUE_STREAM_RESERVED_THREADS 條串流佔用執行緒，其餘回傳 503 改用 /queue/info 輪詢，
+  大量訂閱請另外啟動只提供 /queue/stream 的行程（stream_wsgi:app，見該檔說明），不影響其他 API
+"""
+
+QUEUE_STREAM_POLL_SECONDS = float(os.getenv("QUEUE_STREAM_POLL_SECONDS", "1"))
+QUEUE_STREAM_HEARTBEAT_SECONDS = float(os.getenv("QUEUE_STREAM_HEARTBEAT_SECONDS", "15"))
+QUEUE_STREAM_RESERVED_THREADS = int(os.getenv("QUEUE_STREAM_RESERVED_THREADS", "2"))   # 保留給一般請求的執行緒數
+# 每個行程的訂閱上限（預設為 gunicorn 執行緒數扣掉保留數）
+QUEUE_STREAM_MAX_SUBSCRIBERS = int(os.getenv(
+    "QUEUE_STREAM_MAX_SUBSCRIBERS",
+    max(int(os.getenv("GUNICORN_THREADS", "4")) - QUEUE_STREAM_RESERVED_THREADS, 0)
+))
+
+
+class QueueBroadcaster:
+    def __init__(self, store, poll_interval=QUEUE_STREAM_POLL_SECONDS):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+        self.version = None
+        self.event = None   # 最新快照編碼後的 SSE 事件
+        self.subscribers = 0
+        self.pid = None   # 背景執行緒所屬的行程（fork 後需重新啟動）
+
+    def publish(self):
+        """讀取候位資訊，版本較新時通知所有訂閱者"""
+        info = self.store.info()
+        with self.condition:
+            if self.version is not None and info["version"] <= self.version:
+                return
+            self.version = info["version"]
+            self.event = b"id: %d\nevent: queue\ndata: %s\n\n" % (info["version"], dumps(info))
+            self.condition.notify_all()
+
+    def changed(self):
+        """本行程異動候位資料後呼叫；本行程沒有訂閱者時不做事"""
+        if self.pid == os.getpid():
+            self.publish()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                if self.store.version() != self.version:
+                    self.publish()
+            except Exception as e:
+                print(f"queue stream poll failed: {e}")
+
+    def start(self):
+        """啟動背景輪詢（每個行程各自啟動一次；第一次讀取候位資訊成功後才算啟動，失敗時由下一個請求重試）"""
+        with self.condition:
+            if self.pid == os.getpid():
+                return
+        self.publish()
+        with self.condition:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        threading.Thread(target=self._run, name="queue-stream-poller", daemon=True).start()
+
+    def subscribe(self, last_version=None, heartbeat=QUEUE_STREAM_HEARTBEAT_SECONDS):
+        """產生 SSE 事件；last_version 為用戶端已收到的版本（Last-Event-ID）"""
+        while True:
+            with self.condition:
+                if self.event is None or self.version == last_version:
+                    self.condition.wait(heartbeat)
+                version, event = self.version, self.event
+            if event is None or version == last_version:   # 尚未讀到候位資訊時只送 keepalive
+                yield b": keepalive\n\n"
+                continue
+            last_version = version
+            yield event
+
+    def _unsubscribe(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def stream_response(self):
+        self.start()
+        with self.condition:
+            if self.subscribers >= QUEUE_STREAM_MAX_SUBSCRIBERS:
+                return None
+            self.subscribers += 1
+        try:
+            last_version = int(request.headers.get("Last-Event-ID", ""))
+        except ValueError:
+            last_version = None
+        response = Response(self.subscribe(last_version), mimetype="text/event-stream")
+        response.call_on_close(self._unsubscribe)   # 連線結束（含尚未開始送出）時扣掉訂閱數
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"   # nginx 不要緩衝串流
+        return response
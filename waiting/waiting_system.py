@@ -1,20 +1,15 @@
-from flask import Flask, request, jsonify
-from cachetools import TTLCache
+from flask import request, jsonify
 from datetime import datetime
 import re
 from dotenv import load_dotenv
+from waiting.queue_store import create_queue_store
+from waiting.queue_stream import QueueBroadcaster
 
 load_dotenv()
-app = Flask(__name__)
 
-# 暫存最近 100 筆候位資料，TTL 設定為 1 小時（3600 秒）
-queue_cache = TTLCache(maxsize=100, ttl=3600)
-
-# 全域變數用於追蹤候位狀態
-queue_counter = 1  # 自增的候位號碼
-current_queue_number = None  # 目前已叫號的號碼，若無則為 None
-next_queue_number = None  # 下一組候位號碼
-remaining_groups = 0  # 候位中尚未叫號的組數
+# 候位資料（QUEUE_STORE=mongo 時各 worker 共用，重啟後保留）
+queue_store = create_queue_store()
+queue_broadcaster = QueueBroadcaster(queue_store)   # /queue/stream 推播
 
 """
 #error code
@@ -23,22 +18,6 @@ remaining_groups = 0  # 候位中尚未叫號的組數
 405 ->號碼不存在
 """ 
 
-def update_queue_info():
-    """
-    更新目前號碼、下一組號碼與剩餘組數的資訊。
-    - current_queue_number：顯示最後一個叫過的號碼（若無則為 None）。
-    - next_queue_number：顯示第一個 waiting 狀態的號碼。
-    - remaining_groups：顯示剩餘候位組數。
-    """
-    global current_queue_number, next_queue_number, remaining_groups
-    waiting_queues = sorted(num for num, data in queue_cache.items() if data["status"] == "waiting")
-    
-    # 目前號碼顯示已叫過的最後一組號碼，還未叫號則為 None
-    current_queue_number = None if not waiting_queues else waiting_queues[0] - 1
-    next_queue_number = waiting_queues[0] if waiting_queues else None  # 下一組候位號碼
-    remaining_groups = len(waiting_queues) - 1 if len(waiting_queues) > 1 else 0  # 剩餘組數
-
-
 def take_queue():
     """
     抽取候位號碼：
@@ -46,7 +25,6 @@ def take_queue():
     - 檢查必要參數（people、source），並驗證格式。
     - 來源可以是 Line official 或 onsite，Line official 需提供姓名與電話號碼。
     """
-    global queue_counter
     if request.is_json:
         data = request.get_json()
     else:
@@ -78,55 +56,44 @@ def take_queue():
         if not phone or len(phone) != 10 or not phone.isdigit() or not phone.startswith("09"):
             return jsonify({"error": "電話號碼格式不正確，必須為 09 開頭的 10 碼數字"}), 400
 
-    # 生成號碼並更新 queue_counter
-    queue_number = queue_counter
-    queue_counter += 1
-
-    # 儲存候位資料到快取
-    queue_cache[queue_number] = {
-        "queue_number": queue_number,
+    # 取號並儲存候位資料
+    queue_number = queue_store.take({
         "name": name,
         "phone": phone,
         "people": people,
         "source": source,
-        "status": "waiting",
         "created_at": datetime.utcnow()
-    }
-
-    # 更新候位資訊
-    update_queue_info()
+    })
 
+    queue_broadcaster.changed()
     return jsonify({"queue_number": queue_number, "status": "waiting"})
 
 
 def cancel_queue(queue_number):
     """
     取消候位號碼：
-    - 若號碼存在於快取中，將其移除並更新候位資訊。
+    - 若號碼仍在候位中，將其取消。
     - 如果號碼不存在或已過期，回傳 404。
     """
-    if queue_number not in queue_cache:
+    if queue_store.cancel(queue_number) is None:
         return jsonify({"error": "號碼不存在或已過期"}), 404
 
-    queue_cache.pop(queue_number)  # 從快取移除該號碼
-    update_queue_info()
+    queue_broadcaster.changed()
     return jsonify({"queue_number": queue_number, "status": "cancelled"})
 
 
 def call_specific_queue(queue_number):
     """
     指定叫號：
-    - 僅限 waiting 狀態的號碼能被叫號，並將其移除快取。
+    - 僅限 waiting 狀態的號碼能被叫號（以狀態為條件更新，同時叫號只有一個會成功）。
     - 若號碼不存在或非 waiting 狀態，回傳相應錯誤。
     """
-    if queue_number not in queue_cache:
-        return jsonify({"error": "號碼不存在或已過期"}), 404
-
-    if queue_cache[queue_number]["status"] != "waiting":
+    if queue_store.call(queue_number) is None:
+        if queue_store.get(queue_number) is None:
+            return jsonify({"error": "號碼不存在或已過期"}), 404
         return jsonify({"error": "該號碼無法被叫號"}), 403
 
-    queue_cache.pop(queue_number)  # 從快取移除該號碼
-    update_queue_info()
+    queue_broadcaster.changed()
     return jsonify({"queue_number": queue_number, "status": "completed"})
 
 
@@ -136,15 +103,34 @@ def auto_call_queue():
     - 依序尋找第一個 waiting 狀態的號碼，並將其設為 completed。
     - 若無待叫號碼，回傳 405 錯誤。
     """
-    global current_queue_number
-    for queue_number, data in sorted(queue_cache.items()):
-        if data["status"] == "waiting":
-            current_queue_number = queue_number  # 更新目前號碼
-            queue_cache.pop(queue_number)  # 從快取移除該號碼
-            update_queue_info()
-            return jsonify({"queue_number": queue_number, "status": "completed"})
+    entry = queue_store.call_next()
+    if entry is None:
+        return jsonify({"error": "目前無候位號碼"}), 405
 
-    return jsonify({"error": "目前無候位號碼"}), 405
+    queue_broadcaster.changed()
+    return jsonify({"queue_number": entry["queue_number"], "status": "completed"})
+
+
+def seat_queue():
+    """
+    空桌叫號：
+    - capacity 為空出的桌子可坐人數，叫人數不超過 capacity 的最大一組（同人數依號碼順序）。
+    - 若沒有坐得下的候位組，回傳 405 錯誤。
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        capacity = int(data.get("capacity"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "capacity 必須為有效數字"}), 400
+    if capacity <= 0:
+        return jsonify({"error": "capacity 必須大於 0"}), 400
+
+    entry = queue_store.call_for_table(capacity)
+    if entry is None:
+        return jsonify({"error": "目前無適合此桌的候位組"}), 405
+
+    queue_broadcaster.changed()
+    return jsonify({"queue_number": entry["queue_number"], "people": entry["people"], "status": "completed"})
 
 
 def get_queue_info():
@@ -154,13 +140,25 @@ def get_queue_info():
     - next_number：下一組候位號碼。
     - next_people：下一組人數（若無則為 0）。
     - remaining_groups：尚未叫號的組數。
+    - turnaround_seconds：各人數的平均叫號間隔。
+    - 帶 ?queue_number= 時另外回傳該號碼的 groups_ahead 與 estimated_wait_seconds（預估等待秒數）。
     """
-    next_people = queue_cache[next_queue_number]["people"] if next_queue_number else 0
-    return jsonify({
-        "current_number": current_queue_number,
-        "next_number": next_queue_number,
-        "next_people": next_people,
-        "remaining_groups": remaining_groups
-    })
+    queue_number = request.args.get("queue_number")
+    if queue_number is not None:
+        if not queue_number.isdigit():
+            return jsonify({"error": "號碼必須為有效數字"}), 400
+        queue_number = int(queue_number)
+    return jsonify(queue_store.info(queue_number))
 
 
+def stream_queue_info():
+    """
+    候位資訊推播（text/event-stream）：
+    - 連線後先送出目前的候位資訊，之後每次異動送出一筆 event: queue，id 為候位資料版本。
+    - 斷線重連時瀏覽器會帶 Last-Event-ID，版本未變則不重送。
+    - 本行程訂閱數已達上限時回傳 503，用戶端可改用 /queue/info 輪詢。
+    """
+    response = queue_broadcaster.stream_response()
+    if response is None:
+        return jsonify({"error": "訂閱人數已達上限，請稍後再試"}), 503
+    return response
@@ -0,0 +1,5 @@
+""" 正式環境入口：gunicorn -c gunicorn.conf.py wsgi:app """
+from backend import app
+
+if __name__ == "__main__":
+    app.run()